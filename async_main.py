@@ -0,0 +1,329 @@
+import asyncio
+import concurrent.futures
+import inspect
+import signal
+import sqlite3
+import sys
+import threading
+import time
+import paho.mqtt.client as mqtt
+import mqtt_client
+from mqtt_client import on_message, subscription_plan
+from database import connect_db, create_sensor_table, insert_sensor_rows, sensor_row, DEFAULT_SITE_ID
+from rollups import update_rollups
+from retention import RetentionManager, enable_incremental_vacuum
+from payload_decoders import PayloadDecoderRegistry
+from mqtt_replay import MqttCapture
+from dt_config import CONFIG
+
+# Headless runtime: MQTT, storage and maintenance as tasks of one asyncio event loop, no GUI.
+# Run with `python async_main.py`; Ctrl+C or SIGTERM shuts down after draining queued readings.
+
+# Marker put on the queue to ask the storage writer to flush and exit
+_STOP = object()
+
+class AsyncMqttClient:
+    """paho-mqtt client driven by the asyncio event loop instead of paho's network thread.
+
+    The socket is watched with loop.add_reader/add_writer and loop_misc() runs once a
+    second for keepalives. Readings are decoded by mqtt_client.on_message, tagged with
+    site_id and put on `queue`; when it is full the oldest reading is dropped so the loop
+    never blocks. Subscriptions are (re)sent on every connect and lost connections are retried.
+    """
+
+    def __init__(self, broker, port, topics, queue, site_id=DEFAULT_SITE_ID, collapse_threshold=None, decoders=None,
+                 capture=None, reconnect_delay=5):
+        self.broker = broker
+        self.port = port
+        self.topics = list(topics)
+        self.site_id = site_id
+        self.filters, accept = subscription_plan(self.topics, collapse_threshold)
+        self.queue = queue
+        self.reconnect_delay = reconnect_delay
+        self.connected = False
+        self.messages = 0
+        self.dropped = 0
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._closing = False
+        self.client = mqtt.Client()
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_message = lambda client, userdata, msg: on_message(client, userdata, msg, self._enqueue,
+                                                                          site_id, accept, decoders, capture)
+        self.client.on_socket_open = self._on_socket_open
+        self.client.on_socket_close = self._on_socket_close
+        self.client.on_socket_register_write = self._on_socket_register_write
+        self.client.on_socket_unregister_write = self._on_socket_unregister_write
+
+    # Function to queue one decoded reading, called on the event loop by client.loop_read()
+    def _enqueue(self, sensor_data):
+        self.messages += 1
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(sensor_data)
+
+    def _on_connect(self, client, userdata, flags, rc, *args):
+        if rc != 0:
+            print(f"MQTT connection refused: {rc}")
+            return
+        self.connected = True
+        # One SUBSCRIBE packet for all topics
+        client.subscribe([(f, 0) for f in self.filters])
+        print(f"MQTT client for site '{self.site_id}' connected to {self.broker}:{self.port} "
+              f"({len(self.topics)} topics in {len(self.filters)} subscriptions)")
+
+    def _on_disconnect(self, client, userdata, *args):
+        self.connected = False
+        if not self._closing:
+            print(f"MQTT connection lost, reconnecting in {self.reconnect_delay} s")
+
+    # Function to run a socket watcher change on the event loop (connect() runs on an executor thread)
+    def _on_loop(self, fn, *args):
+        if threading.get_ident() == self._loop_thread:
+            fn(*args)
+        else:
+            self._loop.call_soon_threadsafe(fn, *args)
+
+    def _on_socket_open(self, client, userdata, sock):
+        self._on_loop(self._loop.add_reader, sock, client.loop_read)
+
+    def _on_socket_close(self, client, userdata, sock):
+        self._on_loop(self._loop.remove_reader, sock)
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self._on_loop(self._loop.add_writer, sock, client.loop_write)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self._on_loop(self._loop.remove_writer, sock)
+
+    # Coroutine connecting to the broker and keeping the connection alive until cancelled
+    async def run(self):
+        next_attempt = 0.0
+        while True:
+            if self.client.socket() is None and time.monotonic() >= next_attempt:
+                next_attempt = time.monotonic() + self.reconnect_delay
+                try:
+                    # connect() blocks on DNS and the TCP handshake, so run it off the loop
+                    await self._loop.run_in_executor(None, self.client.connect, self.broker, self.port, 60)
+                except OSError as e:
+                    print(f"Error connecting to MQTT broker {self.broker}:{self.port}: {e}")
+            if self.client.socket() is not None:
+                self.client.loop_misc()  # Keepalive pings and timeouts
+            await asyncio.sleep(1)
+
+    # Function to disconnect cleanly; messages already read stay queued
+    def close(self):
+        self._closing = True
+        if self.client.socket() is not None:
+            self.client.disconnect()
+            # Flush the DISCONNECT packet; the socket callbacks remove the loop watchers
+            self.client.loop_write()
+
+class AsyncStorageWriter:
+    """Writes queued readings to SQLite in batches from an asyncio task.
+
+    All database work runs on one dedicated thread (sqlite3 connections belong to the
+    thread that opens them), so the event loop never waits on disk I/O. A batch is
+    flushed at batch_size rows or when its oldest row has waited batch_age seconds.
+    A rollup update covers at most rollup_limit raw ids, in transactions of rollup_chunk_size
+    ids, so catching up a backlog doesn't hold the database thread for long.
+    """
+
+    def __init__(self, db_paths, queue, batch_size=500, batch_age=1.0, rollup_limit=100000, rollup_chunk_size=20000):
+        self.db_paths = list(db_paths)
+        self.rollup_limit = rollup_limit
+        self.rollup_chunk_size = rollup_chunk_size
+        self.queue = queue
+        self.batch_size = batch_size
+        self.batch_age = batch_age
+        self.rows_written = 0
+        self.flushes = 0
+        self.errors = 0
+        self.max_flush_ms = 0.0
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="AsyncStorageWriter")
+        self._connections = {}
+        self._key_caches = {db_path: {} for db_path in self.db_paths}
+
+    # Function to run blocking database work on the writer thread
+    async def call(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _connect(self):
+        for db_path in self.db_paths:
+            conn = connect_db(db_path)
+            conn.execute("PRAGMA journal_mode=WAL")  # Readers don't block the writer
+            conn.execute("PRAGMA synchronous=NORMAL")  # One fsync per checkpoint instead of per commit
+            create_sensor_table(conn)
+            self._connections[db_path] = conn
+
+    def _flush(self, batch):
+        start = time.perf_counter()
+        failed = False
+        for db_path, conn in self._connections.items():
+            try:
+                insert_sensor_rows(conn, batch, self._key_caches[db_path])
+            except sqlite3.Error as e:
+                failed = True
+                print(f"Error saving {len(batch)} rows to {db_path}: {e}")
+        if failed:
+            self.errors += 1
+        else:
+            self.rows_written += len(batch)
+        self.flushes += 1
+        self.max_flush_ms = max(self.max_flush_ms, (time.perf_counter() - start) * 1000)
+
+    # Function to fold new rows into the rollup tables of the given databases (run on the writer thread)
+    def update_rollups(self, db_paths):
+        for db_path in db_paths:
+            try:
+                update_rollups(self._connections[db_path], chunk_size=self.rollup_chunk_size, limit=self.rollup_limit)
+            except sqlite3.Error as e:
+                self.errors += 1
+                print(f"Error updating the rollups of {db_path}: {e}")
+
+    def _close(self):
+        for conn in self._connections.values():
+            conn.close()
+        self._connections = {}
+
+    # Coroutine writing batches until _STOP is queued; everything queued before it is written
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        await self.call(self._connect)
+        batch = []
+        deadline = None
+        stopping = False
+        try:
+            while not stopping:
+                timeout = None if deadline is None else max(deadline - loop.time(), 0)
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    item = None
+
+                if item is _STOP:
+                    stopping = True
+                elif item is not None:
+                    if not batch:
+                        deadline = loop.time() + self.batch_age
+                    batch.append(sensor_row(item))
+
+                if batch and (stopping or len(batch) >= self.batch_size or loop.time() >= deadline):
+                    await self.call(self._flush, batch)
+                    batch = []
+                    deadline = None
+        finally:
+            if batch:
+                # Cancelled with rows pending: write them before closing (shielded from the cancellation)
+                await asyncio.shield(self.call(self._flush, batch))
+
+    # Function to close the connections and the writer thread
+    async def close(self):
+        await self.call(self._close)
+        self._executor.shutdown()
+
+# Coroutine calling fn every interval seconds until cancelled; errors are reported and the next run still happens
+async def periodic(name, interval, fn, *args):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            result = fn(*args)
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            print(f"Error in periodic task {name}: {e}")
+
+# Main coroutine: runs until stop_event is set, then shuts down in order and drains the queue
+# brokers: list of {"site_id", "host", "port", "topics"} (CONFIG['brokers']); mqtt_topics: default topic list
+async def run_headless(history_db_path, brokers, mqtt_topics, stop_event=None):
+    loop = asyncio.get_running_loop()
+    if stop_event is None:
+        stop_event = asyncio.Event()
+        if sys.platform != 'win32':
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(sig, stop_event.set)
+
+    # One-time switch to incremental vacuum, before the writer holds the database
+    conn = connect_db(history_db_path)
+    create_sensor_table(conn)
+    conn.close()
+    enable_incremental_vacuum(history_db_path)
+
+    queue = asyncio.Queue(maxsize=CONFIG['ingest_queue_size'])
+    writer = AsyncStorageWriter([history_db_path], queue,
+                                batch_size=CONFIG['db_batch_size'],
+                                batch_age=CONFIG['db_batch_age'])
+    # All brokers feed the one storage queue; each reading carries its site
+    mqtt_client.print_readings = CONFIG['print_readings']
+    decoders = PayloadDecoderRegistry(CONFIG['payload_decoders'], CONFIG['payload_default_decoder'])
+    capture = MqttCapture(CONFIG['mqtt_capture_path']) if CONFIG['mqtt_capture_path'] else None
+    clients = [AsyncMqttClient(broker['host'], broker['port'], broker.get('topics', mqtt_topics), queue,
+                               broker.get('site_id', DEFAULT_SITE_ID),
+                               broker.get('collapse_threshold', CONFIG['subscribe_collapse_threshold']), decoders,
+                               capture)
+               for broker in brokers]
+    retention = RetentionManager(history_db_path, CONFIG['retention'],
+                                 interval=CONFIG['retention_interval'],
+                                 chunk_size=CONFIG['retention_chunk_size'])
+    started_at = time.monotonic()
+
+    # Function to print a one-line health report
+    def report_health():
+        elapsed = time.monotonic() - started_at
+        sites = " ".join(f"{client.site_id}(connected={client.connected} received={client.messages} "
+                         f"dropped={client.dropped})" for client in clients)
+        print(f"Health: {sites} queued={queue.qsize()} written={writer.rows_written} ({writer.rows_written / elapsed:.1f} rows/s) "
+              f"flushes={writer.flushes} max_flush_ms={writer.max_flush_ms:.1f} errors={writer.errors}")
+
+    writer_task = asyncio.create_task(writer.run(), name="storage")
+    client_tasks = [asyncio.create_task(client.run(), name=f"mqtt {client.site_id}") for client in clients]
+    maintenance_tasks = [
+        asyncio.create_task(periodic("rollups", CONFIG['rollup_interval'],
+                                     writer.call, writer.update_rollups, [history_db_path]), name="rollups"),
+        # Retention opens its own connection and deletes in short chunks, so it runs on a thread of its own
+        asyncio.create_task(periodic("retention", CONFIG['retention_interval'],
+                                     loop.run_in_executor, None, retention.run_once), name="retention"),
+        asyncio.create_task(periodic("health", CONFIG['health_interval'], report_health), name="health"),
+    ]
+    tasks = [writer_task] + client_tasks + maintenance_tasks
+
+    try:
+        # Run until asked to stop or until a task fails
+        stop_task = asyncio.create_task(stop_event.wait())
+        done, _ = await asyncio.wait(tasks + [stop_task], return_when=asyncio.FIRST_COMPLETED)
+        stop_task.cancel()
+        for task in done:
+            if task is not stop_task and task.exception() is not None:
+                print(f"Task {task.get_name()} failed: {task.exception()!r}")
+    finally:
+        print("Shutting down...")
+        # 1. Stop receiving
+        for task, client in zip(client_tasks, clients):
+            task.cancel()
+            client.close()
+        # 2. Stop the maintenance tasks (an ongoing retention run stops after its current chunk)
+        retention.stop()
+        for task in maintenance_tasks:
+            task.cancel()
+        await asyncio.gather(*client_tasks, *maintenance_tasks, return_exceptions=True)
+        if capture is not None:
+            capture.close()
+        # 3. Drain: everything already queued is written before the writer exits
+        if not writer_task.done():
+            await queue.put(_STOP)
+            await writer_task
+        await writer.call(writer.update_rollups, [history_db_path])
+        await writer.close()
+        report_health()
+        print(f"Payload decoders: {decoders.stats()}")
+
+if __name__ == '__main__':
+    if sys.platform == 'win32':
+        # add_reader/add_writer need the selector event loop on Windows
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    try:
+        asyncio.run(run_headless(CONFIG['history_db_path'], CONFIG['brokers'], CONFIG['mqtt_topics']))
+    except KeyboardInterrupt:
+        pass  # Windows: Ctrl+C interrupts the loop; the shutdown above already ran in the finally block
@@ -11,7 +11,10 @@ sys.path.append('C<path_to_your_local_cic_dt_smartlab_repository>')
 
 """
 
+guid_index.register()
+spatial_index.register()
 topics.register()
 highlight_tools.register()
 lights.register()
-actuators.register()
\ No newline at end of file
+actuators.register()
+live_coloring.register()
\ No newline at end of file
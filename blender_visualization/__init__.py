@@ -1,4 +1,8 @@
-__all__ = ["topics", 
+__all__ = ["guid_index",
+           "materials",
+           "spatial_index",
+           "topics", 
            "highlight_tools",
            "lights",
-           "actuators"]
\ No newline at end of file
+           "actuators",
+           "live_coloring"]
\ No newline at end of file
@@ -2,10 +2,12 @@ import bpy
 import paho.mqtt.client as mqtt
 import threading
 from dt_config import CONFIG
-from bonsai.bim.ifc import IfcStore
-import bonsai.tool as tool
-from mqtt_actuators import actuator_ifc_link, actuator_control, actuator_payload
+from mqtt_actuators import (actuator_ifc_link, actuator_control, actuator_control_many, close_actuator_client,
+                            get_actuator_state)
+from payload_decoders import epoch_clock
 from blender_visualization.topics import set_translucent_material
+from blender_visualization.guid_index import guid_index
+from topic_index import TopicIndex
 
 # MQTT settings from CONFIG
 MQTT_BROKER = CONFIG["mqtt_broker"]
@@ -15,22 +17,18 @@ ACTUATORS_TOPICS = list(actuator_ifc_link.keys())
 # Group MQTT topics
 actuator_keys = CONFIG["actuator_keys"]
 
-ACTUATORS_AND_TOPICS = {}
-for k in actuator_keys:
-    ACTUATORS_AND_TOPICS[k] = list(filter(lambda s: k.lower() in s.lower(), ACTUATORS_TOPICS))
+ACTUATOR_INDEX = TopicIndex(ACTUATORS_TOPICS, actuator_keys)
+ACTUATORS_AND_TOPICS = ACTUATOR_INDEX.groups
 
 # Global variable to track the selected topics
 selected_actuators = ACTUATORS_AND_TOPICS['Living room']  # Default to the Livingroom topics
 # Global variable to store the latest payload
 current_payload = ""
-# Load the IFC model opened in Blender Bonsai
-model = IfcStore.get_file()    
     
 # Function to dynamically generate topic items based on the selected group
 def get_dynamic_topic_items(self, context):
-    selected_group = context.scene.selected_actuator_group
-    group_topics = ACTUATORS_AND_TOPICS.get(selected_group, [])    
-    return [(topic, topic, "") for topic in group_topics]
+    # Cached per group: this runs on every redraw of the panel
+    return ACTUATOR_INDEX.enum_items(context.scene.selected_actuator_group)
 
 # Update function for the group selection
 def update_selected_group(self, context):
@@ -49,7 +47,7 @@ def update_selected_actuators(self, context):
 
     # Select the IfcSpace entities by the selected_actuator
     for topic in selected_actuators:
-        select_by_guid(model, topic)
+        select_by_guid(topic)
 
 
 # Custom panel for topic selection in the 3D View
@@ -78,15 +76,22 @@ class ActuatorSelectionPanel(bpy.types.Panel):
         # Button to start visualization
         layout.operator("wm.publish_payload")
 
+        # Button to send the payload to every actuator of the same kind in the group (e.g. all dimmers)
+        layout.operator("wm.publish_payload_group")
+
 class ActuatorShowPayload(bpy.types.Operator):
     bl_idname = "wm.show_current_value"
     bl_label = "Show Current Value"   
 
     def execute(self, context):        
         topic = context.scene.selected_mqtt_actuator        
-        current_value = actuator_payload(topic)
+        # Latest value from the state cache, no waiting in the UI
+        current_value, received = get_actuator_state().get(topic)
         # Display the value in a popup or a text block
-        self.report({'INFO'}, f"Current value: {current_value}")
+        if current_value is None:
+            self.report({'INFO'}, "No value received yet")
+        else:
+            self.report({'INFO'}, f"Current value: {current_value} ({(epoch_clock.now_ms() - received) / 1000:.0f} s ago)")
         return {'FINISHED'}        
 
 class ActuatorPublishPayload(bpy.types.Operator):
@@ -96,35 +101,53 @@ class ActuatorPublishPayload(bpy.types.Operator):
     def execute(self, context):
         topic = context.scene.selected_mqtt_actuator
         payload = context.scene.payload_text
+        # Returns at once; the shared connection confirms the value in the background
         actuator_control(topic, payload)
 
         return {'FINISHED'}
 
+# Function to get the actuators of a group with the same kind as a topic (e.g. all DimLight topics of the Bedroom)
+def same_kind_actuators(group, topic):
+    kind = ACTUATOR_INDEX.info[topic].kind if topic in ACTUATOR_INDEX.info else None
+    return [t for t in ACTUATORS_AND_TOPICS.get(group, []) if ACTUATOR_INDEX.info[t].kind == kind]
+
+class ActuatorPublishGroupPayload(bpy.types.Operator):
+    bl_idname = "wm.publish_payload_group"
+    bl_label = "Publish to Same Kind in Group"
+
+    def execute(self, context):
+        topics = same_kind_actuators(context.scene.selected_actuator_group, context.scene.selected_mqtt_actuator)
+        payload = context.scene.payload_text
+        # One batch on the shared connection; waits briefly for the broker's confirmations
+        missing = actuator_control_many({topic: payload for topic in topics}, timeout=1)
+        if missing:
+            self.report({'WARNING'}, f"{len(missing)} of {len(topics)} values not confirmed yet")
+        else:
+            self.report({'INFO'}, f"Value '{payload}' sent to {len(topics)} actuators")
+        return {'FINISHED'}
+
 # Add a global variable to track previously selected GUIDs
 previous_guids = []
 
-def select_by_guid(model, topic):
+def select_by_guid(topic):
     global previous_guids
-    current_guids = actuator_ifc_link[topic]
+    guids = actuator_ifc_link[topic]
+    current_guids = [guids] if isinstance(guids, str) else guids  # The CSV links one device GUID per topic
 
     # Revert the color of previously selected entities
-    for guid in previous_guids:
-        obj = tool.Ifc.get_object(model.by_guid(guid))
-        if obj:
-            set_translucent_material(obj, transparency=1)
+    for obj in guid_index.get_many(previous_guids).values():
+        set_translucent_material(obj, transparency=1)
 
     # Select and set color for the new GUIDs
     bpy.ops.object.select_all(action='DESELECT')
-    for guid in current_guids:
-        obj = tool.Ifc.get_object(model.by_guid(guid))
-        if obj:
-            # Set the object as active and selected
-            bpy.context.view_layer.objects.active = obj
-            obj.select_set(True)
-            print(f"Object with GUID {guid} selected: {obj.name}")
+    for guid, obj in guid_index.get_many(current_guids).items():
+        # Set the object as active and selected
+        bpy.context.view_layer.objects.active = obj
+        obj.select_set(True)
+        print(f"Object with GUID {guid} selected: {obj.name}")
 
-            # Change color to red with transparency
-            set_translucent_material(obj, color=[1, 0, 0, 1], transparency=1)
+        # Change color to red with transparency
+        set_translucent_material(obj, color=[1, 0, 0, 1], transparency=1)
 
     # Update previous_guids
     previous_guids = current_guids
@@ -139,7 +162,7 @@ def register():
     bpy.types.Scene.selected_actuator_group = bpy.props.EnumProperty(
         name="Actuator Groups",
         description="Select the Actuator group for topics",
-        items=[(group, group, "") for group in ACTUATORS_AND_TOPICS.keys()],
+        items=ACTUATOR_INDEX.group_items(),
         update=update_selected_group,  # Update topics when the group changes
     )
 
@@ -152,14 +175,20 @@ def register():
 
     bpy.utils.register_class(ActuatorShowPayload)
     bpy.utils.register_class(ActuatorPublishPayload)
+    bpy.utils.register_class(ActuatorPublishGroupPayload)
     bpy.utils.register_class(ActuatorSelectionPanel)
     bpy.types.Scene.payload_text = bpy.props.StringProperty()
 
+    # Subscribe to the actuator topics now, so their values are known when asked for
+    get_actuator_state()
+
 def unregister():
+    close_actuator_client()
     del bpy.types.Scene.selected_mqtt_actuator
     del bpy.types.Scene.selected_actuator_group
     bpy.utils.unregister_class(ActuatorShowPayload)
     bpy.utils.unregister_class(ActuatorPublishPayload)
+    bpy.utils.unregister_class(ActuatorPublishGroupPayload)
     bpy.utils.unregister_class(ActuatorSelectionPanel)
     bpy.types.Scene.payload_text
 
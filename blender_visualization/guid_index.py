@@ -0,0 +1,134 @@
+import bpy
+import time
+import bonsai.tool as tool
+
+class GuidIndex:
+    """IFC GlobalId -> Blender object of the loaded IFC model, shared by all panels.
+
+    Built in one pass over the scene objects on the first lookup, and rebuilt on the next
+    lookup after it is invalidated: by the handlers below when a .blend file is loaded,
+    after undo/redo, when objects are added or removed, or when another IFC model is loaded.
+    """
+
+    def __init__(self):
+        self._objects = None
+        self._model = None
+        self._object_count = -1
+
+    # Function to mark the index as stale; it is rebuilt on the next lookup
+    def invalidate(self):
+        self._objects = None
+
+    # Function to map the GUID of every scene object linked to an IFC entity to the object
+    def _build(self):
+        objects = {}
+        for obj in bpy.context.scene.objects:
+            entity = tool.Ifc.get_entity(obj)
+            if entity is not None and hasattr(entity, "GlobalId"):
+                objects[entity.GlobalId] = obj
+        self._objects = objects
+        self._model = tool.Ifc.get()
+        self._object_count = len(bpy.data.objects)
+        return objects
+
+    def _index(self):
+        if self._objects is None or tool.Ifc.get() is not self._model:
+            return self._build()
+        return self._objects
+
+    # Function to check from the depsgraph handler whether objects were added or removed
+    def check_object_count(self):
+        if self._objects is not None and len(bpy.data.objects) != self._object_count:
+            self.invalidate()
+
+    # Function to get the object of a GUID, None if the model has no object for it
+    def get(self, guid):
+        obj = self._index().get(guid)
+        if obj is None:
+            return None
+        try:
+            obj.name  # Raises ReferenceError if the object was removed since the index was built
+        except ReferenceError:
+            obj = self._build().get(guid)
+        return obj
+
+    # Function to get the objects of several GUIDs as a {guid: object} dict, without the GUIDs that have none
+    def get_many(self, guids):
+        index = self._index()
+        found = {}
+        for guid in guids:
+            obj = index.get(guid)
+            if obj is not None:
+                try:
+                    obj.name
+                except ReferenceError:
+                    index = self._build()
+                    obj = index.get(guid)
+                    if obj is None:
+                        continue
+                found[guid] = obj
+        return found
+
+    def __len__(self):
+        return len(self._index())
+
+# Index shared by the topic, actuator and light panels
+guid_index = GuidIndex()
+
+@bpy.app.handlers.persistent
+def _invalidate_handler(*args):
+    guid_index.invalidate()
+
+@bpy.app.handlers.persistent
+def _depsgraph_handler(scene, depsgraph=None):
+    guid_index.check_object_count()
+
+_HANDLERS = [
+    (bpy.app.handlers.load_post, _invalidate_handler),
+    (bpy.app.handlers.undo_post, _invalidate_handler),
+    (bpy.app.handlers.redo_post, _invalidate_handler),
+    (bpy.app.handlers.depsgraph_update_post, _depsgraph_handler),
+]
+
+# Function to time the per-GUID lookups against the index for a list of GUIDs, printing the result
+def time_lookups(guids, repeat=10):
+    model = tool.Ifc.get()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for guid in guids:
+            try:
+                tool.Ifc.get_object(model.by_guid(guid))
+            except RuntimeError:
+                pass  # GUID not in the model
+    per_guid = (time.perf_counter() - start) / repeat
+    start = time.perf_counter()
+    guid_index.invalidate()
+    size = len(guid_index)
+    build = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(repeat):
+        guid_index.get_many(guids)
+    indexed = (time.perf_counter() - start) / repeat
+    print(f"{len(guids)} GUIDs, {size} indexed objects: by_guid + get_object {per_guid * 1000:.2f} ms, "
+          f"index build {build * 1000:.2f} ms, indexed lookup {indexed * 1000:.3f} ms")
+    return {"per_guid_ms": per_guid * 1000, "build_ms": build * 1000, "indexed_ms": indexed * 1000}
+
+def register():
+    for handlers, handler in _HANDLERS:
+        if handler not in handlers:
+            handlers.append(handler)
+
+def unregister():
+    for handlers, handler in _HANDLERS:
+        if handler in handlers:
+            handlers.remove(handler)
+    guid_index.invalidate()
+
+if __name__ == "__main__":
+    # Timings for the GUIDs of the sensor and actuator links, from the Blender Python console
+    from dt_config import sensor_ifc_link
+    from mqtt_actuators import actuator_ifc_link
+    # Sensor topics link lists of GUIDs, actuator topics a single GUID string
+    all_guids = list(dict.fromkeys(guid for link in (sensor_ifc_link, actuator_ifc_link) for guids in link.values()
+                                   for guid in ([guids] if isinstance(guids, str) else guids)))
+    time_lookups(all_guids)
@@ -2,10 +2,14 @@ import bpy
 from mathutils import Vector, Matrix, Color
 from math import radians
 from bpy.props import FloatProperty, FloatVectorProperty
+from blender_visualization.materials import material_pool
+from blender_visualization.spatial_index import spatial_index
 
 # Global lists to keep track of the created objects so that we can delete them later
 created_label = []
 created_legend = []
+# Alpha of the objects made transparent (make_transparent and the isolate tool)
+TRANSPARENT_ALPHA = 0.3
 
 # Define useful functions to be used later 
 
@@ -14,9 +18,8 @@ def clear_highlight(obj):
     if obj is None:
         return
     
-    # Reset material
-    if obj.active_material:
-        obj.active_material.use_nodes = False
+    # Restore the original materials
+    material_pool.restore(obj)
     
     # Reset in-front display
     obj.show_in_front = False
@@ -31,48 +34,32 @@ def delete_objects(obj_list):
     
 # Function 3: Make selected object transparent
 def make_transparent(obj):
-    if obj.type == 'MESH':
-        # Ensure the object has a material
-        if not obj.data.materials:
-            mat = bpy.data.materials.new(name="TransparentMaterial")
-            obj.data.materials.append(mat)
-        else:
-            mat = obj.data.materials[0]
-        
-        # Set up the material
-        mat.use_nodes = True
-        nodes = mat.node_tree.nodes
-        links = mat.node_tree.links
-
-        # Clear existing nodes
-        for node in nodes:
-            nodes.remove(node)
-        
-        # Add necessary nodes
-        output_node = nodes.new(type="ShaderNodeOutputMaterial")
-        output_node.location = (400, 0)
-        
-        principled_node = nodes.new(type="ShaderNodeBsdfPrincipled")
-        principled_node.location = (0, 0)
-        principled_node.inputs["Alpha"].default_value = 0.3  # Set transparency
-        
-        # Link nodes
-        links.new(principled_node.outputs["BSDF"], output_node.inputs["Surface"])
-        
-        # Ensure the material uses alpha blending
-        mat.blend_method = 'BLEND'
-        mat.shadow_method = 'HASHED'
+    # Pooled alpha-blended material; the object's own materials are restored by clear_highlight
+    material_pool.apply(obj, 'transparent', alpha=TRANSPARENT_ALPHA)
         
-# Function 4: Check if an object is within a bounding box
+# Function 4: Check if an object's world space bounding box overlaps a bounding box
 def is_within_bounding_box(bbox, obj):
-    # Get the world space bounding box of the other object
     obj_bbox = [obj.matrix_world @ Vector(corner) for corner in obj.bound_box]
-    for corner in obj_bbox:
-        if (bbox['min_x'] <= corner.x <= bbox['max_x'] or
-            bbox['min_y'] <= corner.y <= bbox['max_y'] or
-            bbox['min_z'] <= corner.z <= bbox['max_z']):
-            return False  # At least one corner is inside the bounding box
-    return True  # All corners are outside
+    return (min(v.x for v in obj_bbox) <= bbox['max_x'] and max(v.x for v in obj_bbox) >= bbox['min_x'] and
+            min(v.y for v in obj_bbox) <= bbox['max_y'] and max(v.y for v in obj_bbox) >= bbox['min_y'] and
+            min(v.z for v in obj_bbox) <= bbox['max_z'] and max(v.z for v in obj_bbox) >= bbox['min_z'])
+
+# Function 5: Interpolate the color of a value between the min and max colors of the color legend
+def interpolate_color(value, min_val, max_val, min_color, max_color):
+    min_color = Color(min_color[:3])  # Convert to Color type
+    max_color = Color(max_color[:3])  # Convert to Color type
+    if value < min_val:
+        return min_color
+    elif value > max_val:
+        return max_color
+    elif max_val == min_val:
+        return min_color  # Empty legend range: nothing to interpolate
+    t = (value - min_val) / (max_val - min_val)
+    return Color((
+        (1 - t) * min_color.r + t * max_color.r,
+        (1 - t) * min_color.g + t * max_color.g,
+        (1 - t) * min_color.b + t * max_color.b
+    ))
 
 # Define highlight methods
 
@@ -88,26 +75,8 @@ class OBJECT_OT_HighlightGlow(bpy.types.Operator):
             self.report({'WARNING'}, "No object selected.")
             return {'CANCELLED'}
         
-        # Define material
-        mat = bpy.data.materials.new(name="GlowMaterial")
-        mat.use_nodes = True
-        nodes = mat.node_tree.nodes
-        links = mat.node_tree.links
-
-        # Create emission shader
-        for node in nodes:
-            nodes.remove(node)
-        emission_node = nodes.new(type="ShaderNodeEmission")
-        output_node = nodes.new(type="ShaderNodeOutputMaterial")
-        links.new(emission_node.outputs[0], output_node.inputs[0])
-        
-        # Set material properties
-        emission_node.inputs[0].default_value = (1.0, 1.0, 0.0, 1.0)  # Yellow
-        emission_node.inputs[1].default_value = 10  # Intensity
-        
-        # Apply created material
-        obj.data.materials.clear()
-        obj.data.materials.append(mat)
+        # Apply the pooled yellow emission material
+        material_pool.apply(obj, 'glow', (1.0, 1.0, 0.0, 1.0))
 
         self.report({'INFO'}, "Glow effect applied.")
         return {'FINISHED'}
@@ -124,45 +93,9 @@ class OBJECT_OT_HighlightPulse(bpy.types.Operator):
             self.report({'WARNING'}, "No object selected.")
             return {'CANCELLED'}
 
-        # Create a material with pulsing animation
-        mat = bpy.data.materials.new(name="PulseMaterial")
-        mat.use_nodes = True
-        nodes = mat.node_tree.nodes
-        links = mat.node_tree.links
+        # Apply the pooled cyan emission material; its strength is animated in a loop
+        material_pool.apply(obj, 'pulse', (0.0, 1.0, 1.0, 1.0))
 
-        # Create emission shader
-        for node in nodes:
-            nodes.remove(node)
-        emission_node = nodes.new(type="ShaderNodeEmission")
-        output_node = nodes.new(type="ShaderNodeOutputMaterial")
-        math_node = nodes.new(type="ShaderNodeMath")
-        math_node.operation = 'MULTIPLY'
-        links.new(emission_node.outputs[0], output_node.inputs[0])
-        links.new(math_node.outputs[0], emission_node.inputs[1])
-
-        # Set node properties
-        emission_node.inputs[0].default_value = (0.0, 1.0, 1.0, 1.0)  # Cyan
-        math_node.inputs[1].default_value = 5.0
-
-        # Apply created material
-        obj.data.materials.clear()
-        obj.data.materials.append(mat)
-
-        # Animate pulsing
-        frame_start = bpy.context.scene.frame_current
-        math_node.inputs[0].default_value = 0.0
-        math_node.inputs[0].keyframe_insert(data_path="default_value", frame=frame_start)
-        math_node.inputs[0].default_value = 1.0
-        math_node.inputs[0].keyframe_insert(data_path="default_value", frame=frame_start + 25)
-        math_node.inputs[0].default_value = 0.0
-        math_node.inputs[0].keyframe_insert(data_path="default_value", frame=frame_start + 50)
-
-        # Add Cycles modifier to loop animation
-        action = math_node.id_data.animation_data.action
-        fcurve = action.fcurves.find("nodes[\"Math\"].inputs[0].default_value")
-        if fcurve:
-            fcurve.modifiers.new(type='CYCLES')
-        
         # Start animation. It will be stopped later if the highlight effect is disabled
         if not bpy.context.screen.is_animation_playing:
             bpy.ops.screen.animation_play()
@@ -274,38 +207,28 @@ class OBJECT_OT_Isolate(bpy.types.Operator):
         # Get all selected objects
         selected_objects = bpy.context.selected_objects
         if not selected_objects:
-            print("No objects selected!")
-            return
-        
-        # Compute bounding boxes for all selected objects
-        bounding_boxes = []
-        for obj in selected_objects:
-            # Calculate the world space bounding box
-            bbox_corners = [obj.matrix_world @ Vector(corner) for corner in obj.bound_box]
-            bbox = {
-                'min_x': min([v.x for v in bbox_corners]),
-                'max_x': max([v.x for v in bbox_corners]),
-                'min_y': min([v.y for v in bbox_corners]),
-                'max_y': max([v.y for v in bbox_corners]),
-                'min_z': min([v.z for v in bbox_corners]),
-                'max_z': max([v.z for v in bbox_corners])
-            }
-            bounding_boxes.append(bbox)
-        
-        # Make all objects in the scene transparent
-        for obj in bpy.context.scene.objects:
+            self.report({'WARNING'}, "No objects selected!")
+            return {'CANCELLED'}
+
+        # World space bounding boxes of the selected objects, then one vectorized overlap test for all objects
+        mins, maxs = spatial_index.boxes_of(selected_objects)
+        inside = spatial_index.overlapping(mins, maxs)
+        selected_names = {obj.name for obj in selected_objects}
+        outside = {obj.name: obj for obj, is_inside in zip(spatial_index.objects, inside.tolist())
+                   if not is_inside and obj.name not in selected_names}
+
+        # Only touch the objects whose material changes. The pool tells which objects are transparent now,
+        # also after other tools recolored or restored some of them.
+        transparent = material_pool.key('transparent', alpha=TRANSPARENT_ALPHA)
+        made_visible = material_pool.shown_as(transparent) - outside.keys()
+        for name in made_visible:
+            clear_highlight(bpy.data.objects.get(name))
+        made_transparent = [obj for name, obj in outside.items() if material_pool.shown(name) != transparent]
+        for obj in made_transparent:
             make_transparent(obj)
+        changed = len(made_visible) + len(made_transparent)
 
-        # Unhide objects within the selected objects' bounding boxes
-        for obj in bpy.context.scene.objects:
-            for bbox in bounding_boxes:
-                if is_within_bounding_box(bbox, obj):
-                    clear_highlight(obj)
-                    break  # If one bounding box contains the object, no need to 
-                
-        # Set the visibility of the originally selected objects
-        for obj in selected_objects:
-            clear_highlight(obj) # Could be changed to something else
+        self.report({'INFO'}, f"{len(inside) - len(outside)} objects kept visible, {changed} changed")
         return {'FINISHED'}
     
 # Add a color legend for the coloring of objects
@@ -436,57 +359,11 @@ class OBJECT_OT_Color(bpy.types.Operator):
             self.report({'WARNING'}, "No object selected.")
             return {'CANCELLED'}
         
-        # Get color range
-        min_color = Color(min_color[:3])  # Convert to Color type
-        max_color = Color(max_color[:3])  # Convert to Color type
-        
-        # Determine color based on input value
-        if input_val < min_val:
-            result_color = min_color
-        elif input_val > max_val:
-            result_color = max_color
-        else:
-            # Interpolate between min_color and max_color
-            t = (input_val - min_val) / (max_val - min_val)
-            result_color = Color((
-                (1 - t) * min_color.r + t * max_color.r,
-                (1 - t) * min_color.g + t * max_color.g,
-                (1 - t) * min_color.b + t * max_color.b
-            ))
-        
-
-        # Apply the color to the active object
-        if obj and obj.type == 'MESH':  # Ensure there's an active mesh object
-            if not obj.data.materials:
-                mat = bpy.data.materials.new(name="CustomMaterial")
-                obj.data.materials.append(mat)
-            else:
-                mat = obj.data.materials[0]
-
-            # Setup material
-            mat.use_nodes = True
-            nodes = mat.node_tree.nodes
-            links = mat.node_tree.links
-
-            # Clear existing nodes
-            for node in nodes:
-                nodes.remove(node)
-
-            # Add necessary nodes
-            output_node = nodes.new(type="ShaderNodeOutputMaterial")
-            output_node.location = (400, 0)
-
-            bsdf_node = nodes.new(type="ShaderNodeBsdfPrincipled")
-            bsdf_node.location = (0, 0)
-
-            # Link nodes
-            links.new(bsdf_node.outputs["BSDF"], output_node.inputs["Surface"])
-
-            # Set color and ensure no transparency
-            bsdf_node.inputs["Base Color"].default_value = (result_color.r, result_color.g, result_color.b, 1.0)
-            bsdf_node.inputs["Alpha"].default_value = 1.0
-            mat.blend_method = 'OPAQUE'
-            mat.shadow_method = 'OPAQUE'
+        # Determine color based on input value, interpolated between min_color and max_color
+        result_color = interpolate_color(input_val, min_val, max_val, min_color, max_color)
+
+        # Apply the color to the active mesh object with a pooled opaque material
+        material_pool.apply(obj, 'opaque', (result_color.r, result_color.g, result_color.b, 1.0))
             
         self.report({'INFO'}, "Selected object's color adjusted")
         return {'FINISHED'}
@@ -1,5 +1,6 @@
 import bpy
 import bonsai.tool as tool
+from blender_visualization.guid_index import guid_index
 
 # Define UI properties for controlling lights
 class LightProperties(bpy.types.PropertyGroup):
@@ -173,31 +174,19 @@ class OBJECT_OT_AddLightsFromIfc(bpy.types.Operator):
         # Delete any previously created lights
         delete_lights_starting_with("TempLight_")
         
-        # Create a light in blender for each listed IFC light object
-        for guid in light_guids:
-        
-            # Search for objects named "IfcLightFixture"
-            for obj in scene.objects:
-                ifc_element = tool.Ifc.get_entity(obj)
-                
-                # Check if the IFC element exists
-                if ifc_element is None:
-                    continue  # Skip objects with no IFC entity
-                
-                # Check that the GlobalId in Blender matches with the GUID of the object in IFC
-                global_id = ifc_element.GlobalId
-                if global_id == guid:
-
-                    # Create a light at the object's location
-                    light_data = bpy.data.lights.new(name=f"TempLight_{guid}", type='POINT')
-                    light_data.energy = 100  # Set power to 100 W
-                    light_data.color = (1.0, 0.8, 0.6)  # Warm hue (soft orange)
-
-                    # Create the light object and position it
-                    light_obj = bpy.data.objects.new(name=f"TempLight_{guid}", object_data=light_data)
-                    light_obj.location = obj.location
-                    light_obj.location.z -= 0.2 # Offset in Z direction
-                    scene.collection.objects.link(light_obj)
+        # Create a light in blender for each listed IFC light object found in the model
+        for guid, obj in guid_index.get_many(light_guids).items():
+
+            # Create a light at the object's location
+            light_data = bpy.data.lights.new(name=f"TempLight_{guid}", type='POINT')
+            light_data.energy = 100  # Set power to 100 W
+            light_data.color = (1.0, 0.8, 0.6)  # Warm hue (soft orange)
+
+            # Create the light object and position it
+            light_obj = bpy.data.objects.new(name=f"TempLight_{guid}", object_data=light_data)
+            light_obj.location = obj.location
+            light_obj.location.z -= 0.2 # Offset in Z direction
+            scene.collection.objects.link(light_obj)
 
         self.report({'INFO'}, "Lights added!")
         return {'FINISHED'}
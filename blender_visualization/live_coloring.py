@@ -0,0 +1,260 @@
+import bpy
+import time
+import numpy as np
+from dt_config import CONFIG, THRESHOLDS, sensor_ifc_link
+from live_data_shm import LiveDataReader
+from sensor_status import sensor_kind, status_style
+from blender_visualization.guid_index import guid_index
+from blender_visualization.materials import material_pool
+from blender_visualization.highlight_tools import interpolate_color
+
+# RGB of the status color names of sensor_status.STATUS_STYLES (CSS values, 0-255 sRGB)
+STATUS_COLORS_SRGB = {
+    'lightgreen': (144, 238, 144),
+    'lightyellow': (255, 255, 224),
+    'lightcoral': (240, 128, 128),
+    'lightblue': (173, 216, 230),
+    'lightsalmon': (255, 160, 122),
+    'white': (255, 255, 255),
+}
+SPACE_ALPHA = 0.8  # Same translucency as topics.set_translucent_material
+RETRY_INTERVAL = 2.0  # Seconds between attempts to attach to the segment while main.py is not running
+STALE_AFTER = 10.0  # Seconds without new readings before attaching again (main.py may have been restarted)
+
+# Function to convert an sRGB channel (0-1) to the linear values used by Blender colors
+def _srgb_to_linear(c):
+    return c / 12.92 if c <= 0.04045 else ((c + 0.055) / 1.055) ** 2.4
+
+STATUS_COLORS = {name: tuple(_srgb_to_linear(c / 255) for c in rgb) + (1.0,) for name, rgb in STATUS_COLORS_SRGB.items()}
+
+class LiveColoring:
+    """Colors the IFC spaces linked to sensor topics from the latest readings of main.py.
+
+    tick() runs from bpy.app.timers and never blocks the UI: the live data segment is read
+    without locks, nothing is computed while its sequence counter is unchanged, and only the
+    objects whose color changed are recolored, for at most budget_ms per tick. The remaining
+    objects are recolored on the following ticks. Spaces that lose their color (another sensor
+    kind was chosen) get their own materials back, and spaces restored or highlighted by the
+    other tools in the meantime are colored again from the next snapshot.
+    """
+
+    def __init__(self, shm_name, interval=0.5, budget_ms=8):
+        self.shm_name = shm_name
+        self.interval = interval
+        self.budget = budget_ms / 1000
+        self.reader = None
+        self.running = False
+        self.pending = {}  # guid -> (color, pool key) still to apply, (None, None) to restore
+        self.applied = {}  # guid -> (pool key, object name) shown now
+        self.recolored = 0
+        self._last_seq = None
+        self._last_change = 0.0
+        self._next_attach = 0.0
+        self._timer = self.tick  # Same bound method object for register and unregister
+
+    # Function to start the timer; returns False while there is no segment to read (main.py not running yet)
+    def start(self):
+        if not self.running:
+            self.running = True
+            self.invalidate()
+            self._attach(time.perf_counter())
+            bpy.app.timers.register(self._timer, first_interval=0)
+        return self.reader is not None
+
+    # Function to stop the updates; restore puts the original materials back on the colored objects
+    def stop(self, restore=True):
+        self.running = False
+        if bpy.app.timers.is_registered(self._timer):
+            bpy.app.timers.unregister(self._timer)
+        if restore:
+            self._drop_overridden()
+            for obj in guid_index.get_many(self.applied).values():
+                material_pool.restore(obj)
+        self.applied.clear()
+        self.pending.clear()
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+
+    # Function to recompute every color on the next tick (after a change of the coloring settings)
+    def invalidate(self):
+        self._last_seq = None
+
+    # Function to forget the spaces whose material was restored or replaced by another tool; returns True if any was
+    def _drop_overridden(self):
+        overridden = [guid for guid, (key, name) in self.applied.items() if material_pool.shown(name) != key]
+        for guid in overridden:
+            del self.applied[guid]
+        return bool(overridden)
+
+    def _attach(self, now):
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+        self._next_attach = now + RETRY_INTERVAL
+        try:
+            self.reader = LiveDataReader(self.shm_name)
+        except (FileNotFoundError, ValueError):
+            return False
+        self._last_seq = None
+        self._last_change = now
+        return True
+
+    # Function to get the color of every linked space from a latest_all() snapshot; the newest reading wins
+    def target_colors(self, snapshot, scene):
+        mode = scene.live_coloring_mode
+        kind = scene.live_coloring_kind
+        targets = {}
+        newest = {}
+        for topic, ts, value, level in zip(snapshot['topics'], snapshot['ts'].tolist(), snapshot['value'].tolist(),
+                                           snapshot['status'].tolist()):
+            if ts <= 0 or np.isnan(value) or sensor_kind(topic) != kind:
+                continue  # No reading yet, or another sensor kind
+            if mode == 'status':
+                color = STATUS_COLORS[status_style(topic, level)[1]]
+            else:
+                rgb = interpolate_color(value, scene.color_legend_min, scene.color_legend_max,
+                                        scene.color_legend_min_color, scene.color_legend_max_color)
+                color = (rgb.r, rgb.g, rgb.b, 1.0)
+            for guid in sensor_ifc_link.get(topic, ()):
+                if ts >= newest.get(guid, 0):
+                    newest[guid] = ts
+                    targets[guid] = color
+        return targets
+
+    def tick(self):
+        if not self.running:
+            return None
+        try:
+            return self._update()
+        except Exception as e:
+            # The error would unregister the timer while the panel still shows the coloring as running
+            print(f"Live coloring stopped after an error: {e}")
+            self.running = False
+            self.pending.clear()
+            return None
+
+    # Function to read the segment and recolor the spaces; returns the seconds until the next tick
+    def _update(self):
+        now = time.perf_counter()
+        stale = self.reader is not None and now - self._last_change > STALE_AFTER
+        if (self.reader is None or stale) and now >= self._next_attach:
+            self._attach(now)  # Not created yet, or maybe recreated by a restarted main.py
+
+        if self._drop_overridden():
+            self._last_seq = None  # Color them again from the current snapshot
+
+        if self.reader is not None:
+            seq = self.reader.sequence()
+            if seq != self._last_seq:
+                self._last_seq = seq
+                self._last_change = now
+                targets = self.target_colors(self.reader.latest_all(), bpy.context.scene)
+                self.pending = {guid: (None, None) for guid in self.applied if guid not in targets}  # Restore
+                for guid, color in targets.items():
+                    key = material_pool.key('translucent', color, SPACE_ALPHA)
+                    if self.applied.get(guid, (None,))[0] != key:
+                        self.pending[guid] = (color, key)
+
+        # Recolor within the time budget; what is left waits for the next tick
+        if self.pending:
+            deadline = now + self.budget
+            objects = guid_index.get_many(self.pending)
+            for guid in list(self.pending):
+                color, key = self.pending.pop(guid)
+                obj = objects.get(guid)
+                if key is None:
+                    if self.applied.pop(guid, None) is not None and obj is not None:
+                        material_pool.restore(obj)  # Still showing the live color
+                elif obj is not None and material_pool.apply(obj, 'translucent', color, SPACE_ALPHA):
+                    self.applied[guid] = (key, obj.name)
+                    self.recolored += 1
+                if time.perf_counter() >= deadline:
+                    break
+        if self.pending:
+            return 0.01
+        return self.interval if self.reader is not None else RETRY_INTERVAL
+
+# Coloring shared by the operators and the panel
+live_coloring = LiveColoring(CONFIG['live_data_shm_name'], CONFIG['live_coloring_interval'],
+                             CONFIG['live_coloring_budget_ms'])
+
+# Update function for the coloring settings
+def update_coloring_settings(self, context):
+    live_coloring.invalidate()
+
+# Operator to start coloring the spaces from the live data of main.py
+class WM_OT_StartLiveColoring(bpy.types.Operator):
+    """Color the linked IFC spaces from the latest sensor readings"""
+    bl_idname = "wm.start_live_coloring"
+    bl_label = "Start Live Coloring"
+
+    def execute(self, context):
+        if not live_coloring.start():
+            self.report({'WARNING'}, "No live data yet: start main.py, the coloring begins when it runs")
+        else:
+            self.report({'INFO'}, "Live coloring started")
+        return {'FINISHED'}
+
+# Operator to stop the live coloring and restore the original materials
+class WM_OT_StopLiveColoring(bpy.types.Operator):
+    """Stop the live coloring and restore the original materials"""
+    bl_idname = "wm.stop_live_coloring"
+    bl_label = "Stop Live Coloring"
+
+    def execute(self, context):
+        live_coloring.stop()
+        self.report({'INFO'}, "Live coloring stopped")
+        return {'FINISHED'}
+
+# Custom panel for the live coloring in the 3D View
+class LiveColoringPanel(bpy.types.Panel):
+    bl_label = "Live Coloring"
+    bl_idname = "VIEW3D_PT_live_coloring"
+    bl_space_type = 'VIEW_3D'
+    bl_region_type = 'UI'
+    bl_category = 'MQTT Visualization'
+
+    def draw(self, context):
+        layout = self.layout
+        layout.prop(context.scene, "live_coloring_kind", text="Sensor")
+        layout.prop(context.scene, "live_coloring_mode", text="Colors")
+        if live_coloring.running:
+            layout.operator("wm.stop_live_coloring")
+            layout.label(text=f"{len(live_coloring.applied)} spaces colored" if live_coloring.reader is not None
+                         else "Waiting for main.py")
+        else:
+            layout.operator("wm.start_live_coloring")
+
+classes = [
+    WM_OT_StartLiveColoring,
+    WM_OT_StopLiveColoring,
+    LiveColoringPanel
+]
+
+def register():
+    bpy.types.Scene.live_coloring_mode = bpy.props.EnumProperty(
+        name="Live Coloring Colors",
+        description="Color the spaces by status or by the color legend gradient",
+        items=[('status', "Status", "Status colors of the THRESHOLDS"),
+               ('gradient', "Gradient", "Color legend gradient of the visualization tools")],
+        update=update_coloring_settings,
+    )
+    bpy.types.Scene.live_coloring_kind = bpy.props.EnumProperty(
+        name="Live Coloring Sensor",
+        description="Sensor kind whose readings color the spaces",
+        items=[(kind, kind.capitalize(), "") for kind in THRESHOLDS],
+        update=update_coloring_settings,
+    )
+    for cls in classes:
+        bpy.utils.register_class(cls)
+
+def unregister():
+    live_coloring.stop()
+    for cls in reversed(classes):
+        bpy.utils.unregister_class(cls)
+    del bpy.types.Scene.live_coloring_mode
+    del bpy.types.Scene.live_coloring_kind
+
+if __name__ == "__main__":
+    register()
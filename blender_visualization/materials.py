@@ -0,0 +1,224 @@
+import bpy
+
+# Colors and alphas are quantized before the pool lookup, so close values share a material
+COLOR_LEVELS = 32  # Steps per RGB channel
+ALPHA_LEVELS = 21  # Steps of 0.05
+DEFAULT_COLOR = (0.8, 0.8, 0.8, 1.0)
+
+# Function to quantize a value in [0, 1] to one of `levels` steps
+def _quantize(value, levels):
+    return round(min(max(float(value), 0.0), 1.0) * (levels - 1)) / (levels - 1)
+
+# Material builders per style: each one sets up the node tree of a new pooled material once.
+# 'translucent' mixes a transparent and a diffuse shader (alpha is the diffuse share), 'transparent'
+# and 'opaque' use a principled shader, 'glow' an emission and 'pulse' an emission with an animated strength.
+
+def _build_translucent(mat, color, alpha):
+    nodes, links = mat.node_tree.nodes, mat.node_tree.links
+    output_node = nodes.new(type="ShaderNodeOutputMaterial")
+    output_node.location = (300, 0)
+    mix_shader = nodes.new(type="ShaderNodeMixShader")
+    mix_shader.location = (100, 0)
+    transparent_node = nodes.new(type="ShaderNodeBsdfTransparent")
+    transparent_node.location = (-200, 100)
+    diffuse_node = nodes.new(type="ShaderNodeBsdfDiffuse")
+    diffuse_node.location = (-200, -100)
+    diffuse_node.inputs['Color'].default_value = color
+    links.new(transparent_node.outputs[0], mix_shader.inputs[1])
+    links.new(diffuse_node.outputs[0], mix_shader.inputs[2])
+    links.new(mix_shader.outputs[0], output_node.inputs[0])
+    mix_shader.inputs[0].default_value = 1.0 - alpha
+
+def _build_principled(mat, color, alpha):
+    nodes, links = mat.node_tree.nodes, mat.node_tree.links
+    output_node = nodes.new(type="ShaderNodeOutputMaterial")
+    output_node.location = (400, 0)
+    bsdf_node = nodes.new(type="ShaderNodeBsdfPrincipled")
+    bsdf_node.location = (0, 0)
+    bsdf_node.inputs["Base Color"].default_value = color
+    bsdf_node.inputs["Alpha"].default_value = alpha
+    links.new(bsdf_node.outputs["BSDF"], output_node.inputs["Surface"])
+    mat.blend_method = 'BLEND' if alpha < 1.0 else 'OPAQUE'
+    if hasattr(mat, 'shadow_method'):  # Removed in Blender 4.2
+        mat.shadow_method = 'HASHED' if alpha < 1.0 else 'OPAQUE'
+
+def _build_glow(mat, color, alpha):
+    nodes, links = mat.node_tree.nodes, mat.node_tree.links
+    emission_node = nodes.new(type="ShaderNodeEmission")
+    output_node = nodes.new(type="ShaderNodeOutputMaterial")
+    links.new(emission_node.outputs[0], output_node.inputs[0])
+    emission_node.inputs[0].default_value = color
+    emission_node.inputs[1].default_value = 10  # Intensity
+
+def _build_pulse(mat, color, alpha):
+    nodes, links = mat.node_tree.nodes, mat.node_tree.links
+    emission_node = nodes.new(type="ShaderNodeEmission")
+    output_node = nodes.new(type="ShaderNodeOutputMaterial")
+    math_node = nodes.new(type="ShaderNodeMath")
+    math_node.operation = 'MULTIPLY'
+    links.new(emission_node.outputs[0], output_node.inputs[0])
+    links.new(math_node.outputs[0], emission_node.inputs[1])
+    emission_node.inputs[0].default_value = color
+    math_node.inputs[1].default_value = 5.0
+
+    # Pulse over 50 frames, looped by a Cycles modifier
+    strength = math_node.inputs[0]
+    for frame, value in ((0, 0.0), (25, 1.0), (50, 0.0)):
+        strength.default_value = value
+        strength.keyframe_insert(data_path="default_value", frame=frame)
+    fcurve = mat.node_tree.animation_data.action.fcurves.find(f'nodes["{math_node.name}"].inputs[0].default_value')
+    if fcurve:
+        fcurve.modifiers.new(type='CYCLES')
+
+STYLES = {
+    'translucent': _build_translucent,
+    'transparent': _build_principled,
+    'opaque': _build_principled,
+    'glow': _build_glow,
+    'pulse': _build_pulse,
+}
+
+class MaterialPool:
+    """Pre-built highlight materials keyed by (style, quantized color, alpha), shared by all objects.
+
+    Highlighting an object links its material slots to the object and points them to a pooled
+    material, so the IFC materials of the mesh are never modified. Recoloring only swaps the
+    slot material (nothing is done if it is already the right one) and never rebuilds a node
+    tree, which avoids the shader recompilation. restore() puts the original slots back exactly.
+    A mesh without slots (possibly shared by several objects) gets one empty slot while any of
+    its objects is highlighted; it is removed when the last of them is restored.
+    """
+
+    def __init__(self):
+        self._materials = {}  # key -> material
+        self._originals = {}  # object name -> [(slot link, object-linked material name)]
+        self._added_slots = {}  # mesh name -> names of the highlighted objects using the slot added to it
+        self._shown = {}  # object name -> key of the pooled material it shows
+
+    # Function to get the pool key of a style, color and alpha
+    def key(self, style, color=None, alpha=1.0):
+        if style not in STYLES:
+            raise ValueError(f"Unknown material style '{style}', expected one of {list(STYLES)}")
+        color = DEFAULT_COLOR if color is None else tuple(color)
+        rgb = tuple(_quantize(c, COLOR_LEVELS) for c in color[:3])
+        return style, rgb, _quantize(alpha, ALPHA_LEVELS)
+
+    # Function to get the pooled material of a style, color and alpha, building it on first use
+    def material(self, style, color=None, alpha=1.0):
+        key = self.key(style, color, alpha)
+        mat = self._materials.get(key)
+        if mat is not None:
+            try:
+                mat.name
+                return mat
+            except ReferenceError:
+                pass  # Removed, or invalidated by undo or a file load
+        style, rgb, alpha = key
+        name = f"DT_{style}_{'_'.join(f'{round(c * 255):02x}' for c in rgb)}_{round(alpha * 100)}"
+        mat = bpy.data.materials.get(name)
+        if mat is None:
+            mat = bpy.data.materials.new(name=name)
+            mat.use_nodes = True
+            mat.node_tree.nodes.clear()
+            STYLES[style](mat, (*rgb, 1.0), alpha)
+        self._materials[key] = mat
+        return mat
+
+    # Function to show an object with a pooled material; returns False for objects without material slots support
+    def apply(self, obj, style, color=None, alpha=1.0):
+        if obj is None or obj.type != 'MESH':
+            return False
+        key = self.key(style, color, alpha)
+        mat = self.material(style, color, alpha)
+        slots = obj.material_slots
+        if obj.name not in self._originals:
+            mesh = obj.data
+            if not slots:
+                mesh.materials.append(None)  # Objects can only have as many slots as their mesh
+                self._added_slots[mesh.name] = set()
+            if mesh.name in self._added_slots:
+                self._added_slots[mesh.name].add(obj.name)
+            original = []
+            for slot in slots:
+                link = slot.link
+                slot.link = 'OBJECT'  # The slot's own material is only readable when linked to the object
+                original.append((link, slot.material.name if slot.material else None))
+            self._originals[obj.name] = original
+        for slot in slots:
+            if slot.link != 'OBJECT':
+                slot.link = 'OBJECT'
+            if slot.material != mat:
+                slot.material = mat
+        self._shown[obj.name] = key
+        return True
+
+    # Function to show several objects with the same pooled material
+    def apply_many(self, objects, style, color=None, alpha=1.0):
+        return sum(self.apply(obj, style, color, alpha) for obj in objects)
+
+    # Function to check whether an object currently shows a pooled material
+    def is_applied(self, obj):
+        return obj is not None and obj.name in self._originals
+
+    # Function to get the key of the pooled material an object shows, None when it shows its own materials
+    def shown(self, name):
+        return self._shown.get(name)
+
+    # Function to get the names of the objects showing the pooled material of a key
+    def shown_as(self, key):
+        return {name for name, shown in self._shown.items() if shown == key}
+
+    # Function to put back the original material slots of an object
+    def restore(self, obj):
+        if obj is None:
+            return False
+        self._shown.pop(obj.name, None)
+        slots = self._originals.pop(obj.name, None)
+        if slots is None:
+            return False
+        for slot, (link, name) in zip(obj.material_slots, slots):
+            slot.material = bpy.data.materials.get(name) if name else None  # Object-linked material
+            slot.link = link
+        self._release_slot(obj.data.name, obj.name)
+        return True
+
+    # Function to remove the slot added to a mesh once none of its highlighted objects uses it
+    def _release_slot(self, mesh_name, obj_name):
+        users = self._added_slots.get(mesh_name)
+        if users is None:
+            return
+        users.discard(obj_name)
+        if not users:
+            del self._added_slots[mesh_name]
+            mesh = bpy.data.meshes.get(mesh_name)
+            if mesh is not None:
+                mesh.materials.pop()
+
+    # Function to restore every highlighted object that still exists
+    def restore_all(self):
+        for name in list(self._originals):
+            obj = bpy.data.objects.get(name)
+            if obj is None:
+                self._originals.pop(name)
+                self._shown.pop(name, None)
+                for mesh_name, users in list(self._added_slots.items()):
+                    if name in users:
+                        self._release_slot(mesh_name, name)
+            else:
+                self.restore(obj)
+
+    # Function to remove the pooled materials that no object uses any more
+    def purge_unused(self):
+        for key, mat in list(self._materials.items()):
+            try:
+                unused = mat.users == 0
+            except ReferenceError:
+                unused = True  # Already removed
+            else:
+                if unused:
+                    bpy.data.materials.remove(mat)
+            if unused:
+                del self._materials[key]
+
+# Pool shared by the topic, actuator and highlight panels
+material_pool = MaterialPool()
@@ -0,0 +1,118 @@
+import bpy
+import numpy as np
+
+# Function to get the world-space AABBs of objects as (mins, maxs) arrays of shape (n, 3)
+def world_boxes(objects):
+    if not objects:
+        return np.empty((0, 3)), np.empty((0, 3))
+    corners = np.array([obj.bound_box for obj in objects], dtype=np.float64)  # (n, 8, 3) local corners
+    matrices = np.array([obj.matrix_world for obj in objects], dtype=np.float64)  # (n, 4, 4)
+    world = np.einsum('nij,nkj->nki', matrices[:, :3, :3], corners) + matrices[:, None, :3, 3]
+    return world.min(axis=1), world.max(axis=1)
+
+class SpatialIndex:
+    """World-space axis-aligned bounding boxes of the scene's mesh objects, for vectorized overlap queries.
+
+    The boxes are kept in NumPy arrays, one row per object. The depsgraph handler below only
+    records the names of the objects that moved or changed geometry; their rows are recomputed
+    on the next query. The whole index is rebuilt when objects are added or removed, after
+    undo/redo and when a .blend file is loaded.
+    """
+
+    def __init__(self):
+        self.objects = []
+        self.rows = {}  # object name -> row
+        self.mins = np.empty((0, 3))
+        self.maxs = np.empty((0, 3))
+        self._dirty = set()
+        self._stale = True
+        self._object_count = -1
+
+    # Function to mark the index as stale; it is rebuilt on the next query
+    def invalidate(self):
+        self._stale = True
+
+    # Function to record the objects to recompute (called from the depsgraph handler)
+    def mark_dirty(self, names):
+        self._dirty.update(names)
+
+    # Function to check from the depsgraph handler whether objects were added or removed
+    def check_object_count(self):
+        if not self._stale and len(bpy.data.objects) != self._object_count:
+            self.invalidate()
+
+    def _build(self):
+        self.objects = [obj for obj in bpy.context.scene.objects if obj.type == 'MESH']
+        self.rows = {obj.name: i for i, obj in enumerate(self.objects)}
+        self.mins, self.maxs = world_boxes(self.objects)
+        self._dirty.clear()
+        self._stale = False
+        self._object_count = len(bpy.data.objects)
+
+    # Function to bring the boxes up to date: a full build when stale, else only the changed rows
+    def refresh(self):
+        if self._stale:
+            self._build()
+            return len(self.objects)
+        dirty = [self.rows[name] for name in self._dirty if name in self.rows]
+        self._dirty.clear()
+        if not dirty:
+            return 0
+        try:
+            objects = [self.objects[i] for i in dirty]
+            self.mins[dirty], self.maxs[dirty] = world_boxes(objects)
+        except ReferenceError:
+            self._build()  # An indexed object was removed
+            return len(self.objects)
+        return len(dirty)
+
+    # Function to get the boxes of some objects, from the index when they are in it
+    def boxes_of(self, objects):
+        self.refresh()
+        rows = [self.rows.get(obj.name) for obj in objects]
+        missing = [obj for obj, row in zip(objects, rows) if row is None]
+        mins, maxs = world_boxes(missing)
+        indexed = [row for row in rows if row is not None]
+        return np.concatenate([self.mins[indexed], mins]), np.concatenate([self.maxs[indexed], maxs])
+
+    # Function to get a mask of the indexed objects whose box overlaps (or touches) any of the given boxes
+    def overlapping(self, mins, maxs):
+        self.refresh()
+        if not len(mins):
+            return np.zeros(len(self.objects), dtype=bool)
+        overlap = ((self.mins[:, None, :] <= maxs[None, :, :]) &
+                   (self.maxs[:, None, :] >= mins[None, :, :])).all(axis=2)  # (objects, boxes)
+        return overlap.any(axis=1)
+
+# Index shared by the visualization tools
+spatial_index = SpatialIndex()
+
+@bpy.app.handlers.persistent
+def _invalidate_handler(*args):
+    spatial_index.invalidate()
+
+@bpy.app.handlers.persistent
+def _depsgraph_handler(scene, depsgraph=None):
+    spatial_index.check_object_count()
+    if depsgraph is not None:
+        spatial_index.mark_dirty(update.id.name for update in depsgraph.updates
+                                 if isinstance(update.id, bpy.types.Object)
+                                 and (update.is_updated_transform or update.is_updated_geometry))
+
+_HANDLERS = [
+    (bpy.app.handlers.load_post, _invalidate_handler),
+    (bpy.app.handlers.undo_post, _invalidate_handler),
+    (bpy.app.handlers.redo_post, _invalidate_handler),
+    (bpy.app.handlers.depsgraph_update_post, _depsgraph_handler),
+]
+
+def register():
+    for handlers, handler in _HANDLERS:
+        if handler not in handlers:
+            handlers.append(handler)
+
+def unregister():
+    for handlers, handler in _HANDLERS:
+        if handler in handlers:
+            handlers.remove(handler)
+    spatial_index.invalidate()
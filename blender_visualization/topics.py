@@ -5,11 +5,14 @@ import json
 import threading
 import time
 import paho.mqtt.client as mqtt
-from dt_config import CONFIG, GROUPS_AND_TOPICS,sensor_ifc_link, local_repository
+from dt_config import CONFIG, GROUPS_AND_TOPICS, TOPIC_INDEX, sensor_ifc_link, local_repository
+from topic_channel import TopicChannelServer, write_selection
 import ifcopenshell
 from bonsai.bim.ifc import IfcStore
 import bonsai.tool as tool
 import subprocess
+from blender_visualization.guid_index import guid_index
+from blender_visualization.materials import material_pool
 
 # MQTT settings from CONFIG
 MQTT_BROKER = CONFIG['mqtt_broker']
@@ -21,6 +24,8 @@ ifc_file = CONFIG['ifc_file']
 selected_topics = GROUPS_AND_TOPICS['Livingroom']  # Default to the Livingroom topics
 # Load the IFC model opened in Blender Bonsai
 model = IfcStore.get_file()    
+# Channel pushing the selection to main.py / visualization.py (started in register)
+topic_channel = None
 
 # Function to set up MQTT and subscribe to the selected topic
 def setup_blender_mqtt():
@@ -32,11 +37,11 @@ def setup_blender_mqtt():
 
 # Function to dynamically generate topic items based on the selected group
 def get_dynamic_topic_items(self, context):
+    # Cached per group: this runs on every redraw of the panel
     selected_group = context.scene.selected_mqtt_group
-    group_topics = GROUPS_AND_TOPICS.get(selected_group, [])
     if selected_group not in ['M-bus', 'KNX']:
-        group_topics = ["all"] + group_topics  # Add 'all' option for specific groups
-    return [(topic, topic, "") for topic in group_topics]
+        return TOPIC_INDEX.enum_items(selected_group, ("all",))  # Add 'all' option for specific groups
+    return TOPIC_INDEX.enum_items(selected_group)
 
 # Update function for the group selection
 def update_selected_group(self, context):
@@ -58,11 +63,13 @@ def update_selected_topics(self, context):
 
     # Select the IfcSpace entities by the selected_topic
     for topic in selected_topics:
-        select_by_guid(model, topic)
+        select_by_guid(topic)
 
-    # Write the selected topic to the shared file
-    with open(TOPIC_FILE_PATH, "w") as f:
-        json.dump({"visual_topics": selected_topics}, f)
+    # Push the selected topics to the subscribers and write them atomically to the shared file
+    if topic_channel is not None:
+        topic_channel.publish(selected_topics)
+    else:
+        write_selection(TOPIC_FILE_PATH, selected_topics)
 
 # Operator to start the Blender visualization (runs in a background thread)
 class StartDataVisualizationOperator(bpy.types.Operator):
@@ -113,74 +120,32 @@ class TopicSelectionPanel(bpy.types.Panel):
 previous_guids = []
 
 def set_translucent_material(obj, color=None, transparency=0.2):
-    """Set the material of an object to translucent."""
-    if not obj.data.materials:
-        mat = bpy.data.materials.new(name="IfcSpaceMaterial")
-        obj.data.materials.append(mat)
-    else:
-        mat = obj.data.materials[0]
-
-    mat.use_nodes = True
-    nodes = mat.node_tree.nodes
-    links = mat.node_tree.links
-
-    # Clear existing nodes
-    for node in nodes:
-        nodes.remove(node)
-
-    # Create new nodes for transparency
-    output_node = nodes.new(type="ShaderNodeOutputMaterial")
-    output_node.location = (300, 0)
-
-    mix_shader = nodes.new(type="ShaderNodeMixShader")
-    mix_shader.location = (100, 0)
-
-    transparent_node = nodes.new(type="ShaderNodeBsdfTransparent")
-    transparent_node.location = (-200, 100)
-
-    diffuse_node = nodes.new(type="ShaderNodeBsdfDiffuse")
-    diffuse_node.location = (-200, -100)
-
-    if color:
-        diffuse_node.inputs['Color'].default_value = color  # RGBA
-    else:
-        diffuse_node.inputs['Color'].default_value = [0.8, 0.8, 0.8, 1]
-
-    links.new(transparent_node.outputs[0], mix_shader.inputs[1])
-    links.new(diffuse_node.outputs[0], mix_shader.inputs[2])
-    links.new(mix_shader.outputs[0], output_node.inputs[0])
-
-    mix_shader.inputs[0].default_value = transparency
+    """Set the material of an object to translucent (a pooled material, the IFC materials are kept)."""
+    material_pool.apply(obj, 'translucent', color, alpha=1.0 - transparency)
 
 def set_all_ifcspaces_translucent(model):
     """Set all IfcSpace entities to translucent."""
-    for entity in model.by_type("IfcSpace"):
-        obj = tool.Ifc.get_object(entity)
-        if obj:
-            set_translucent_material(obj)
+    objects = (tool.Ifc.get_object(entity) for entity in model.by_type("IfcSpace"))
+    material_pool.apply_many(objects, 'translucent', alpha=0.8)
 
-def select_by_guid(model, topic):
+def select_by_guid(topic):
     global previous_guids
     current_guids = sensor_ifc_link[topic]
 
     # Revert the color of previously selected entities
-    for guid in previous_guids:
-        obj = tool.Ifc.get_object(model.by_guid(guid))
-        if obj:
-            set_translucent_material(obj)
+    for obj in guid_index.get_many(previous_guids).values():
+        set_translucent_material(obj)
 
     # Select and set color for the new GUIDs
     bpy.ops.object.select_all(action='DESELECT')
-    for guid in current_guids:
-        obj = tool.Ifc.get_object(model.by_guid(guid))
-        if obj:
-            # Set the object as active and selected
-            bpy.context.view_layer.objects.active = obj
-            obj.select_set(True)
-            print(f"Object with GUID {guid} selected: {obj.name}")
+    for guid, obj in guid_index.get_many(current_guids).items():
+        # Set the object as active and selected
+        bpy.context.view_layer.objects.active = obj
+        obj.select_set(True)
+        print(f"Object with GUID {guid} selected: {obj.name}")
 
-            # Change color to red with transparency
-            set_translucent_material(obj, color=[1, 0, 0, 1])
+        # Change color to red with transparency
+        set_translucent_material(obj, color=[1, 0, 0, 1])
 
     # Update previous_guids
     previous_guids = current_guids
@@ -195,7 +160,7 @@ def register():
     bpy.types.Scene.selected_mqtt_group = bpy.props.EnumProperty(
         name="MQTT Groups",
         description="Select the MQTT group for topics",
-        items=[(group, group, "") for group in GROUPS_AND_TOPICS.keys()],
+        items=TOPIC_INDEX.group_items(),
         update=update_selected_group,  # Update topics when the group changes
     )
 
@@ -209,7 +174,14 @@ def register():
     bpy.utils.register_class(StartDataVisualizationOperator)
     bpy.utils.register_class(TopicSelectionPanel)
 
+    global topic_channel
+    topic_channel = TopicChannelServer(TOPIC_FILE_PATH, CONFIG['topic_channel_host'], CONFIG['topic_channel_port']).start()
+
 def unregister():
+    global topic_channel
+    if topic_channel is not None:
+        topic_channel.close()
+        topic_channel = None
     del bpy.types.Scene.selected_mqtt_topic
     del bpy.types.Scene.selected_mqtt_group
     bpy.utils.unregister_class(StartDataVisualizationOperator)
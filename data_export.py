@@ -0,0 +1,248 @@
+import argparse
+import csv
+import json
+import os
+import time
+from datetime import datetime, timezone
+import numpy as np
+from database import connect_db, create_sensor_table
+from payload_decoders import topic_matches
+
+# Bulk export of the history database to columnar files (Parquet or Feather via the optional pyarrow
+# package) or CSV. Rows are streamed in chunks from one query in insertion (id) order, so the export is a
+# single pass over sensor_data whatever the number of topics. Columnar files store site_id and sensor_id
+# dictionary-encoded, ts as a UTC millisecond timestamp and value as float64.
+#
+#   python data_export.py exports/ --partition-by-day --incremental
+#   python data_export.py exports/knx.parquet --topics "KNX/#" --start 2024-05-01 --end 2024-06-01
+#   python data_export.py local_files/sensor_data_history.csv --format csv
+
+FORMATS = ('parquet', 'feather', 'csv')
+EXTENSIONS = {'parquet': '.parquet', 'feather': '.feather', 'csv': '.csv'}
+STATE_FILE = '_export_state.json'  # Watermark of incremental exports, in the output directory
+
+# Function to import pyarrow, which only the columnar formats need
+def _import_pyarrow(fmt):
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        import pyarrow.feather
+        return pyarrow
+    except ImportError:
+        raise ImportError(f"The {fmt} export needs pyarrow (pip install pyarrow); use format 'csv' without it") from None
+
+# Function to find the sensor keys to export: all (None), or those matching site_id and the topic patterns
+def _select_keys(sensors, topics=None, site_id=None):
+    if not topics and site_id is None:
+        return None
+    return [key for key, (site, topic) in sensors.items()
+            if (site_id is None or site == site_id) and (not topics or any(topic_matches(p, topic) for p in topics))]
+
+# Function to stream the rows to export as (id, sensor_key, ts, value) chunks
+def _iter_chunks(conn, after_id, max_id, start_ms, end_ms, keys, chunk_size):
+    where = ["d.id > ?", "d.id <= ?"]
+    params = [after_id, max_id]
+    if start_ms is not None:
+        where.append("d.ts >= ?")
+        params.append(start_ms)
+    if end_ms is not None:
+        where.append("d.ts < ?")
+        params.append(end_ms)
+    if keys is not None:
+        # A temporary table keeps the statement short for thousands of selected topics
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS export_keys (sensor_key INTEGER PRIMARY KEY)")
+        conn.execute("DELETE FROM export_keys")
+        conn.executemany("INSERT INTO export_keys (sensor_key) VALUES (?)", ((key,) for key in keys))
+        where.append("d.sensor_key IN (SELECT sensor_key FROM export_keys)")
+    cursor = conn.execute(f"SELECT d.id, d.sensor_key, d.ts, d.value FROM sensor_data d "
+                          f"WHERE {' AND '.join(where)} ORDER BY d.id", params)
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield rows
+
+class _ArrowFiles:
+    """Writes chunks to Parquet or Feather files, one open writer per output file."""
+
+    def __init__(self, fmt, sensors):
+        self.pa = _import_pyarrow(fmt)
+        pa = self.pa
+        self.fmt = fmt
+        # One dictionary for every chunk: position of each sensor key in the sorted key list
+        keys = np.array(sorted(sensors), dtype=np.int64)
+        self.lookup = np.zeros(int(keys.max()) + 1 if len(keys) else 1, dtype=np.int32)
+        self.lookup[keys] = np.arange(len(keys), dtype=np.int32)
+        sites = [sensors[key][0] for key in keys]
+        site_names = list(dict.fromkeys(sites))
+        site_index = {site: i for i, site in enumerate(site_names)}
+        self.key_site = np.array([site_index[site] for site in sites], dtype=np.int32)
+        self.site_dictionary = pa.array(site_names, type=pa.string())
+        self.topic_dictionary = pa.array([sensors[key][1] for key in keys], type=pa.string())
+        self.schema = pa.schema([
+            ('site_id', pa.dictionary(pa.int32(), pa.string())),
+            ('sensor_id', pa.dictionary(pa.int32(), pa.string())),
+            ('ts', pa.timestamp('ms', tz='UTC')),
+            ('value', pa.float64()),
+        ])
+        self.writers = {}
+
+    # Function to write rows (numpy arrays of one output file) to the file at path
+    def write(self, path, sensor_keys, ts, values):
+        pa = self.pa
+        positions = self.lookup[sensor_keys]
+        batch = pa.record_batch([
+            pa.DictionaryArray.from_arrays(pa.array(self.key_site[positions]), self.site_dictionary),
+            pa.DictionaryArray.from_arrays(pa.array(positions), self.topic_dictionary),
+            pa.array(ts, type=pa.timestamp('ms', tz='UTC')),
+            pa.array(values, type=pa.float64(), from_pandas=True),  # NULL values were read as nan
+        ], schema=self.schema)
+        writer = self.writers.get(path)
+        if writer is None:
+            if self.fmt == 'parquet':
+                writer = pa.parquet.ParquetWriter(path, self.schema, compression='zstd')
+            else:
+                writer = pa.ipc.new_file(path, self.schema, options=pa.ipc.IpcWriteOptions(compression='zstd'))
+            self.writers[path] = writer
+        writer.write_batch(batch)
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+
+class _CsvFiles:
+    """Writes chunks to CSV files (site_id, sensor_id, local-time ISO timestamp, value)."""
+
+    def __init__(self, fmt, sensors):
+        self.sensors = sensors
+        self.writers = {}  # path -> (file, csv writer)
+
+    def write(self, path, sensor_keys, ts, values):
+        entry = self.writers.get(path)
+        if entry is None:
+            f = open(path, mode='w', newline='')
+            entry = self.writers[path] = (f, csv.writer(f))
+            entry[1].writerow(["site_id", "sensor_id", "timestamp", "value"])
+        sensors = self.sensors
+        entry[1].writerows(
+            sensors[key] + (datetime.fromtimestamp(t / 1000).strftime('%Y-%m-%dT%H:%M:%S'),
+                            None if np.isnan(v) else v)
+            for key, t, v in zip(sensor_keys.tolist(), ts.tolist(), values.tolist()))
+
+    def close(self):
+        for f, _ in self.writers.values():
+            f.close()
+
+# Function to read the watermark of the previous incremental export
+def read_export_state(out_dir):
+    path = os.path.join(out_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return {"last_id": 0}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def _write_export_state(out_dir, state):
+    path = os.path.join(out_dir, STATE_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+# Function to export the history database
+def export_history(db_path, out_path, fmt='parquet', start=None, end=None, topics=None, site_id=None,
+                   partition_by_day=False, incremental=False, chunk_size=100_000):
+    """Export the rows of db_path in [start, end) (epoch ms) and return a summary dict.
+
+    topics: MQTT filters or globs of the topics to export (see payload_decoders.topic_matches);
+    site_id: only this site. Without partitioning or incremental runs out_path is the output file.
+    Otherwise it is a directory: partition_by_day writes day=YYYY-MM-DD/ subdirectories (UTC days),
+    and incremental only exports the rows stored since the previous incremental run, into new
+    part-<first id> files. The watermark is saved in out_path/_export_state.json after all files
+    are written, so an interrupted run is simply repeated.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}', expected one of {FORMATS}")
+    started = time.perf_counter()
+    conn = connect_db(db_path)
+    create_sensor_table(conn)
+    as_directory = partition_by_day or incremental
+    if as_directory:
+        os.makedirs(out_path, exist_ok=True)
+    after_id = read_export_state(out_path)["last_id"] if incremental else 0
+    rows_exported = 0
+    try:
+        # One read transaction: the topic dictionary and the rows are a consistent snapshot
+        conn.execute("BEGIN")
+        sensors = {key: (site, topic) for key, site, topic in
+                   conn.execute("SELECT sensor_key, site_id, sensor_id FROM sensors")}
+        max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM sensor_data").fetchone()[0]
+        files = (_CsvFiles if fmt == 'csv' else _ArrowFiles)(fmt, sensors)
+        part_name = f"part-{after_id + 1:012d}{EXTENSIONS[fmt]}"
+        try:
+            if not as_directory:
+                # The output file is created even when no row matches
+                files.write(out_path, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0))
+            for rows in _iter_chunks(conn, after_id, max_id, start, end, _select_keys(sensors, topics, site_id),
+                                     chunk_size):
+                data = np.array(rows, dtype=np.float64)  # Ids, keys and epoch ms fit exactly; NULL becomes nan
+                sensor_keys, ts, values = data[:, 1].astype(np.int64), data[:, 2].astype(np.int64), data[:, 3]
+                rows_exported += len(rows)
+                if not as_directory:
+                    files.write(out_path, sensor_keys, ts, values)
+                    continue
+                if not partition_by_day:
+                    files.write(os.path.join(out_path, part_name), sensor_keys, ts, values)
+                    continue
+                # Rows arrive in insertion order, mostly but not strictly by time: split the chunk by UTC day
+                days = ts // 86_400_000
+                for day in np.unique(days):
+                    selected = days == day
+                    day_dir = os.path.join(out_path, f"day={datetime.fromtimestamp(int(day) * 86400, timezone.utc):%Y-%m-%d}")
+                    os.makedirs(day_dir, exist_ok=True)
+                    files.write(os.path.join(day_dir, part_name), sensor_keys[selected], ts[selected],
+                                values[selected])
+        finally:
+            files.close()
+            conn.rollback()
+    finally:
+        conn.close()
+
+    if incremental:
+        _write_export_state(out_path, {"last_id": max_id, "exported_at": datetime.now(timezone.utc).isoformat()})
+    summary = {
+        "rows": rows_exported,
+        "files": len(files.writers),
+        "first_id": after_id + 1,
+        "last_id": max_id,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    print(f"Exported {rows_exported} rows of {db_path} to {out_path} ({fmt}): {summary}")
+    return summary
+
+# Function to parse a --start/--end argument: epoch ms or an ISO date/time (local time unless it has an offset)
+def parse_time(text):
+    if text is None:
+        return None
+    if text.lstrip('-').isdigit():
+        return int(text)
+    return int(datetime.fromisoformat(text).timestamp() * 1000)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export the history database to Parquet, Feather or CSV.")
+    parser.add_argument('out', help="Output file, or directory with --partition-by-day/--incremental")
+    parser.add_argument('--db', default=None, help="Database to export (default: history_db_path)")
+    parser.add_argument('--format', choices=FORMATS, default=None, help="Default: from the file extension, else parquet")
+    parser.add_argument('--start', default=None, help="First time to export (ISO date/time or epoch ms)")
+    parser.add_argument('--end', default=None, help="Export before this time (ISO date/time or epoch ms)")
+    parser.add_argument('--topics', nargs='*', default=None, help="MQTT filters or globs of the topics to export")
+    parser.add_argument('--site', default=None, help="Only export this site")
+    parser.add_argument('--partition-by-day', action='store_true')
+    parser.add_argument('--incremental', action='store_true', help="Only export rows stored since the last run")
+    parser.add_argument('--chunk-size', type=int, default=100_000)
+    args = parser.parse_args()
+
+    if args.db is None:
+        from dt_config import CONFIG
+        args.db = CONFIG['history_db_path']
+    fmt = args.format or next((name for name, ext in EXTENSIONS.items() if args.out.endswith(ext)), 'parquet')
+    export_history(args.db, args.out, fmt, parse_time(args.start), parse_time(args.end), args.topics, args.site,
+                   args.partition_by_day, args.incremental, args.chunk_size)
@@ -1,15 +1,25 @@
 import sqlite3
-import csv
+import numpy as np
 
 # Function to connect to the SQLite database
 def connect_db(db_path):
     conn = sqlite3.connect(db_path)
     return conn
 
-# Function to create the sensor_data table if it doesn't exist
-def create_sensor_table(conn):
-    cursor = conn.cursor()
-    cursor.execute('''
+# Schema version stored in PRAGMA user_version
+# 1: sensor_data(id, sensor_id TEXT, timestamp DATETIME as ISO string, value)
+# 2: sensors topic dictionary + sensor_data(id, sensor_key, ts in epoch ms, value) with a (sensor_key, ts) index
+# 3: sensor_rollups (count/min/max/sum/last per topic and time bucket) + rollup_state watermark
+# 4: sensors.site_id, topics are unique per site (rows are tagged with their site through sensor_key)
+# 5: sensor_data.id AUTOINCREMENT, so ids are never reused once the table has been emptied
+# 6: sensor_rollups.min_ts/max_ts, the times of the min and max reading of each bucket
+SCHEMA_VERSION = 6
+
+# Site of the SmartLab broker; rows stored before version 4 belong to it
+DEFAULT_SITE_ID = 'smartlab'
+
+def _create_schema_v1(conn):
+    conn.execute('''
     CREATE TABLE IF NOT EXISTS sensor_data (
         id INTEGER PRIMARY KEY,
         sensor_id TEXT,
@@ -17,30 +27,226 @@ def create_sensor_table(conn):
         value REAL
     )
     ''')
-    conn.commit()
+
+def _migrate_to_v2(conn):
+    # Topic dictionary: long KNX topic strings are stored once, rows refer to an integer key
+    conn.execute('''
+    CREATE TABLE sensors (
+        sensor_key INTEGER PRIMARY KEY,
+        sensor_id TEXT NOT NULL UNIQUE
+    )
+    ''')
+    conn.execute('''
+    INSERT INTO sensors (sensor_id)
+    SELECT DISTINCT sensor_id FROM sensor_data WHERE sensor_id IS NOT NULL ORDER BY sensor_id
+    ''')
+    # The raw table keeps its rowid: the append-ordered id is the cursor for incremental reads.
+    # Queries by topic and time are answered from the covering index alone.
+    conn.execute('''
+    CREATE TABLE sensor_data_v2 (
+        id INTEGER PRIMARY KEY,
+        sensor_key INTEGER NOT NULL REFERENCES sensors (sensor_key),
+        ts INTEGER NOT NULL,
+        value REAL
+    )
+    ''')
+    # Old timestamps are local-time ISO strings; 'utc' converts them before taking the epoch
+    conn.execute('''
+    INSERT INTO sensor_data_v2 (id, sensor_key, ts, value)
+    SELECT d.id, s.sensor_key, CAST(strftime('%s', d.timestamp, 'utc') AS INTEGER) * 1000, d.value
+    FROM sensor_data d JOIN sensors s ON s.sensor_id = d.sensor_id
+    WHERE strftime('%s', d.timestamp, 'utc') IS NOT NULL
+    ''')
+    conn.execute("DROP TABLE sensor_data")
+    conn.execute("ALTER TABLE sensor_data_v2 RENAME TO sensor_data")
+    conn.execute("CREATE INDEX idx_sensor_data_key_ts ON sensor_data (sensor_key, ts, value)")
+
+def _migrate_to_v3(conn):
+    # Aggregates per (resolution in seconds, topic, bucket start in epoch ms), maintained by rollups.py.
+    # WITHOUT ROWID clusters the rows on the primary key, so a topic's buckets are stored together.
+    conn.execute('''
+    CREATE TABLE sensor_rollups (
+        resolution INTEGER NOT NULL,
+        sensor_key INTEGER NOT NULL REFERENCES sensors (sensor_key),
+        bucket INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        min REAL,
+        max REAL,
+        sum REAL,
+        last_ts INTEGER NOT NULL,
+        last_value REAL,
+        PRIMARY KEY (resolution, sensor_key, bucket)
+    ) WITHOUT ROWID
+    ''')
+    # Highest sensor_data id already folded into the rollups
+    conn.execute('''
+    CREATE TABLE rollup_state (
+        name TEXT PRIMARY KEY,
+        last_id INTEGER NOT NULL
+    ) WITHOUT ROWID
+    ''')
+
+def _migrate_to_v4(conn):
+    # SQLite can't change a UNIQUE constraint in place, so the (small) topic dictionary is rebuilt.
+    # Keys are kept, so sensor_data and sensor_rollups stay valid.
+    conn.execute('''
+    CREATE TABLE sensors_v4 (
+        sensor_key INTEGER PRIMARY KEY,
+        site_id TEXT NOT NULL,
+        sensor_id TEXT NOT NULL,
+        UNIQUE (site_id, sensor_id)
+    )
+    ''')
+    conn.execute("INSERT INTO sensors_v4 (sensor_key, site_id, sensor_id) SELECT sensor_key, ?, sensor_id FROM sensors",
+                 (DEFAULT_SITE_ID,))
+    conn.execute("DROP TABLE sensors")
+    conn.execute("ALTER TABLE sensors_v4 RENAME TO sensors")
+
+def _migrate_to_v5(conn):
+    # The id is the watermark of the rollups and of incremental exports and reads. Without AUTOINCREMENT,
+    # ids restart after the highest remaining one when retention or clear_old_data empties the table.
+    conn.execute('''
+    CREATE TABLE sensor_data_v5 (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sensor_key INTEGER NOT NULL REFERENCES sensors (sensor_key),
+        ts INTEGER NOT NULL,
+        value REAL
+    )
+    ''')
+    conn.execute("INSERT INTO sensor_data_v5 (id, sensor_key, ts, value) SELECT id, sensor_key, ts, value FROM sensor_data")
+    conn.execute("DROP TABLE sensor_data")
+    conn.execute("ALTER TABLE sensor_data_v5 RENAME TO sensor_data")
+    conn.execute("CREATE INDEX idx_sensor_data_key_ts ON sensor_data (sensor_key, ts, value)")
+    # New ids continue after the rollup watermark even if the table is empty now
+    conn.execute("DELETE FROM sqlite_sequence WHERE name = 'sensor_data'")
+    conn.execute('''
+    INSERT INTO sqlite_sequence (name, seq) SELECT 'sensor_data', max(
+        coalesce((SELECT max(id) FROM sensor_data), 0),
+        coalesce((SELECT last_id FROM rollup_state WHERE name = 'sensor_data'), 0))
+    ''')
+
+def _migrate_to_v6(conn):
+    # NULL for the buckets aggregated before; backfill_rollups fills those still covered by raw rows
+    conn.execute("ALTER TABLE sensor_rollups ADD COLUMN min_ts INTEGER")
+    conn.execute("ALTER TABLE sensor_rollups ADD COLUMN max_ts INTEGER")
+
+# Function to create the current schema in a new database (the tables as left by all migrations)
+def _create_schema(conn):
+    conn.execute('''
+    CREATE TABLE sensors (
+        sensor_key INTEGER PRIMARY KEY,
+        site_id TEXT NOT NULL,
+        sensor_id TEXT NOT NULL,
+        UNIQUE (site_id, sensor_id)
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE sensor_data (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sensor_key INTEGER NOT NULL REFERENCES sensors (sensor_key),
+        ts INTEGER NOT NULL,
+        value REAL
+    )
+    ''')
+    conn.execute("CREATE INDEX idx_sensor_data_key_ts ON sensor_data (sensor_key, ts, value)")
+    _migrate_to_v3(conn)  # sensor_rollups and rollup_state, then the min/max times of version 6
+    _migrate_to_v6(conn)
+
+# Ordered list of (version, migration); each runs once in its own transaction
+MIGRATIONS = [
+    (1, _create_schema_v1),
+    (2, _migrate_to_v2),
+    (3, _migrate_to_v3),
+    (4, _migrate_to_v4),
+    (5, _migrate_to_v5),
+    (6, _migrate_to_v6),
+]
+
+# Function to create the sensor tables if they don't exist and upgrade older databases in place
+def create_sensor_table(conn):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version == 0 and conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sensor_data'").fetchone() is None:
+        # New database: no data to migrate
+        try:
+            conn.execute("BEGIN")
+            _create_schema(conn)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        return
+    for target, migration in MIGRATIONS:
+        if version >= target:
+            continue
+        try:
+            conn.execute("BEGIN")
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {target}")
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        if target > 1:
+            print(f"Database schema migrated to version {target}.")
+        version = target
+
+# Function to upgrade a database file to the current schema
+def migrate_database(db_path):
+    conn = connect_db(db_path)
+    try:
+        create_sensor_table(conn)
+    finally:
+        conn.close()
 
 # Function to clear old data
 def clear_old_data(conn):
     cursor = conn.cursor()
     cursor.execute("DELETE FROM sensor_data")
     conn.commit()
+    conn.execute("VACUUM")  # Give the freed pages back instead of keeping a bloated file
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")  # In WAL mode the file only shrinks once checkpointed
     print("Old data cleared from the database.")  # Debugging: Verify data is cleared
 
+# Function to get the integer keys of (site_id, topic) pairs, adding new ones to the sensors table
+def get_sensor_keys(conn, sensors, key_cache=None):
+    key_cache = {} if key_cache is None else key_cache
+    missing = [sensor for sensor in set(sensors) if sensor not in key_cache]
+    if missing:
+        conn.executemany("INSERT OR IGNORE INTO sensors (site_id, sensor_id) VALUES (?, ?)", missing)
+        for sensor in missing:
+            row = conn.execute("SELECT sensor_key FROM sensors WHERE site_id = ? AND sensor_id = ?", sensor).fetchone()
+            key_cache[sensor] = row[0]
+    return key_cache
+
+# Function to insert a batch of rows (site_id, sensor_id, timestamp in epoch ms, value) in one transaction
+def insert_sensor_rows(conn, rows, key_cache=None):
+    key_cache = {} if key_cache is None else key_cache
+    try:
+        with conn:  # Commits on success, rolls back on error
+            get_sensor_keys(conn, [(row[0], row[1]) for row in rows], key_cache)
+            conn.executemany(
+                'INSERT INTO sensor_data (sensor_key, ts, value) VALUES (?, ?, ?)',
+                [(key_cache[(site_id, sensor_id)], ts, value) for site_id, sensor_id, ts, value in rows]
+            )
+    except sqlite3.Error:
+        key_cache.clear()  # Keys added in the rolled back transaction are gone
+        raise
+
+# Function to convert a sensor_data dict of mqtt_client into an insert_sensor_rows row
+def sensor_row(sensor_data):
+    return (sensor_data.get('site', DEFAULT_SITE_ID), sensor_data['id'], sensor_data['timestamp'], sensor_data['value'])
+
 # Function to save sensor data into the database
 def save_sensor_data(sensor_data, db_path):
     print(f"Saving data: {sensor_data}")  # Debugging: Check what is being passed to this function
     
     # Connect to the database
     conn = connect_db(db_path)
-    cursor = conn.cursor()
     
     try:
         # Insert sensor data into the database
-        cursor.execute(
-            'INSERT INTO sensor_data (sensor_id, timestamp, value) VALUES (?, ?, ?)', 
-            (sensor_data['id'], sensor_data['timestamp'], sensor_data['value'])
-        )
-        conn.commit()  # Commit changes to the database
+        insert_sensor_rows(conn, [sensor_row(sensor_data)])
     except sqlite3.Error as e:
         print(f"Error saving data to the database: {e}")
     finally:
@@ -49,50 +255,140 @@ def save_sensor_data(sensor_data, db_path):
 # Function to save data to history database
 def save_to_history(sensor_data, history_db_path):
     conn = connect_db(history_db_path)
-    cursor = conn.cursor()
     try:
-        cursor.execute(
-            'INSERT INTO sensor_data (sensor_id, timestamp, value) VALUES (?, ?, ?)', 
-            (sensor_data['id'], sensor_data['timestamp'], sensor_data['value'])
-        )
-        conn.commit()  # Commit changes to the history database
+        insert_sensor_rows(conn, [sensor_row(sensor_data)])
     except sqlite3.Error as e:
         print(f"Error saving data to the history database: {e}")
     finally:
         conn.close()
 
 # Function to fetch sensor data of a topic from the database
-def fetch_sensor_data(db_path, topic):
+def fetch_sensor_data(db_path, topic, site_id=DEFAULT_SITE_ID):
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()    
 
-    # Execute the query to find rows with the specific topic
-    cursor.execute("SELECT sensor_id, timestamp, value FROM sensor_data WHERE sensor_id = ?", (topic,))
+    # Execute the query to find rows with the specific topic (timestamps as local-time ISO strings)
+    cursor.execute('''
+    SELECT s.sensor_id, strftime('%Y-%m-%dT%H:%M:%S', d.ts / 1000, 'unixepoch', 'localtime'), d.value
+    FROM sensors s JOIN sensor_data d ON d.sensor_key = s.sensor_key
+    WHERE s.site_id = ? AND s.sensor_id = ?
+    ORDER BY d.ts
+    ''', (site_id, topic))
+    rows = cursor.fetchall()
+    conn.close()
+
+    return rows
 
-    return cursor.fetchall()
+# Function to look up the integer key of a topic of a site (None if the topic was never stored)
+def get_sensor_key(conn, topic, site_id=DEFAULT_SITE_ID):
+    row = conn.execute("SELECT sensor_key FROM sensors WHERE site_id = ? AND sensor_id = ?", (site_id, topic)).fetchone()
+    return row[0] if row else None
 
-# Function to fetch data from all topics and save as a CSV file
-def save_data_csv(db_path, csv_path):
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+# Function to convert fetched (id, ts, value) rows into NumPy arrays
+def _rows_to_arrays(rows):
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    data = np.array(rows, dtype=np.float64)  # Epoch ms fit exactly in a float64; NULL values become nan
+    return data[:, 0].astype(np.int64), data[:, 1].astype(np.int64), data[:, 2]
 
-    # Query to get all unique sensor IDs (topics)
-    cursor.execute("SELECT DISTINCT sensor_id FROM sensor_data")
-    topics = cursor.fetchall()
+# Function to fetch the rows of a topic stored after a cursor
+def fetch_sensor_data_since(conn, topic, last_id=0, since_ts=None, limit=None, site_id=DEFAULT_SITE_ID):
+    """Return (times, values, last_id) for rows of `topic` newer than the cursor.
 
-    # Prepare to write to CSV
-    with open(csv_path, mode='w', newline='') as csv_file:
-        csv_writer = csv.writer(csv_file)
-        # Write the header
-        csv_writer.writerow(["sensor_id", "timestamp", "value"])
+    The cursor is the last seen row id, or a timestamp in epoch ms when `since_ts` is given.
+    times are int64 epoch ms and values float64 NumPy arrays; pass the returned last_id
+    back in on the next call to read only what arrived in between.
+    """
+    sensor_key = get_sensor_key(conn, topic, site_id)
+    if sensor_key is None:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64), last_id
 
-        # Fetch data for each topic and write to CSV
-        for topic in topics:
-            topic_id = topic[0]  # Extract the sensor ID
-            data = fetch_sensor_data(db_path, topic_id)
-            csv_writer.writerows(data)  # Append the data for the topic
+    if since_ts is None:
+        # Advance the cursor to the newest row even if the topic was quiet, so the next scan stays short
+        max_id = conn.execute("SELECT max(id) FROM sensor_data").fetchone()[0] or 0
+        # Unary + keeps SQLite on the rowid range instead of the topic index: cost is O(new rows)
+        query = "SELECT id, ts, value FROM sensor_data WHERE id > ? AND id <= ? AND +sensor_key = ? ORDER BY id"
+        params = [last_id, max_id, sensor_key]
+    else:
+        query = "SELECT id, ts, value FROM sensor_data WHERE sensor_key = ? AND ts > ? ORDER BY ts"
+        params = [sensor_key, since_ts]
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
 
-    conn.close()
+    ids, times, values = _rows_to_arrays(conn.execute(query, params).fetchall())
+    if since_ts is None and (limit is None or len(ids) < limit):
+        last_id = max(last_id, max_id)
+    elif len(ids):
+        last_id = int(ids.max())
+    return times, values, last_id
+
+# Function to fetch the rows of a topic in the time range [start, end)
+def fetch_sensor_data_range(conn, topic, start=None, end=None, limit=None, site_id=DEFAULT_SITE_ID):
+    """Return (times, values) NumPy arrays for rows of `topic` with start <= ts < end.
+
+    start and end are epoch ms; None leaves that side open. With a limit, the first
+    `limit` rows of the range are returned.
+    """
+    sensor_key = get_sensor_key(conn, topic, site_id)
+    if sensor_key is None:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+    query = "SELECT id, ts, value FROM sensor_data WHERE sensor_key = ?"
+    params = [sensor_key]
+    if start is not None:
+        query += " AND ts >= ?"
+        params.append(start)
+    if end is not None:
+        query += " AND ts < ?"
+        params.append(end)
+    query += " ORDER BY ts"
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+
+    _, times, values = _rows_to_arrays(conn.execute(query, params).fetchall())
+    return times, values
+
+# Function to get the number of rows and the first/last timestamp of a topic in [start, end)
+def fetch_sensor_data_extent(conn, topic, start=None, end=None, site_id=DEFAULT_SITE_ID):
+    sensor_key = get_sensor_key(conn, topic, site_id)
+    if sensor_key is None:
+        return 0, None, None
+    return conn.execute(
+        "SELECT count(*), min(ts), max(ts) FROM sensor_data WHERE sensor_key = ? AND ts >= ? AND ts < ?",
+        (sensor_key, start if start is not None else -2**63, end if end is not None else 2**63 - 1)
+    ).fetchone()
+
+# Function to fetch the min and max reading of a topic per time bucket in [start, end)
+def fetch_minmax_buckets(conn, topic, start, end, n_buckets, site_id=DEFAULT_SITE_ID):
+    """Return (times, values) with the min and the max reading of each of n_buckets equal time buckets.
+
+    Aggregated in SQL over the (sensor_key, ts) index, so only 2 * n_buckets rows leave SQLite.
+    Points are returned in time order at the timestamps where the min/max occurred.
+    """
+    sensor_key = get_sensor_key(conn, topic, site_id)
+    if sensor_key is None:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    width = max(-(-(end - start) // n_buckets), 1)  # Rounded up so there are at most n_buckets
+    rows = []
+    # With a single min()/max() aggregate, SQLite takes the bare ts column from the same row
+    for aggregate in ("min", "max"):
+        rows += conn.execute(
+            f"SELECT ts, {aggregate}(value) FROM sensor_data "
+            "WHERE sensor_key = ? AND ts >= ? AND ts < ? GROUP BY (ts - ?) / ?",
+            (sensor_key, start, end, start, width)
+        ).fetchall()
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    data = np.unique(np.array(rows, dtype=np.float64), axis=0)  # Sorted by time, min == max counted once
+    return data[:, 0].astype(np.int64), data[:, 1]
+
+# Function to fetch data from all topics and save as a CSV file
+# (one streamed query in insertion order; data_export.py also writes Parquet/Feather, by day and incrementally)
+def save_data_csv(db_path, csv_path):
+    from data_export import export_history
+    export_history(db_path, csv_path, 'csv')
     print(f"Data from all topics has been saved to {csv_path}")
 
 if __name__ == '__main__':  
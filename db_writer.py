@@ -0,0 +1,145 @@
+import queue
+import sqlite3
+import threading
+import time
+from database import connect_db, create_sensor_table, insert_sensor_rows, sensor_row
+from rollups import update_rollups
+
+# Marker put on the queue to ask the writer thread to flush and exit
+_STOP = object()
+
+class SensorDataWriter:
+    """Batch sensor readings into SQLite with one long-lived connection per database.
+
+    Readings are queued by put() and written by a background thread with executemany,
+    one transaction per database and flush. A flush happens when batch_size rows are
+    pending or the oldest pending row has waited batch_age seconds, and once more on stop().
+    Databases listed in rollup_db_paths also get their rollup tables updated after each flush, at most
+    rollup_limit raw ids per flush, so a backlog (e.g. right after the rollup migration) is caught up
+    over several flushes instead of stalling the writer.
+    on_flush(rows), if given, is called on the writer thread with the rows of every committed flush.
+    """
+
+    def __init__(self, db_paths, batch_size=500, batch_age=1.0, max_queue_size=100000, rollup_db_paths=(), on_flush=None,
+                 rollup_limit=20000):
+        self.db_paths = list(db_paths)
+        self.rollup_db_paths = set(rollup_db_paths)
+        self.rollup_limit = rollup_limit
+        self.on_flush = on_flush
+        self.batch_size = batch_size
+        self.batch_age = batch_age
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._key_caches = [{} for _ in self.db_paths]  # (site_id, topic) -> sensor_key, one per database
+        self._thread = None
+        self._stopping = False
+        self._stats_lock = threading.Lock()
+        self._started_at = None
+        self._rows_written = 0
+        self._rows_dropped = 0
+        self._flushes = 0
+        self._errors = 0
+        self._flush_time_total = 0.0
+        self._last_flush_time = 0.0
+        self._max_flush_time = 0.0
+
+    # Function to start the writer thread
+    def start(self):
+        if self._thread is not None:
+            return self
+        self._started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="SensorDataWriter", daemon=True)
+        self._thread.start()
+        return self
+
+    # Function to queue one reading; blocks while the queue is full (backpressure)
+    def put(self, sensor_data):
+        if self._stopping:
+            with self._stats_lock:
+                self._rows_dropped += 1
+            return
+        self._queue.put(sensor_row(sensor_data))
+
+    # Function to flush pending rows, close the connections and stop the thread
+    def stop(self, timeout=None):
+        if self._thread is None or self._stopping:
+            return
+        self._stopping = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    # Function to get a snapshot of the throughput counters
+    def stats(self):
+        with self._stats_lock:
+            elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+            return {
+                "rows_written": self._rows_written,
+                "rows_dropped": self._rows_dropped,
+                "rows_pending": self._queue.qsize(),
+                "flushes": self._flushes,
+                "errors": self._errors,
+                "rows_per_sec": self._rows_written / elapsed if elapsed > 0 else 0.0,
+                "last_flush_ms": self._last_flush_time * 1000,
+                "avg_flush_ms": self._flush_time_total / self._flushes * 1000 if self._flushes else 0.0,
+                "max_flush_ms": self._max_flush_time * 1000,
+            }
+
+    def _run(self):
+        # Connections are created here: sqlite3 connections belong to the thread that opens them
+        connections = []
+        for db_path in self.db_paths:
+            conn = connect_db(db_path)
+            conn.execute("PRAGMA journal_mode=WAL")  # Readers (plots) don't block the writer
+            conn.execute("PRAGMA synchronous=NORMAL")  # One fsync per checkpoint instead of per commit
+            create_sensor_table(conn)
+            connections.append(conn)
+
+        batch = []
+        deadline = None
+        stopping = False
+        try:
+            while not stopping:
+                timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+
+                if item is _STOP:
+                    stopping = True
+                elif item is not None:
+                    if not batch:
+                        deadline = time.monotonic() + self.batch_age
+                    batch.append(item)
+
+                if batch and (stopping or len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                    self._flush(connections, batch)
+                    batch = []
+                    deadline = None
+        finally:
+            for conn in connections:
+                conn.close()
+
+    def _flush(self, connections, batch):
+        start = time.perf_counter()
+        failed = False
+        for db_path, conn, key_cache in zip(self.db_paths, connections, self._key_caches):
+            try:
+                insert_sensor_rows(conn, batch, key_cache)
+                if db_path in self.rollup_db_paths:
+                    update_rollups(conn, chunk_size=self.rollup_limit, limit=self.rollup_limit)
+            except sqlite3.Error as e:
+                failed = True
+                print(f"Error saving {len(batch)} rows to the database: {e}")
+        elapsed = time.perf_counter() - start
+
+        with self._stats_lock:
+            self._flushes += 1
+            if failed:
+                self._errors += 1
+            else:
+                self._rows_written += len(batch)
+            self._flush_time_total += elapsed
+            self._last_flush_time = elapsed
+            self._max_flush_time = max(self._max_flush_time, elapsed)
+        if self.on_flush is not None and not failed:
+            self.on_flush(batch)
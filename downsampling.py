@@ -0,0 +1,99 @@
+import numpy as np
+from database import fetch_sensor_data_extent, fetch_sensor_data_range, fetch_minmax_buckets, DEFAULT_SITE_ID
+from rollups import fetch_rollups
+
+# Function to downsample a series with Largest-Triangle-Three-Buckets
+def lttb(x, y, n_out):
+    """Return at most n_out points of (x, y) that keep the visual shape of the series.
+
+    The first and last points are always kept. The points in between are split into
+    n_out - 2 buckets, and from each bucket LTTB keeps the point forming the largest
+    triangle with the previously kept point and the average of the next bucket.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return x, y
+
+    # Bucket k covers [starts[k], ends[k]); the last bucket is the final point on its own
+    starts = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    ends = np.append(starts[1:], n)
+    counts = ends - starts
+    avg_x = np.add.reduceat(x, starts) / counts
+    avg_y = np.add.reduceat(y, starts) / counts
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for k in range(n_out - 2):
+        lo, hi = starts[k], ends[k]
+        # Twice the triangle area; the constant factor doesn't change the argmax
+        area = np.abs((x[a] - avg_x[k + 1]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y[k + 1] - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[k + 1] = a
+    return x[selected], y[selected]
+
+# Function to downsample a series to the min and max point of equal-width x buckets
+def minmax_buckets(x, y, n_buckets):
+    """Return the min and max point of each of n_buckets equal-width x buckets, in x order.
+
+    x must be sorted. Keeps every spike visible, at most 2 * n_buckets points.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n <= 2 * n_buckets:
+        return x, y
+
+    span = (x[-1] - x[0]) or 1
+    bucket = np.minimum(((x - x[0]) * n_buckets / span).astype(np.int64), n_buckets - 1)
+    # Sort by (bucket, value): the first entry of a bucket is its min, the last one its max
+    order = np.lexsort((y, bucket))
+    sorted_buckets = bucket[order]
+    firsts = np.flatnonzero(np.r_[True, sorted_buckets[1:] != sorted_buckets[:-1]])
+    lasts = np.r_[firsts[1:], n] - 1
+    selected = np.unique(np.concatenate((order[firsts], order[lasts])))  # Back in x order
+    return x[selected], y[selected]
+
+# Function to fetch a topic's readings in [start, end) reduced to at most max_points points
+def fetch_downsampled(conn, topic, start=None, end=None, max_points=1000, method='minmax', site_id=DEFAULT_SITE_ID):
+    """Return (times, values, downsampled) for a topic window with at most max_points points.
+
+    Windows that already fit are returned raw. Otherwise 'minmax' draws the min/max envelope
+    per time bucket (one bucket per two points): from the coarsest rollup table that fits
+    when the buckets are at least a minute wide, else aggregated from the raw rows in SQL.
+    'lttb' reads the window and applies LTTB in NumPy.
+    """
+    count, first_ts, last_ts = fetch_sensor_data_extent(conn, topic, start, end, site_id)
+    if count <= max_points:
+        times, values = fetch_sensor_data_range(conn, topic, start, end, site_id=site_id)
+        return times, values, False
+
+    n_buckets = max(max_points // 2, 1)
+    if method == 'minmax':
+        rollup = fetch_rollups(conn, topic, first_ts, last_ts + 1, (last_ts + 1 - first_ts) / n_buckets / 1000, site_id)
+        if rollup is not None and len(rollup['time']):
+            # The min and max reading of each bucket at their own times. Buckets aggregated before their
+            # times were stored fall back to the bucket start (min) and middle (max).
+            min_times = np.where(np.isnan(rollup['min_time']), rollup['time'], rollup['min_time'])
+            max_times = np.where(np.isnan(rollup['max_time']), rollup['time'] + rollup['resolution'] * 500,
+                                 rollup['max_time'])
+            min_first = min_times <= max_times
+            times = np.column_stack((np.where(min_first, min_times, max_times),
+                                     np.where(min_first, max_times, min_times))).ravel().astype(np.int64)
+            values = np.column_stack((np.where(min_first, rollup['min'], rollup['max']),
+                                      np.where(min_first, rollup['max'], rollup['min']))).ravel()
+            keep = np.r_[True, (times[1:] != times[:-1]) | (values[1:] != values[:-1])]  # min == max counted once
+            times, values = times[keep], values[keep]
+            # The rollup may be finer than needed; merge its buckets down to max_points
+            times, values = minmax_buckets(times, values, n_buckets)
+        else:
+            times, values = fetch_minmax_buckets(conn, topic, first_ts, last_ts + 1, n_buckets, site_id)
+    elif method == 'lttb':
+        times, values = fetch_sensor_data_range(conn, topic, start, end, site_id=site_id)
+        times, values = lttb(times, values, max_points)
+        times = times.astype(np.int64)
+    else:
+        raise ValueError(f"Unknown downsampling method '{method}', expected 'minmax' or 'lttb'")
+    return times, values, True
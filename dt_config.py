@@ -1,10 +1,120 @@
 import json
 import os
+import pickle
 
-CONFIG = {    
+class LazyConfig(dict):
+    """The CONFIG dict, with derived entries (such as 'mqtt_topics') computed on first access.
+
+    The local settings are merged in by the loader of load_on_first_use() when the first key is
+    read (with [], get() or in). Keys set before that keep the value they were given.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lazy = {}
+        self._loader = None
+        self._set_before_load = set()
+
+    # Function to register the function merging the local settings, called on the first read
+    def load_on_first_use(self, loader):
+        self._loader = loader
+        self._set_before_load.clear()
+
+    def _load(self):
+        loader, self._loader = self._loader, None
+        if loader is not None:
+            try:
+                loader()
+            except BaseException:
+                self._loader = loader  # Raise again on the next read, e.g. while the file is still missing
+                raise
+
+    # Function to merge settings without replacing the keys set since load_on_first_use()
+    def merge(self, settings):
+        super().update({key: value for key, value in settings.items() if key not in self._set_before_load})
+
+    def __getitem__(self, key):
+        self._load()
+        return super().__getitem__(key)
+
+    def __setitem__(self, key, value):
+        if self._loader is not None:
+            self._set_before_load.add(key)
+        super().__setitem__(key, value)
+
+    # Function to register an entry computed by fn() when it is first read
+    def lazy(self, key, fn):
+        self._lazy[key] = fn
+        super().pop(key, None)
+
+    def __missing__(self, key):
+        if key not in self._lazy:
+            raise KeyError(key)
+        value = self[key] = self._lazy[key]()
+        return value
+
+    def __contains__(self, key):
+        self._load()
+        return super().__contains__(key) or key in self._lazy
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    # Function to compute every lazy entry (e.g. before printing the whole config)
+    def materialize(self):
+        self._load()
+        for key in self._lazy:
+            self[key]
+        return self
+
+CONFIG = LazyConfig({    
     'realtime_db_path': './sensor_data_realtime.db',
-    'history_db_path': './sensor_data_history.db'
-}
+    'history_db_path': './sensor_data_history.db',
+    'db_batch_size': 500,   # Rows per database transaction
+    'db_batch_age': 1.0,    # Max seconds a reading waits before it is written
+    'print_readings': False,  # Debugging: print every received reading (slows the ingestion down)
+    'ingest_queue_size': 10000,             # Readings buffered between MQTT and the database writer
+    'ingest_overflow_policy': 'drop_oldest',  # 'block', 'drop_oldest' or 'coalesce'
+    'ingest_workers': 1,
+    'subscribe_collapse_threshold': 10,  # Subscribe 'KNX/#' instead of each KNX topic from this many topics on
+    # Payload decoders per topic pattern (first match wins), e.g. [{"pattern": "KNX/*<*.Switches.*>", "decoder": "bool"},
+    # {"pattern": "M-bus/#", "decoder": "json", "path": "data.value"}]; see payload_decoders.py
+    'payload_decoders': [],
+    'payload_default_decoder': 'auto',
+    'actuator_qos': 1,                  # QoS of actuator commands (1: confirmed by the broker)
+    'actuator_publish_timeout': 5,      # Seconds to wait for the confirmation of batch commands
+    'actuator_state_path': None,        # Keep the last actuator values across restarts in this JSON file
+    'mqtt_capture_path': None,   # Also record the raw MQTT messages to this file (see mqtt_replay.py)
+    # main.py: replay this capture instead of connecting to the brokers (offline plots and Blender);
+    # replayed readings only feed the plots and Blender, and are stored only in mqtt_replay_db_path if set
+    'mqtt_replay_path': None,
+    'mqtt_replay_db_path': None,  # Scratch database for replayed readings; must not be a configured database
+    'mqtt_replay_speed': 1.0,    # Replay rate relative to the recording, 0 for as fast as possible
+    'mqtt_replay_loop': True,
+    'plot_backend': 'blit',  # Real-time plot rendering: 'blit' or 'redraw'
+    'plot_max_points': 1000,  # Points drawn per series; longer series are downsampled
+    'downsampling_method': 'minmax',  # History plots: 'minmax' (SQL aggregate) or 'lttb'
+    # History retention in days per data tier (None keeps forever); 'groups' overrides it for matching topics,
+    # e.g. {"M-bus": {"raw_days": 365}}
+    'retention': {
+        'raw_days': 90,
+        'rollup_days': {'60': 180, '900': 730, '3600': None, '86400': None},
+        'groups': {}
+    },
+    'retention_interval': 3600,     # Seconds between retention runs
+    'retention_chunk_size': 5000,   # Rows deleted per transaction
+    'realtime_window': 3600,            # Seconds of data shown by the real-time plot
+    'realtime_buffer_capacity': 7200,   # Samples kept in memory per topic
+    'realtime_sqlite': False,           # Also write the realtime tier to realtime_db_path
+    'live_data_shm_name': 'cic_dt_smartlab_live',  # Shared memory segment with the latest reading per topic
+    'live_data_ring_size': 64,                     # Recent samples kept per topic in the segment
+    'live_coloring_interval': 0.5,  # Blender: seconds between checks of the segment for new readings
+    'live_coloring_budget_ms': 8,   # Blender: time spent recoloring objects per timer tick
+    'topic_channel_host': '127.0.0.1',  # Loopback channel pushing the topic selection from Blender
+    'topic_channel_port': 47810,
+    'rollup_interval': 10,    # async_main.py: seconds between rollup updates
+    'health_interval': 60     # async_main.py: seconds between health reports
+})
 
 # Get the directory of the current running Python file
 local_repository = os.path.dirname(os.path.abspath(__file__))
@@ -14,30 +124,94 @@ CONFIG["ifc_file"] = f"{local_repository}/local_files/smartLab.ifc"
 CONFIG["mqtt_csv"] = f"{local_repository}/local_files/Topic_Ifc_Mapping.csv"
 local_config = f"{local_repository}/local_files/smartlab_config.json"
 
-with open(local_config, "r") as f:
-    data = json.load(f)
-    CONFIG.update(data)
+topic_ifc_link = f"{local_repository}/local_files/topic_ifc_link.json"
+cache_dir = f"{local_repository}/local_files/.cache"
 
-def load_link():
-    local_repository = os.path.dirname(os.path.abspath(__file__))
-    topic_ifc_link = f"{local_repository}/local_files/topic_ifc_link.json"
+# Function to merge smartlab_config.json into CONFIG, on the first read of a CONFIG key
+def load_local_config():
+    with open(local_config, "r") as f:
+        CONFIG.merge(json.load(f))
+    # Broker connections, one per site. smartlab_config.json may list several, e.g.
+    #   "brokers": [{"host": "...", "port": 1883},
+    #               {"site_id": "building2", "host": "...", "port": 1883, "topics": ["KNX/#"]}]
+    # "site_id" defaults to database.DEFAULT_SITE_ID ('smartlab'), the site shown in the plots and in Blender;
+    # "topics" defaults to the SmartLab topics; "collapse_threshold" overrides subscribe_collapse_threshold.
+    if not CONFIG.get('brokers'):
+        CONFIG['brokers'] = [{"host": CONFIG['mqtt_broker'], "port": CONFIG['mqtt_port']}]
+
+CONFIG.load_on_first_use(load_local_config)
+
+# Parsed mappings are cached in cache_dir, one <name>.pickle per mapping holding (CACHE_VERSION, stamps of the
+# source files, value). Bump CACHE_VERSION when a cached value changes shape.
+CACHE_VERSION = 1
 
+# Function to get the (mtime, size) stamps identifying the versions of source files
+def _file_stamps(paths):
+    stamps = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            stamps.append((path, st.st_mtime_ns, st.st_size))
+        except OSError:
+            stamps.append((path, None, None))
+    return stamps
+
+# Function to get a value parsed from source files, from the cache while none of the files changed.
+# Worth it for slow parses (the topic CSV); small JSON files load faster than a pickle.
+def load_cached(name, sources, build):
+    stamps = _file_stamps(sources)
+    cache_path = os.path.join(cache_dir, f"{name}.pickle")
+    try:
+        with open(cache_path, 'rb') as f:
+            version, cached_stamps, value = pickle.load(f)
+        if version == CACHE_VERSION and cached_stamps == stamps:
+            return value
+    except Exception:
+        pass  # Missing, outdated or unreadable cache: rebuild
+    value = build()
+    try:
+        import tempfile  # Only needed when the cache is rewritten
+        os.makedirs(cache_dir, exist_ok=True)
+        # Written atomically: Blender and main.py may start at the same time
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump((CACHE_VERSION, stamps, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"Could not write the config cache {cache_path}: {e}")
+    return value
+
+def load_link():
     with open(topic_ifc_link, "r") as f:
         link = json.load(f)
     return link
 
-sensor_ifc_link = load_link()
+# Module attributes computed on first use (PEP 562), so importing dt_config reads no file
+_LAZY_ATTRIBUTES = {
+    'sensor_ifc_link': load_link,
+    'mqtt_topics': lambda: list(_lazy_value('sensor_ifc_link').keys()),
+    'THRESHOLDS': lambda: CONFIG["thresholds"],  # Constants for thresholds
+    # Topics parsed once: group members (group keys occurring in the topic), rooms, measurements and sensor kinds
+    'TOPIC_INDEX': lambda: _topic_index(_lazy_value('mqtt_topics'), CONFIG["group_keys"]),
+    'GROUPS_AND_TOPICS': lambda: _lazy_value('TOPIC_INDEX').groups,
+}
+
+def _topic_index(topics, group_keys):
+    from topic_index import TopicIndex
+    return TopicIndex(topics, group_keys)
 
-mqtt_topics = list(sensor_ifc_link.keys())
-CONFIG['mqtt_topics'] = mqtt_topics 
+def _lazy_value(name):
+    if name not in globals():
+        globals()[name] = _LAZY_ATTRIBUTES[name]()
+    return globals()[name]
 
-# Constants for thresholds
-THRESHOLDS = CONFIG["thresholds"]
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        return _lazy_value(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-GROUPS_AND_TOPICS = {}
-for k in CONFIG["group_keys"]:
-    GROUPS_AND_TOPICS[k] = list(filter(lambda s: k.lower() in s.lower(), mqtt_topics))
+CONFIG.lazy('mqtt_topics', lambda: _lazy_value('mqtt_topics'))
 
 if __name__ == "__main__":
     from pprint import pprint
-    pprint(CONFIG)
\ No newline at end of file
+    pprint(CONFIG.materialize())
\ No newline at end of file
@@ -0,0 +1,225 @@
+import argparse
+import contextlib
+import csv
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import numpy as np
+from mqtt_client import InjectedMessage, on_message
+from ingest_queue import IngestQueue, OVERFLOW_POLICIES
+from db_writer import SensorDataWriter
+
+# Offline benchmark of the ingest path of main.py: on_message -> IngestQueue -> SensorDataWriter (with rollups).
+# Messages are injected straight into mqtt_client.on_message, so no broker or network is needed.
+# Each payload is the message's sequence number, which lets the writer's on_flush hook measure the
+# latency from on_message to the committed row.
+#
+#   python ingest_benchmark.py --topics 16,256,4096 --rate 2000 --duration 10
+#   python ingest_benchmark.py --save-baseline local_files/ingest_baseline.json
+#   python ingest_benchmark.py --compare local_files/ingest_baseline.json
+
+LOCAL_FILES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'local_files')
+
+# Report metrics compared against a baseline, with the direction that is better
+COMPARED_METRICS = {
+    "rows_per_sec": "higher",
+    "latency_p50_ms": "lower",
+    "latency_p99_ms": "lower",
+    "max_queue_depth": "lower",
+    "bytes_per_row": "lower",
+}
+
+# Function to load the SmartLab topic names from topic_ifc_link.json, else from Topic_Ifc_Mapping.csv
+def load_topic_names(local_files=LOCAL_FILES):
+    link_path = os.path.join(local_files, 'topic_ifc_link.json')
+    if os.path.exists(link_path):
+        with open(link_path, 'r') as f:
+            return list(json.load(f))
+    csv_path = os.path.join(local_files, 'Topic_Ifc_Mapping.csv')
+    if os.path.exists(csv_path):
+        with open(csv_path, newline='', encoding='utf-8', errors='replace') as f:
+            return list(dict.fromkeys(row['FullTopic'] for row in csv.DictReader(f, delimiter=';') if row.get('FullTopic')))
+    return []
+
+# Function to get n realistic topic names: the real ones first, then KNX-style variants of them
+def generate_topics(n, real_topics=None):
+    real_topics = load_topic_names() if real_topics is None else real_topics
+    if not real_topics:
+        real_topics = ['KNX/1/1/1<Livingroom.Sensors.temp>', 'KNX/1/1/2<Livingroom.Sensors.CO2-ppm>',
+                       'KNX/1/1/3<Livingroom.Sensors.rh>', 'M-bus/Electricity/Active Imported Power Total']
+    topics = list(real_topics[:n])
+    # Reuse the <Room.Kind.Name> part of the real KNX topics with new group addresses
+    names = [m.group(1) for m in (re.search(r'(<.*>)$', t) for t in real_topics) if m] or ['<Room.Sensors.temp>']
+    k = 0
+    while len(topics) < n:
+        topics.append(f"KNX/{31 + k // 4096}/{(k // 256) % 16}/{k % 256}{names[k % len(names)]}")
+        k += 1
+    return topics
+
+# Function to get the total size of a database file with its WAL
+def _db_size(db_path):
+    return sum(os.path.getsize(p) for p in (db_path, db_path + '-wal') if os.path.exists(p))
+
+# Function to run one benchmark scenario and return its report
+def run_scenario(n_topics=None, rate=0, duration=10.0, max_messages=None, burst=1, batch_size=500, batch_age=1.0,
+                 queue_size=10000, overflow_policy='drop_oldest', workers=1, rollups=True, topics=None):
+    """Inject messages into on_message for `duration` seconds (or max_messages) and measure the pipeline.
+
+    rate: messages per second over all topics (0: as fast as possible); burst: messages sent
+    back to back before pacing to the rate (1: evenly spaced). Topics are cycled round-robin.
+    """
+    topics = topics or generate_topics(n_topics or len(load_topic_names()) or 16)
+    max_messages = max_messages or (int(rate * duration) + burst if rate else 2_000_000)
+    send_times = np.full(max_messages, np.nan)
+    latencies = []
+
+    # Function called by the writer thread after each committed flush
+    def on_flush(rows):
+        now = time.perf_counter()
+        seqs = np.fromiter((row[3] for row in rows), dtype=np.int64, count=len(rows))
+        latencies.append(now - send_times[seqs])
+
+    tmp_dir = tempfile.mkdtemp(prefix='ingest_benchmark_')
+    db_path = os.path.join(tmp_dir, 'benchmark.db')
+    writer = SensorDataWriter([db_path], batch_size=batch_size, batch_age=batch_age,
+                              rollup_db_paths=[db_path] if rollups else (), on_flush=on_flush).start()
+    ingest = IngestQueue(writer.put, maxsize=queue_size, overflow_policy=overflow_policy, num_workers=workers).start()
+    time.sleep(0.2)  # Let the writer open and create the database
+    size_before = _db_size(db_path)
+
+    # Sample the queue depths while messages are sent
+    depths = []
+    sampling = threading.Event()
+    def sample():
+        while not sampling.wait(0.05):
+            depths.append(ingest.stats()['depth'] + writer.stats()['rows_pending'])
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+
+    messages = [InjectedMessage(topic, None) for topic in topics]
+    save_callback = ingest.put
+    interval = burst / rate if rate else 0.0
+    sent = 0
+    start = time.perf_counter()
+    deadline = start + duration
+    next_burst = start
+    # Readings are not printed (print_readings off); decoding errors printed by on_message stay off the terminal
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        while sent < max_messages:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            if rate and now < next_burst:
+                time.sleep(min(next_burst - now, 0.01))
+                continue
+            for _ in range(min(burst, max_messages - sent)):
+                msg = messages[sent % len(messages)]
+                msg.payload = str(sent).encode()
+                send_times[sent] = time.perf_counter()
+                on_message(None, None, msg, save_callback)
+                sent += 1
+            next_burst += interval
+        send_elapsed = time.perf_counter() - start
+        ingest.stop()
+        writer.stop()
+    elapsed = time.perf_counter() - start
+    sampling.set()
+    sampler.join()
+
+    ingest_stats = ingest.stats()
+    writer_stats = writer.stats()
+    size_after = _db_size(db_path)
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    latency_ms = np.concatenate(latencies) * 1000 if latencies else np.empty(0)
+    rows = writer_stats['rows_written']
+    return {
+        "topics": len(topics),
+        "target_rate": rate,
+        "burst": burst,
+        "messages_sent": sent,
+        "send_rate": sent / send_elapsed if send_elapsed else 0.0,
+        "rows_written": rows,
+        "rows_per_sec": rows / elapsed if elapsed else 0.0,
+        "dropped": ingest_stats['dropped'] + writer_stats['rows_dropped'],
+        "coalesced": ingest_stats['coalesced'],
+        "latency_p50_ms": float(np.percentile(latency_ms, 50)) if len(latency_ms) else None,
+        "latency_p99_ms": float(np.percentile(latency_ms, 99)) if len(latency_ms) else None,
+        "latency_max_ms": float(latency_ms.max()) if len(latency_ms) else None,
+        "max_queue_depth": max(depths + [ingest_stats['max_depth']]),
+        "mean_queue_depth": float(np.mean(depths)) if depths else 0.0,
+        "avg_flush_ms": writer_stats['avg_flush_ms'],
+        "db_growth_bytes": size_after - size_before,
+        "bytes_per_row": (size_after - size_before) / rows if rows else None,
+    }
+
+# Function to print a report as one line per scenario
+def print_report(reports):
+    for name, report in reports.items():
+        p50, p99 = report['latency_p50_ms'], report['latency_p99_ms']
+        print(f"{name}: {report['messages_sent']} msgs to {report['topics']} topics, "
+              f"{report['rows_per_sec']:.0f} rows/s, latency p50 {p50 if p50 is None else round(p50, 1)} ms "
+              f"p99 {p99 if p99 is None else round(p99, 1)} ms, queue depth max {report['max_queue_depth']}, "
+              f"dropped {report['dropped']}, db +{report['db_growth_bytes'] / 1e6:.1f} MB "
+              f"({report['bytes_per_row'] or 0:.1f} B/row)")
+
+# Function to compare reports with a saved baseline; returns the regressions beyond tolerance (fraction)
+def compare_with_baseline(reports, baseline, tolerance=0.2):
+    regressions = []
+    for name, report in reports.items():
+        if name not in baseline:
+            print(f"{name}: no baseline")
+            continue
+        for metric, better in COMPARED_METRICS.items():
+            old, new = baseline[name].get(metric), report.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = change < -tolerance if better == "higher" else change > tolerance
+            print(f"{name} {metric}: {old:.2f} -> {new:.2f} ({change:+.0%}){'  REGRESSION' if worse else ''}")
+            if worse:
+                regressions.append((name, metric, old, new))
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the MQTT ingest path without a broker.")
+    parser.add_argument('--topics', default='', help="Comma-separated topic counts, one scenario each (default: the SmartLab topics)")
+    parser.add_argument('--rate', type=float, default=0, help="Messages per second, 0 for as fast as possible")
+    parser.add_argument('--burst', type=int, default=1, help="Messages sent back to back per burst")
+    parser.add_argument('--duration', type=float, default=10, help="Seconds per scenario")
+    parser.add_argument('--messages', type=int, default=None, help="Stop a scenario after this many messages")
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--batch-age', type=float, default=1.0)
+    parser.add_argument('--queue-size', type=int, default=10000)
+    parser.add_argument('--overflow-policy', choices=OVERFLOW_POLICIES, default='drop_oldest')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--no-rollups', action='store_true', help="Don't update the rollup tables after each flush")
+    parser.add_argument('--save-baseline', metavar='PATH', help="Save the reports as the baseline JSON")
+    parser.add_argument('--compare', metavar='PATH', help="Compare the reports with a baseline JSON")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Relative change reported as regression")
+    args = parser.parse_args()
+
+    counts = [int(n) for n in args.topics.split(',') if n] or [None]
+    reports = {}
+    for n_topics in counts:
+        topics = generate_topics(n_topics) if n_topics else None
+        name = f"topics={len(topics) if topics else 'smartlab'},rate={args.rate:g},burst={args.burst}"
+        print(f"Running {name} for {args.duration:g} s...")
+        reports[name] = run_scenario(rate=args.rate, duration=args.duration, max_messages=args.messages,
+                                     burst=args.burst, batch_size=args.batch_size, batch_age=args.batch_age,
+                                     queue_size=args.queue_size, overflow_policy=args.overflow_policy,
+                                     workers=args.workers, rollups=not args.no_rollups, topics=topics)
+    print_report(reports)
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            regressions = compare_with_baseline(reports, json.load(f), args.tolerance)
+        print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(reports, f, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
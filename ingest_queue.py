@@ -0,0 +1,142 @@
+import threading
+import time
+from collections import deque
+
+# Overflow policies for a full queue
+BLOCK = 'block'                # Wait for space (backpressure on the producer)
+DROP_OLDEST = 'drop_oldest'    # Discard the oldest pending reading
+COALESCE = 'coalesce'          # Replace the pending reading of the same topic, else drop the oldest
+OVERFLOW_POLICIES = (BLOCK, DROP_OLDEST, COALESCE)
+
+class IngestQueue:
+    """Bounded producer/consumer stage between MQTT on_message and the storage callback.
+
+    put() is called on paho's network thread and only enqueues; worker threads call
+    save_callback(sensor_data) for each reading. When the queue holds maxsize readings,
+    overflow_policy decides whether put() blocks, drops the oldest reading or coalesces
+    it with a pending reading of the same topic.
+    """
+
+    def __init__(self, save_callback, maxsize=10000, overflow_policy=DROP_OLDEST, num_workers=1):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{overflow_policy}', expected one of {OVERFLOW_POLICIES}")
+        self.save_callback = save_callback
+        self.maxsize = maxsize
+        self.overflow_policy = overflow_policy
+        self.num_workers = num_workers
+        # Each entry is a mutable cell [sensor_data, enqueue_time] so coalescing can replace it in place
+        self._items = deque()
+        self._pending_by_topic = {}
+        self._cond = threading.Condition()
+        self._workers = []
+        self._stopping = False
+        # Counters
+        self._enqueued = 0
+        self._processed = 0
+        self._dropped = 0
+        self._coalesced = 0
+        self._errors = 0
+        self._max_depth = 0
+        self._lag_total = 0.0
+        self._last_lag = 0.0
+        self._max_lag = 0.0
+
+    # Function to start the worker threads
+    def start(self):
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._run, name=f"IngestWorker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        return self
+
+    # Function to enqueue one reading (used as the MQTT save_callback)
+    def put(self, sensor_data):
+        topic = sensor_data['id']
+        with self._cond:
+            if self._stopping:
+                self._dropped += 1
+                return
+            if len(self._items) >= self.maxsize:
+                if self.overflow_policy == BLOCK:
+                    while len(self._items) >= self.maxsize and not self._stopping:
+                        self._cond.wait()
+                    if self._stopping:
+                        self._dropped += 1
+                        return
+                elif self.overflow_policy == COALESCE and topic in self._pending_by_topic:
+                    # Keep the queue position and the original enqueue time, only update the reading
+                    self._pending_by_topic[topic][0] = sensor_data
+                    self._coalesced += 1
+                    return
+                else:
+                    self._discard_oldest()
+
+            cell = [sensor_data, time.monotonic()]
+            self._items.append(cell)
+            self._pending_by_topic[topic] = cell
+            self._enqueued += 1
+            self._max_depth = max(self._max_depth, len(self._items))
+            self._cond.notify_all()
+
+    # Function to process what is still queued and stop the workers
+    def stop(self, timeout=None):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join(timeout)
+        self._workers = []
+
+    # Function to get a snapshot of the queue counters
+    def stats(self):
+        with self._cond:
+            return {
+                "depth": len(self._items),
+                "max_depth": self._max_depth,
+                "enqueued": self._enqueued,
+                "processed": self._processed,
+                "dropped": self._dropped,
+                "coalesced": self._coalesced,
+                "errors": self._errors,
+                "last_lag_ms": self._last_lag * 1000,
+                "avg_lag_ms": self._lag_total / self._processed * 1000 if self._processed else 0.0,
+                "max_lag_ms": self._max_lag * 1000,
+            }
+
+    def _discard_oldest(self):
+        cell = self._items.popleft()
+        self._forget(cell)
+        self._dropped += 1
+
+    def _forget(self, cell):
+        topic = cell[0]['id']
+        if self._pending_by_topic.get(topic) is cell:
+            del self._pending_by_topic[topic]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._items and not self._stopping:
+                    self._cond.wait()
+                if not self._items:
+                    return  # Stopping and drained
+                cell = self._items.popleft()
+                self._forget(cell)
+                self._cond.notify_all()  # Wake producers blocked on a full queue
+
+            sensor_data, enqueued_at = cell
+            try:
+                self.save_callback(sensor_data)
+                failed = False
+            except Exception as e:
+                failed = True
+                print(f"Error saving data: {e}")
+            lag = time.monotonic() - enqueued_at
+
+            with self._cond:
+                if failed:
+                    self._errors += 1
+                self._processed += 1
+                self._lag_total += lag
+                self._last_lag = lag
+                self._max_lag = max(self._max_lag, lag)
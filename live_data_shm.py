@@ -0,0 +1,209 @@
+import os
+import threading
+import time
+from multiprocessing import shared_memory
+import numpy as np
+from sensor_status import status_level
+
+# Segment layout: header | topic names | one slot per topic
+#   header: magic, layout version, number of topics, ring size, writer process id, global sequence counter
+#   names:  UTF-8 topics, cut to TOPIC_NAME_BYTES on a character boundary
+#   slot:   seq (seqlock: odd while being written), latest ts (epoch ms) / value / status level,
+#           index of the next ring entry and a ring of the most recent (ts, value) samples
+MAGIC = 0x4C495645  # 'LIVE'
+LAYOUT_VERSION = 2
+TOPIC_NAME_BYTES = 160
+HEADER_DTYPE = np.dtype([('magic', '<u4'), ('version', '<u4'), ('n_topics', '<u4'),
+                         ('ring_size', '<u4'), ('pid', '<u4'), ('reserved', '<u4'), ('seq', '<u8')])
+
+# Function to encode a topic as a segment name, never cutting a multi-byte character in half
+def encode_topic_name(topic):
+    return topic.encode('utf-8')[:TOPIC_NAME_BYTES].decode('utf-8', errors='ignore').encode('utf-8')
+
+# Function to check whether a process still runs (POSIX)
+def _process_alive(pid):
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)  # Signal 0 only checks that the process exists
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Exists, owned by another user
+    return True
+
+# Function to get the writer process id of an existing segment, 0 if it isn't a (complete) live data segment
+def _segment_owner(name):
+    shm = _attach(name)
+    try:
+        if shm.size < HEADER_DTYPE.itemsize:
+            return 0
+        header = np.ndarray((), dtype=HEADER_DTYPE, buffer=shm.buf)
+        owner = int(header['pid']) if header['magic'] == MAGIC and header['version'] == LAYOUT_VERSION else 0
+        del header  # Drop the view before closing the buffer
+        return owner
+    finally:
+        shm.close()
+
+def slot_dtype(ring_size):
+    return np.dtype([('seq', '<u8'), ('ts', '<i8'), ('value', '<f8'), ('status', '<i4'), ('ring_next', '<u4'),
+                     ('ring_ts', '<i8', (ring_size,)), ('ring_value', '<f8', (ring_size,))])
+
+def _segment_views(buf, n_topics, ring_size):
+    header = np.ndarray((), dtype=HEADER_DTYPE, buffer=buf)
+    names = np.ndarray((n_topics,), dtype=f'S{TOPIC_NAME_BYTES}', buffer=buf, offset=HEADER_DTYPE.itemsize)
+    slots = np.ndarray((n_topics,), dtype=slot_dtype(ring_size), buffer=buf,
+                       offset=HEADER_DTYPE.itemsize + names.nbytes)
+    return header, names, slots
+
+class LiveDataWriter:
+    """Publishes the latest value, timestamp and status per topic into a shared memory segment.
+
+    Created by main.py; other processes (the Blender add-on) attach with LiveDataReader.
+    Each topic slot is guarded by a sequence lock so readers never block the writer:
+    the slot's seq is odd while it is being written and even when consistent.
+    """
+
+    def __init__(self, topics, ring_size=64, name='cic_dt_smartlab_live'):
+        self.topics = list(topics)
+        self.ring_size = ring_size
+        self.name = name
+        self._index = {topic: i for i, topic in enumerate(self.topics)}
+        size = HEADER_DTYPE.itemsize + TOPIC_NAME_BYTES * len(self.topics) + slot_dtype(ring_size).itemsize * len(self.topics)
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Windows removes a segment with its last handle, so it still exists only while in use. On POSIX it
+            # may be left over from a run that didn't shut down cleanly: removed only once its writer is gone.
+            owner = _segment_owner(name)
+            if os.name != 'posix' or _process_alive(owner):
+                raise RuntimeError(f"Shared memory segment '{name}' is in use"
+                                   f"{f' by process {owner}' if owner else ''}: is main.py already running? "
+                                   f"Stop it or set another live_data_shm_name.") from None
+            print(f"Removing the shared memory segment '{name}' left over by a previous run.")
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+
+        self.header, self.names, self.slots = _segment_views(self.shm.buf, len(self.topics), ring_size)
+        self.slots[:] = np.zeros((), dtype=self.slots.dtype)
+        self.slots['value'] = np.nan
+        self.slots['status'] = -1
+        self.names[:] = [encode_topic_name(topic) for topic in self.topics]
+        self.header['n_topics'] = len(self.topics)
+        self.header['ring_size'] = ring_size
+        self.header['pid'] = os.getpid()
+        self.header['version'] = LAYOUT_VERSION
+        self.header['seq'] = 0
+        self.header['magic'] = MAGIC  # Written last: readers only accept a fully initialized segment
+        self._lock = threading.Lock()  # Several ingest workers may publish at once
+
+    # Function to publish one reading (sensor_data dict of mqtt_client); topics not in the segment are ignored
+    def publish(self, sensor_data):
+        i = self._index.get(sensor_data['id'])
+        if i is None:
+            return
+        ts, value = sensor_data['timestamp'], sensor_data['value']
+        status = status_level(sensor_data['id'], value)
+        slot = self.slots[i:i + 1]
+        with self._lock:
+            seq = int(slot['seq'][0])
+            slot['seq'] = seq + 1  # Odd: write in progress
+            slot['ts'] = ts
+            slot['value'] = value
+            slot['status'] = status
+            ring_next = int(slot['ring_next'][0])
+            self.slots['ring_ts'][i, ring_next] = ts
+            self.slots['ring_value'][i, ring_next] = value
+            slot['ring_next'] = (ring_next + 1) % self.ring_size
+            slot['seq'] = seq + 2  # Even: consistent again
+            self.header['seq'] += 1
+
+    # Function to release the segment; the creator also removes it
+    def close(self):
+        self.header = self.names = self.slots = None  # Drop the views before closing the buffer
+        self.shm.close()
+        self.shm.unlink()
+
+class LiveDataReader:
+    """Lock-free reader of the segment published by LiveDataWriter.
+
+    sequence() is a cheap "did anything change" check; latest() and latest_all() return
+    consistent snapshots by retrying slots whose sequence lock changed during the copy.
+    """
+
+    def __init__(self, name='cic_dt_smartlab_live'):
+        self.shm = _attach(name)
+        header = np.ndarray((), dtype=HEADER_DTYPE, buffer=self.shm.buf)
+        if header['magic'] != MAGIC or header['version'] != LAYOUT_VERSION:
+            self.shm.close()
+            raise ValueError(f"Shared memory segment '{name}' is not a live data segment (yet)")
+        self.ring_size = int(header['ring_size'])
+        self.header, names, self.slots = _segment_views(self.shm.buf, int(header['n_topics']), self.ring_size)
+        self.topics = [n.decode('utf-8', errors='ignore') for n in names]
+        self._index = {topic: i for i, topic in enumerate(self.topics)}
+
+    # Function to get the slot of a topic, also for topics longer than the stored names
+    def _slot_of(self, topic):
+        i = self._index.get(topic)
+        if i is None and len(topic) * 4 > TOPIC_NAME_BYTES:
+            i = self._index.get(encode_topic_name(topic).decode('utf-8'))
+        return i
+
+    # Function to get the global sequence counter (changes on every published reading)
+    def sequence(self):
+        return int(self.header['seq'])
+
+    def _read_slot(self, i, fields):
+        while True:
+            seq = int(self.slots['seq'][i])
+            if seq % 2 == 0:
+                data = self.slots[fields][i].copy()
+                if int(self.slots['seq'][i]) == seq:
+                    return seq, data
+            time.sleep(0)  # Writer is mid-update; yield and retry
+
+    # Function to get (ts, value, status level, seq) of one topic, None for unknown topics
+    def latest(self, topic):
+        i = self._slot_of(topic)
+        if i is None:
+            return None
+        seq, data = self._read_slot(i, ['ts', 'value', 'status'])
+        return int(data['ts']), float(data['value']), int(data['status']), seq
+
+    # Function to get consistent copies of the latest ts, value, status and seq arrays of all topics
+    def latest_all(self):
+        seq = self.slots['seq'].copy()
+        data = self.slots[['ts', 'value', 'status']].copy()
+        # Slots written during the copy are re-read one by one
+        dirty = np.flatnonzero((seq % 2 == 1) | (self.slots['seq'] != seq))
+        for i in dirty:
+            seq[i], data[i] = self._read_slot(i, ['ts', 'value', 'status'])
+        return {"topics": self.topics, "ts": data['ts'], "value": data['value'],
+                "status": data['status'], "seq": seq}
+
+    # Function to get the recent (times, values) samples of one topic, oldest first
+    def recent(self, topic):
+        i = self._slot_of(topic)
+        if i is None:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        seq, data = self._read_slot(i, ['ring_next', 'ring_ts', 'ring_value'])
+        count = min(seq // 2, self.ring_size)
+        order = (np.arange(-count, 0) + int(data['ring_next'])) % self.ring_size
+        return data['ring_ts'][order], data['ring_value'][order]
+
+    def close(self):
+        self.header = self.slots = None  # Drop the views before closing the buffer
+        self.shm.close()
+
+# Function to attach to an existing segment without letting this process's resource tracker remove it on exit
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        if os.name == 'posix':
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
@@ -1,15 +1,21 @@
-import threading
 import os
-import time
-import json
-from mqtt_client import setup_mqtt
-from database import connect_db, create_sensor_table, clear_old_data, save_sensor_data, save_to_history, fetch_sensor_data
+import threading
+import mqtt_client
+from mqtt_client import setup_mqtt_brokers
+from database import connect_db, create_sensor_table, clear_old_data, DEFAULT_SITE_ID
+from db_writer import SensorDataWriter
+from ingest_queue import IngestQueue
+from retention import RetentionManager, enable_incremental_vacuum
+from ring_buffer import RingBufferStore
+from payload_decoders import PayloadDecoderRegistry
+from mqtt_replay import MqttCapture, MqttReplay
+from live_data_shm import LiveDataWriter
 from visualization import visualize_real_time_data
+from topic_channel import TopicSubscriber, read_selection
 from dt_config import CONFIG  
 
 # Path for the shared file (you might set a specific directory here)
 TOPIC_FILE_PATH = CONFIG['TOPIC_FILE_PATH'] # Update to a specific path accessible by both programs
-last_mod_time = None # Track the last modification time of the file
 visual_topic = None
 visualization_running = True
 stop_monitoring = False
@@ -17,80 +23,155 @@ visual_topic_lock = threading.Lock()  # Lock for thread safety
 visual_topic_updated_event = threading.Event()  # Event to signal topic updates
 
 def read_visual_topic():
-    """Reads the selected topic from the shared file, if it has changed."""
-    global last_mod_time, visual_topic
-
-    try:
-        # Get the current modification time of the file
-        current_mod_time = os.path.getmtime(TOPIC_FILE_PATH)
-
-        with visual_topic_lock:
-            # Check if the file has been modified since the last read
-            if last_mod_time is None or current_mod_time != last_mod_time:
-                last_mod_time = current_mod_time  # Update the last modification time
-
-                # Open and read the file content
-                with open(TOPIC_FILE_PATH, "r") as f:
-                    data = json.load(f)
-                    visual_topic = data.get("visual_topic")  # Update global visual_topic
-                    print(f"Topic updated to: {visual_topic}")  # Logging
-            # Return the updated visual_topic
-            return visual_topic
-
-    except FileNotFoundError:
-        print("Error: Topic file not found.")
-        return None  # Return None if the file doesn't exist
-    except json.JSONDecodeError:
-        print("Error: JSON decoding issue in the topic file.")
-        return None  # Return None if JSON format is invalid
-
-# Function to monitor the visual_topic update
-def monitor_visual_topic_update():
+    """Reads the selected topics from the shared file (written atomically by Blender)."""
+    global visual_topic
+    with visual_topic_lock:
+        visual_topic = read_selection(TOPIC_FILE_PATH)
+        return visual_topic
+
+# Function to store a selection pushed by the topic channel
+def on_visual_topic_update(topics):
     global visual_topic
+    with visual_topic_lock:
+        visual_topic = topics
+    print(f"visual_topic updated: {visual_topic}")
+    visual_topic_updated_event.set()  # Signal topic change
+
+# Function to monitor the visual_topic update (changes are pushed, nothing is polled while connected)
+def monitor_visual_topic_update():
+    subscriber = TopicSubscriber(TOPIC_FILE_PATH, CONFIG['topic_channel_host'], CONFIG['topic_channel_port'],
+                                 callback=on_visual_topic_update).start()
     while not stop_monitoring:
-        new_visual_topic = read_visual_topic()  # Function that gets the latest visual_topic value
-        with visual_topic_lock:
-            if new_visual_topic != visual_topic:
-                visual_topic = new_visual_topic
-                print(f"visual_topic updated: {visual_topic}")
-                visual_topic_updated_event.set()  # Signal topic change
-        time.sleep(1)
-
-# Main function to start the MQTT client and visualization
-def main(realtime_db_path, history_db_path, mqtt_broker, mqtt_port, mqtt_topic):
+        subscriber.changed.wait(1)
+        subscriber.changed.clear()
+    subscriber.stop()
+
+# Main function to start the MQTT clients and visualization
+# brokers: list of {"site_id", "host", "port", "topics"} (CONFIG['brokers']); mqtt_topics: the SmartLab topics
+def main(realtime_db_path, history_db_path, brokers, mqtt_topics):
     global visualization_running, stop_monitoring
 
-    # Connect to the database and ensure the sensor_data table exists
-    conn = connect_db(realtime_db_path)
-    create_sensor_table(conn)
-    # Clear the old data before saving new sensor data
-    clear_old_data(conn)  
-    conn.close()
+    # The realtime database is optional: the plots read the in-memory ring buffers
+    realtime_sqlite = CONFIG['realtime_sqlite']
+
+    # Replayed readings only feed the ring buffers and shared memory, never the configured databases;
+    # they are stored only in mqtt_replay_db_path when it is set (a scratch database)
+    replaying = bool(CONFIG['mqtt_replay_path'])
+    if replaying:
+        replay_db_path = CONFIG['mqtt_replay_db_path']
+        if replay_db_path and os.path.abspath(replay_db_path) in (os.path.abspath(history_db_path),
+                                                                  os.path.abspath(realtime_db_path)):
+            print(f"Refusing to replay into {replay_db_path}: mqtt_replay_db_path must not be the history or "
+                  f"realtime database.")
+            return
+        realtime_sqlite = False
+        history_db_path = replay_db_path
+    if realtime_sqlite:
+        # Connect to the database and ensure the sensor_data table exists
+        conn = connect_db(realtime_db_path)
+        create_sensor_table(conn)
+        # Clear the old data before saving new sensor data
+        clear_old_data(conn)  
+        conn.close()
 
     # Also connect to the history database and ensure the sensor_data table exists
-    history_conn = connect_db(history_db_path)
-    create_sensor_table(history_conn)
-    history_conn.close()
-
-    # Function to save data to both databases
-    def save_both_databases(sensor_data):
-        save_sensor_data(sensor_data, realtime_db_path)  # Save to real-time database
-        save_to_history(sensor_data, history_db_path)    # Save to history database
-    
-    # Start the MQTT client in a separate thread
-    mqtt_thread = threading.Thread(target=setup_mqtt, args=(mqtt_broker, mqtt_port, mqtt_topic, save_both_databases))
-    mqtt_thread.start()
-    print("MQTT client started")  # Debugging: Check if MQTT client thread starts
+    if history_db_path:
+        history_conn = connect_db(history_db_path)
+        create_sensor_table(history_conn)
+        history_conn.close()
+        # One-time switch to incremental vacuum, before the writer holds the database
+        enable_incremental_vacuum(history_db_path)
+
+    # Realtime tier: fixed-size ring buffer per topic holding the last realtime_window seconds
+    realtime_buffers = RingBufferStore(CONFIG['realtime_buffer_capacity'], CONFIG['realtime_window'])
+
+    # Latest reading per topic in shared memory, read by the Blender add-on without SQLite
+    live_data = LiveDataWriter(CONFIG['mqtt_topics'], CONFIG['live_data_ring_size'], CONFIG['live_data_shm_name'])
+
+    # One long-lived writer batches the readings into the databases (none when replaying without a scratch database)
+    db_paths = [realtime_db_path] if realtime_sqlite else []
+    if history_db_path:
+        db_paths.append(history_db_path)
+    writer = None
+    if db_paths:
+        writer = SensorDataWriter(db_paths,
+                                  batch_size=CONFIG['db_batch_size'],
+                                  batch_age=CONFIG['db_batch_age'],
+                                  rollup_db_paths=[history_db_path])
+        writer.start()
+
+    # Function to queue a reading for the databases
+    def store_in_databases(sensor_data):
+        if writer is not None:
+            writer.put(sensor_data)
+
+    # Function to store a reading in the realtime tier and queue it for the databases
+    def store_reading(sensor_data):
+        realtime_buffers.append(sensor_data)
+        live_data.publish(sensor_data)
+        store_in_databases(sensor_data)
+
+    # One bounded queue per site so slow disk writes never stall the MQTT network loops (brokers of the
+    # same site share it); only the SmartLab site feeds the realtime tier shown in the plots and in Blender
+    ingests = {}
+    def make_save_callback(site_id):
+        if site_id in ingests:
+            return ingests[site_id].put
+        ingests[site_id] = IngestQueue(store_reading if site_id == DEFAULT_SITE_ID else store_in_databases,
+                                       maxsize=CONFIG['ingest_queue_size'],
+                                       overflow_policy=CONFIG['ingest_overflow_policy'],
+                                       num_workers=CONFIG['ingest_workers']).start()
+        return ingests[site_id].put
+
+    # Retention runs in its own thread with short chunked transactions (not on a replay's scratch database)
+    retention = None
+    if not replaying:
+        retention = RetentionManager(history_db_path, CONFIG['retention'],
+                                     interval=CONFIG['retention_interval'],
+                                     chunk_size=CONFIG['retention_chunk_size'])
+        retention.start()
+
+    mqtt_client.print_readings = CONFIG['print_readings']
+    decoders = PayloadDecoderRegistry(CONFIG['payload_decoders'], CONFIG['payload_default_decoder'])
+    capture = replay = None
+    clients = []
+    if replaying:
+        # Offline: replay a capture through the same ingest path instead of connecting to the brokers
+        replay = MqttReplay(CONFIG['mqtt_replay_path'], make_save_callback, CONFIG['mqtt_replay_speed'],
+                            CONFIG['mqtt_replay_loop'], decoders=decoders).start()
+        print(f"Replaying MQTT capture {CONFIG['mqtt_replay_path']}"
+              f"{f' into {history_db_path}' if history_db_path else ' (not stored in a database)'}")
+    else:
+        # Start the MQTT clients (their network loops run in paho's own threads)
+        capture = MqttCapture(CONFIG['mqtt_capture_path']) if CONFIG['mqtt_capture_path'] else None
+        clients = setup_mqtt_brokers(brokers, make_save_callback, mqtt_topics, CONFIG['subscribe_collapse_threshold'],
+                                     decoders, capture)
+        print("MQTT client started")  # Debugging: Check if MQTT client starts
 
     # Start the real-time visualization in the main thread
-    visualize_real_time_data(realtime_db_path, TOPIC_FILE_PATH)        
-       
-    # Wait for the MQTT thread to finish
-    mqtt_thread.join()    
+    visualize_real_time_data(realtime_buffers, TOPIC_FILE_PATH)        
+
+    # Stop receiving, then flush whatever is still queued
+    for client in clients:
+        client.loop_stop()
+        client.disconnect()
+    if replay is not None:
+        replay.stop()
+    if capture is not None:
+        capture.close()
+    if retention is not None:
+        retention.stop()
+    for site_id, ingest in ingests.items():
+        ingest.stop()
+        print(f"Ingest queue of site '{site_id}' stopped: {ingest.stats()}")
+    print(f"Payload decoders: {decoders.stats()}")
+    if writer is not None:
+        writer.stop()
+        print(f"Database writer stopped: {writer.stats()}")
+    live_data.close()
 
 if __name__ == "__main__":        
     #download_ifc_file(CONFIG['ifc_file_id'],CONFIG['ifc_file']) 
     main(CONFIG['realtime_db_path'], CONFIG['history_db_path'], 
-        CONFIG['mqtt_broker'], CONFIG['mqtt_port'], 
-        CONFIG['mqtt_topics'])
+        CONFIG['brokers'], CONFIG['mqtt_topics'])
     #monitor_visual_topic_update()
\ No newline at end of file
@@ -1,11 +1,16 @@
-import pandas as pd
+import csv
+import json
+import os
+import threading
 import time
-from dt_config import CONFIG 
+from collections import deque
+from concurrent.futures import Future, wait
+from dt_config import CONFIG, load_cached
+from payload_decoders import epoch_clock
 import paho.mqtt.client as mqtt
 
-current_payload = ''
-
 def link_data_from_xlsx(xlsx_file):    
+    import pandas as pd  # Only needed for Excel files
     xlsx = pd.ExcelFile(xlsx_file)
     # read the first sheet, skip first row and use second row as header
     df = xlsx.parse(xlsx.sheet_names[0],skiprows=[0], header=0)
@@ -17,65 +22,296 @@ def link_data_from_xlsx(xlsx_file):
     link_dict = topic_guid.to_dict('records')
     return link_dict
 
+# Function to read the FullTopic -> IFC Device GUID mapping of the topic CSV (with the csv module, no pandas)
 def link_data_from_csv(csv_file):    
     try:
-        # Attempt to read the CSV file, skipping bad lines
-        df = pd.read_csv(csv_file, sep=';',header=0, encoding='utf-8', on_bad_lines='skip')
+        # Attempt to read the CSV file as utf-8, without the BOM Excel writes
+        with open(csv_file, newline='', encoding='utf-8-sig') as f:
+            rows = list(csv.reader(f, delimiter=';'))
     except UnicodeDecodeError:
         # Fall back to a different encoding if utf-8 fails
-        df = pd.read_csv(csv_file, sep=';',header=0, encoding='ISO-8859-1', on_bad_lines='skip')    
-    # Drop empty rows (no value in column 'IFC Target GUID')
-    df.dropna(subset=['IFC Device GUID'], inplace=True)     
-    # Drop unnamed columns
-    df = df.loc[:, ~df.columns.astype(str).str.contains('^Unnamed')]    
-    # Select relevant columns and convert to a dictionary
-    topic_guid = df[['FullTopic', 'IFC Device GUID']]
-    link_dict = topic_guid.set_index('FullTopic')['IFC Device GUID'].to_dict()    
+        with open(csv_file, newline='', encoding='ISO-8859-1') as f:
+            rows = list(csv.reader(f, delimiter=';'))
+    header = rows[0]
+    topic_column, guid_column = header.index('FullTopic'), header.index('IFC Device GUID')
+    link_dict = {}
+    for row in rows[1:]:
+        # Skip bad lines (more fields than the header) and rows without a device GUID
+        if len(row) > len(header) or len(row) <= guid_column or not row[guid_column]:
+            continue
+        topic = row[topic_column] if len(row) > topic_column and row[topic_column] else None
+        link_dict[topic] = row[guid_column]
     return link_dict
 
+# Function to get the actuator links, parsed once per version of the CSV file
+def load_actuator_ifc_link():
+    return load_cached('actuator_ifc_link', [CONFIG["mqtt_csv"]], lambda: link_data_from_csv(CONFIG["mqtt_csv"]))
+
+class ActuatorClient:
+    """Long-lived MQTT connection for actuator commands, shared by all calls (see get_actuator_client).
+
+    The connection is opened in the background and re-established by paho's network thread.
+    publish() returns a Future resolved with the round trip in ms once the broker confirmed
+    the message (PUBACK for QoS 1); messages published while disconnected are sent on reconnect.
+    stats() reports the latencies of the last latency_window confirmed messages.
+    """
+
+    def __init__(self, broker, port, qos=1, latency_window=1000):
+        self.qos = qos
+        self._lock = threading.Lock()
+        self._pending = {}  # mid -> (Future, publish time)
+        self._early_acks = {}  # mid -> ack time, for acks that arrive before publish() registered the mid
+        self._latencies = deque(maxlen=latency_window)
+        self.published = 0
+        self.confirmed = 0
+        self.connected = threading.Event()
+        self._subscriptions = []  # (topics, callback(topic, payload)), subscribed again on every connect
+        self.client = mqtt.Client()
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_publish = self._on_publish
+        self.client.on_message = self._on_message
+        self.client.reconnect_delay_set(1, 30)
+        self.client.connect_async(broker, port, 60)
+        self.client.loop_start()
+
+    def _on_connect(self, client, userdata, flags, rc, *args):
+        print(f"Actuator client connected to the MQTT broker (rc={rc})")
+        for topics, _ in list(self._subscriptions):
+            if topics:
+                client.subscribe([(topic, 0) for topic in topics])
+        self.connected.set()
+
+    def _on_message(self, client, userdata, msg):
+        for _, callback in list(self._subscriptions):
+            callback(msg.topic, msg.payload)
+
+    # Function to receive the messages of topics (one SUBSCRIBE packet, renewed after reconnects)
+    def subscribe(self, topics, callback):
+        topics = list(topics)
+        self._subscriptions.append((topics, callback))
+        if self.connected.is_set() and topics:
+            self.client.subscribe([(topic, 0) for topic in topics])
+
+    def _on_disconnect(self, client, userdata, *args):
+        self.connected.clear()
+
+    # Called by paho's network thread (holding paho's message lock) when the broker confirmed a message
+    def _on_publish(self, client, userdata, mid, *args):
+        now = time.perf_counter()
+        with self._lock:
+            entry = self._pending.pop(mid, None)
+            if entry is None:
+                self._early_acks[mid] = now
+                return
+        self._resolve(entry, now)
+
+    def _resolve(self, entry, ack_time):
+        future, sent = entry
+        latency_ms = (ack_time - sent) * 1000
+        with self._lock:
+            self._latencies.append(latency_ms)
+            self.confirmed += 1
+        future.set_result(latency_ms)
+
+    # Function to publish a payload; returns a Future of the round trip in ms
+    def publish(self, topic, payload, qos=None):
+        future = Future()
+        sent = time.perf_counter()
+        # Not under self._lock: paho calls _on_publish with its own lock held (lock order)
+        info = self.client.publish(topic, payload, self.qos if qos is None else qos)
+        if info.rc not in (mqtt.MQTT_ERR_SUCCESS, mqtt.MQTT_ERR_NO_CONN):
+            future.set_exception(RuntimeError(f"Publishing to {topic} failed: {mqtt.error_string(info.rc)}"))
+            return future
+        with self._lock:
+            self.published += 1
+            ack_time = self._early_acks.pop(info.mid, None)
+            if ack_time is None:
+                self._pending[info.mid] = (future, sent)
+                return future
+        self._resolve((future, sent), ack_time)
+        return future
+
+    # Function to publish several (topic, payload) pairs back to back, e.g. a scene; returns their Futures
+    def publish_many(self, commands, qos=None):
+        return [self.publish(topic, payload, qos) for topic, payload in commands]
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            pending = len(self._pending)
+        return {
+            "connected": self.connected.is_set(),
+            "published": self.published,
+            "confirmed": self.confirmed,
+            "pending": pending,
+            "avg_ms": sum(latencies) / len(latencies) if latencies else None,
+            "p50_ms": latencies[len(latencies) // 2] if latencies else None,
+            "p99_ms": latencies[int(len(latencies) * 0.99)] if latencies else None,
+            "max_ms": latencies[-1] if latencies else None,
+        }
+
+    def close(self):
+        self.client.disconnect()
+        self.client.loop_stop()
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for future, _ in pending.values():
+            future.cancel()
+
+_actuator_client = None
+_actuator_client_lock = threading.RLock()  # Reentrant: get_actuator_state() gets the client while holding it
+
+# Function to get the shared actuator client, connected on first use
+def get_actuator_client():
+    global _actuator_client
+    with _actuator_client_lock:
+        if _actuator_client is None:
+            _actuator_client = ActuatorClient(CONFIG['mqtt_broker'], CONFIG['mqtt_port'], CONFIG['actuator_qos'])
+        return _actuator_client
+
+# Function to close the shared actuator client (e.g. when the Blender add-on is unregistered)
+def close_actuator_client():
+    global _actuator_client, _actuator_state
+    with _actuator_client_lock:
+        if _actuator_client is not None:
+            _actuator_client.close()
+            _actuator_client = None
+        if _actuator_state is not None:
+            _actuator_state.close()
+            _actuator_state = None
+
+# Function to send a payload to an actuator; returns a Future of the confirmation round trip in ms
 def actuator_control(topic, payload):
-    # Create an MQTT client instance
-    client = mqtt.Client()
-    # Connect to the broker
-    client.connect(CONFIG['mqtt_broker'], CONFIG['mqtt_port'], 60)  
-    # Publish the value to the topic
-    client.publish(topic, payload)
-    # Disconnect the client
-    client.disconnect()
+    future = get_actuator_client().publish(topic, payload)
     print(f"Value '{payload}' published to topic '{topic}'.")
 
+    def report(f):
+        if not f.cancelled() and f.exception() is None:
+            print(f"Value '{payload}' on topic '{topic}' confirmed in {f.result():.1f} ms")
+    future.add_done_callback(report)
+    return future
+
+# Function to send payloads to several actuators at once, e.g. {"...Bedroom-Light-M1-Dim>": 50, ...};
+# waits up to timeout seconds for the confirmations and returns the topics that weren't confirmed
+def actuator_control_many(payloads, timeout=None):
+    topics = list(payloads)
+    futures = get_actuator_client().publish_many((topic, payloads[topic]) for topic in topics)
+    done, _ = wait(futures, CONFIG['actuator_publish_timeout'] if timeout is None else timeout)
+    missing = [topic for topic, future in zip(topics, futures) if future not in done or future.exception() is not None]
+    print(f"{len(topics) - len(missing)} of {len(topics)} actuator values confirmed")
+    return missing
+
+class ActuatorStateCache:
+    """Latest payload and receive time (epoch ms) of each actuator topic.
+
+    Fed by a subscription on the shared actuator connection, so get() never waits.
+    wait_for_newer() blocks until a topic has a value received after a given time. With a
+    persist_path the values are saved every save_interval seconds (when changed) and on
+    close(), and loaded again on start, so the last known states survive restarts.
+    """
+
+    def __init__(self, persist_path=None, save_interval=10):
+        self.persist_path = persist_path
+        self._values = {}  # topic -> (payload, ts)
+        self._changed = threading.Condition()
+        self._dirty = False
+        self._stop_event = threading.Event()
+        self._saver = None
+        if persist_path:
+            self.load()
+            self._saver = threading.Thread(target=self._save_periodically, args=(save_interval,),
+                                           name="actuator-state-saver", daemon=True)
+            self._saver.start()
+
+    # Function to store a received payload (subscription callback)
+    def update(self, topic, payload, ts=None):
+        value = (payload.decode('utf-8', errors='replace') if isinstance(payload, bytes) else payload,
+                 epoch_clock.now_ms() if ts is None else ts)
+        with self._changed:
+            self._values[topic] = value
+            self._dirty = True
+            self._changed.notify_all()
+
+    # Function to get the (payload, ts) of a topic, (None, None) if nothing was received yet
+    def get(self, topic):
+        return self._values.get(topic, (None, None))
+
+    # Function to wait until a topic has a value received after since_ms; returns (payload, ts),
+    # or (None, None) when timeout seconds pass first
+    def wait_for_newer(self, topic, since_ms, timeout=None):
+        with self._changed:
+            newer = self._changed.wait_for(lambda: self._values.get(topic, (None, -1))[1] > since_ms, timeout)
+            return self._values[topic] if newer else (None, None)
+
+    def load(self):
+        if not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, 'r') as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not load the actuator states from {self.persist_path}: {e}")
+            return
+        with self._changed:
+            for topic, (payload, ts) in saved.items():
+                if ts > self._values.get(topic, (None, -1))[1]:
+                    self._values[topic] = (payload, ts)
+
+    def save(self):
+        with self._changed:
+            snapshot = dict(self._values)
+            self._dirty = False
+        tmp_path = self.persist_path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self.persist_path)
+        except OSError as e:
+            print(f"Could not save the actuator states to {self.persist_path}: {e}")
+
+    def _save_periodically(self, interval):
+        while not self._stop_event.wait(interval):
+            if self._dirty:
+                self.save()
+
+    def close(self):
+        self._stop_event.set()
+        if self.persist_path and self._dirty:
+            self.save()
+
+_actuator_state = None
+
+# Function to get the shared actuator state cache, subscribed to all actuator topics on first use
+def get_actuator_state():
+    global _actuator_state
+    with _actuator_client_lock:
+        if _actuator_state is None:
+            state = ActuatorStateCache(CONFIG['actuator_state_path'])
+            # Rows of the CSV without a topic are keyed by None; paho rejects empty or non-string topics
+            topics = [topic for topic in load_actuator_ifc_link() if isinstance(topic, str) and topic]
+            # Subscribed before it is shared, so no caller gets a cache that isn't fed yet
+            get_actuator_client().subscribe(topics, state.update)
+            _actuator_state = state
+        return _actuator_state
+
+# Function to get the latest payload of an actuator ('' if none was received yet), without waiting
 def actuator_payload(topic):   
-    # Callback for when a message is received
-    def on_message(client, userdata, msg):
-        #global message_received
-        global current_payload
-        current_payload = msg.payload.decode()
-        print(f"Received message: {current_payload} on topic: {msg.topic}")        
-        # Stop the MQTT client loop after receiving one message
-        client.disconnect()        
-
-    # Initialize the MQTT client
-    client = mqtt.Client()
-    # Set up the callback for message handling
-    client.on_message = on_message
-    # Connect to the MQTT broker
-    client.connect(CONFIG['mqtt_broker'], CONFIG['mqtt_port'], 60)
-    # Subscribe to the specific topic
-    client.subscribe(topic)
-    # Start the loop in a separate thread
-    print(f"Waiting for a message on topic: {topic}")
-    client.loop_start()
-    # Wait 1s to receive a message  
-    time.sleep(1)
-    client.loop_stop()
-    print("MQTT loop stopped. Exiting.")        
-    return current_payload
-
-actuator_ifc_link = link_data_from_csv(CONFIG["mqtt_csv"])
+    payload, ts = get_actuator_state().get(topic)
+    return '' if payload is None else payload
+
+# actuator_ifc_link is loaded on first use (PEP 562), not when the module is imported
+def __getattr__(name):
+    if name == 'actuator_ifc_link':
+        globals()[name] = load_actuator_ifc_link()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == '__main__':    
     from pprint import pprint      
     #pprint(actuator_ifc_link)
     topic = 'KNX/0/4/41<Actuators.DimLight.Bedroom-Light-M1-Dim>' #'KNX/0/5/0<Actuators.Curtain.Bedroom-Up|Down>'
-    print(actuator_payload(topic))
+    # Wait up to 5 s for the next value of the actuator
+    print(get_actuator_state().wait_for_newer(topic, epoch_clock.now_ms(), timeout=5))
+    close_actuator_client()
     
\ No newline at end of file
@@ -1,58 +1,169 @@
 import paho.mqtt.client as mqtt
 import json
-from datetime import datetime  # For getting the current timestamp
+import time  # For getting the current timestamp
+from database import DEFAULT_SITE_ID
+from payload_decoders import default_registry, epoch_clock
+
+# Debugging: print every decoded reading (CONFIG['print_readings']). Off by default: console output on
+# paho's network thread or the asyncio loop slows the ingestion down at high message rates.
+print_readings = False
+
+# Function to plan the subscription of a topic list: the filters to subscribe and a client-side topic check
+def subscription_plan(mqtt_topics, collapse_threshold=None):
+    """Return (filters, accept) for subscribing to mqtt_topics with one SUBSCRIBE packet.
+
+    With a collapse_threshold, first-level groups with at least that many topics (e.g. all
+    'KNX/...' topics) are subscribed as one 'KNX/#' filter. The broker then also sends other
+    topics of the group, so accept(topic) tells which messages were asked for; accept is None
+    when the filters are exact. Topics that are already filters (+ or #) are kept as they are.
+    """
+    exact = [topic for topic in mqtt_topics if '+' not in topic and '#' not in topic]
+    patterns = [topic for topic in mqtt_topics if '+' in topic or '#' in topic]
+    if not collapse_threshold:
+        return list(dict.fromkeys(mqtt_topics)), None
+
+    groups = {}
+    for topic in dict.fromkeys(exact):
+        groups.setdefault(topic.split('/', 1)[0], []).append(topic)
+    filters = list(dict.fromkeys(patterns))
+    collapsed = False
+    for level, topics in groups.items():
+        if len(topics) >= collapse_threshold and not level.startswith('$'):
+            filters.append(f"{level}/#")
+            collapsed = True
+        else:
+            filters.extend(topics)
+    if not collapsed:
+        return filters, None
+
+    wanted = set(exact)
+    def accept(topic):
+        return topic in wanted or any(mqtt.topic_matches_sub(pattern, topic) for pattern in patterns)
+    return filters, accept
+
+class InjectedMessage:
+    """The parts of a paho MQTTMessage used by on_message, for messages injected without a broker."""
+    __slots__ = ('topic', 'payload')
+
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
 
 # The callback for when a message is received from the broker
-def on_message(client, userdata, msg, save_callback):
+# site_id tags the reading with the broker's site; accept filters collapsed subscriptions (see subscription_plan)
+# decoders: payload_decoders.PayloadDecoderRegistry choosing the decoder of each topic
+# capture: mqtt_replay.MqttCapture recording the raw message; clock: timestamp source (replays use the recorded time)
+def on_message(client, userdata, msg, save_callback, site_id=DEFAULT_SITE_ID, accept=None, decoders=None,
+               capture=None, clock=None):
+    if accept is not None and not accept(msg.topic):
+        return
+    timestamp = (clock or epoch_clock).now_ms()  # Current time in epoch milliseconds, never going backwards
+    if capture is not None:
+        capture.record(msg.topic, msg.payload, site_id, timestamp)
     try:
-        # Decode the message payload from bytes to string (in this case, it's a number)
-        payload_value = float(msg.payload.decode('utf-8'))
-        
-        # Construct the sensor_data dictionary
-        sensor_data = {
-            "id": msg.topic,  # Use the topic name as the sensor ID
-            "timestamp": datetime.now().strftime('%Y-%m-%dT%H:%M:%S'),  # Current time in ISO format
-            "value": payload_value  # The value received from the payload
-        }
-        print(f"Received sensor data: {sensor_data}")
-
-        # Save the sensor data to the database
-        save_callback(sensor_data)
+        # Decode the message payload (bytes) with the decoder registered for the topic
+        payload_value = (decoders or default_registry).decode(msg.topic, msg.payload)
+
+        # Multi-value payloads are stored as one sub-topic per field
+        readings = payload_value.items() if isinstance(payload_value, dict) else ((None, payload_value),)
+        for field, value in readings:
+            # Construct the sensor_data dictionary
+            sensor_data = {
+                "id": msg.topic if field is None else f"{msg.topic}/{field}",  # Use the topic name as the sensor ID
+                "timestamp": timestamp,
+                "value": value,  # The value received from the payload
+                "site": site_id  # The site (broker) the reading comes from
+            }
+            if print_readings:
+                print(f"Received sensor data: {sensor_data}")
+
+            # Hand the sensor data over for saving (an IngestQueue.put keeps this non-blocking)
+            save_callback(sensor_data)
 
     except ValueError as e:
-        print(f"Error converting payload to float: {e}")
+        print(f"Error decoding payload: {e}")
     except Exception as e:
         print(f"Error saving data: {e}")
 
 # MQTT Setup
-def setup_mqtt(mqtt_broker, mqtt_port, mqtt_topics, save_callback):
+def setup_mqtt(mqtt_broker, mqtt_port, mqtt_topics, save_callback, site_id=DEFAULT_SITE_ID, collapse_threshold=None,
+               decoders=None, capture=None):
     client = mqtt.Client()
+    filters, accept = subscription_plan(mqtt_topics, collapse_threshold)
     # Attach on_message callback with access to the save_callback
-    client.on_message = lambda client, userdata, msg: on_message(client, userdata, msg, save_callback)
+    client.on_message = lambda client, userdata, msg: on_message(client, userdata, msg, save_callback, site_id, accept,
+                                                                 decoders, capture)
+    # Subscribe to all filters in one SUBSCRIBE packet, again after every reconnect
+    client.on_connect = lambda client, userdata, flags, rc, *args: client.subscribe([(f, 0) for f in filters])
 
     # Connect to the MQTT broker (replace with your broker address and port)
     client.connect(mqtt_broker, mqtt_port, 60)
-    for topic in mqtt_topics:
-        client.subscribe(topic)
     
     # Start the MQTT loop in a non-blocking way
     client.loop_start()
+    print(f"MQTT client for site '{site_id}' connected to {mqtt_broker}:{mqtt_port} "
+          f"({len(mqtt_topics)} topics in {len(filters)} subscriptions)")
     return client
 
+# Function to connect to every broker of CONFIG['brokers'], each with its own save callback
+# make_save_callback(site_id) returns the callback for the readings of one site (called once per broker, so
+# brokers sharing a site_id must get the same callback); capture records all brokers
+def setup_mqtt_brokers(brokers, make_save_callback, default_topics, collapse_threshold=None, decoders=None,
+                       capture=None):
+    clients = []
+    for broker in brokers:
+        site_id = broker.get('site_id', DEFAULT_SITE_ID)
+        try:
+            clients.append(setup_mqtt(broker['host'], broker['port'], broker.get('topics', default_topics),
+                                      make_save_callback(site_id), site_id,
+                                      broker.get('collapse_threshold', collapse_threshold), decoders, capture))
+        except OSError as e:
+            print(f"Error connecting to MQTT broker {broker['host']}:{broker['port']} of site '{site_id}': {e}")
+    return clients
+
 if __name__ == '__main__': 
     from dt_config import CONFIG
-    import time   
-    import threading
-    from database import save_sensor_data, save_to_history
-
-    # Function to save data to both databases
-    def save_both_databases(sensor_data):
-        save_sensor_data(sensor_data, CONFIG['realtime_db_path'])  # Save to real-time database
-        save_to_history(sensor_data, CONFIG['history_db_path'])  
-    # Start the MQTT client in a separate thread
-    mqtt_thread = threading.Thread(target=setup_mqtt, args=(CONFIG['mqtt_broker'], CONFIG['mqtt_port'], CONFIG['mqtt_topics'], save_both_databases))
-    mqtt_thread.start()
+    from db_writer import SensorDataWriter
+    from ingest_queue import IngestQueue
+    from payload_decoders import PayloadDecoderRegistry
+    from mqtt_replay import MqttCapture
+
+    # One long-lived writer batches the readings into both databases
+    writer = SensorDataWriter([CONFIG['realtime_db_path'], CONFIG['history_db_path']],
+                              batch_size=CONFIG['db_batch_size'],
+                              batch_age=CONFIG['db_batch_age'],
+                              rollup_db_paths=[CONFIG['history_db_path']]).start()
+    # One bounded queue per site (shared by its brokers) so slow disk writes never stall the MQTT network loops
+    ingests = {}
+    def make_save_callback(site_id):
+        if site_id in ingests:
+            return ingests[site_id].put
+        ingests[site_id] = IngestQueue(writer.put,
+                                       maxsize=CONFIG['ingest_queue_size'],
+                                       overflow_policy=CONFIG['ingest_overflow_policy'],
+                                       num_workers=CONFIG['ingest_workers']).start()
+        return ingests[site_id].put
+    # Start the MQTT clients (their network loops run in paho's own threads)
+    print_readings = CONFIG['print_readings']
+    decoders = PayloadDecoderRegistry(CONFIG['payload_decoders'], CONFIG['payload_default_decoder'])
+    # Capture mode: also record the raw messages for mqtt_replay.py
+    capture = MqttCapture(CONFIG['mqtt_capture_path']) if CONFIG['mqtt_capture_path'] else None
+    clients = setup_mqtt_brokers(CONFIG['brokers'], make_save_callback, CONFIG['mqtt_topics'],
+                                 CONFIG['subscribe_collapse_threshold'], decoders, capture)
     print("MQTT client started") 
     
-    while True:
-        time.sleep(1)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        for client in clients:
+            client.loop_stop()
+            client.disconnect()
+        if capture is not None:
+            capture.close()
+        for site_id, ingest in ingests.items():
+            ingest.stop()
+            print(f"Ingest queue of site '{site_id}' stopped: {ingest.stats()}")
+        print(f"Payload decoders: {decoders.stats()}")
+        writer.stop()
+        print(f"Database writer stopped: {writer.stats()}")
@@ -0,0 +1,325 @@
+import argparse
+import contextlib
+import os
+import struct
+import threading
+import time
+from database import DEFAULT_SITE_ID
+from mqtt_client import InjectedMessage, on_message
+from payload_decoders import epoch_clock
+
+# Record-and-replay of raw MQTT traffic.
+#
+# A capture is a binary append-only log. Every capture session starts with MAGIC, then holds:
+#   b'T' <topic_id uint16> <site length uint16> <topic length uint16> site topic   (topic dictionary entry)
+#   b'M' <receive time int64 epoch ms> <topic_id uint16> <payload length uint32> payload
+# Topic ids are local to a session, so an existing capture can simply be appended to. A record cut
+# short by a crash is ignored when reading.
+#
+#   python mqtt_replay.py capture local_files/capture.bin            (record the configured brokers)
+#   python mqtt_replay.py info local_files/capture.bin
+#   python mqtt_replay.py replay local_files/capture.bin --speed 10  (load test of the ingest path)
+
+MAGIC = b'\x93MQTCAP1'  # The first byte is never a record kind
+_TOPIC = struct.Struct('<HHH')
+_MESSAGE = struct.Struct('<qHI')
+MAX_TOPICS = 0xFFFF
+
+# Timestamps given to replayed readings: 'now' stamps them on replay like live messages (what the
+# real-time plots and Blender expect), 'original' keeps the recorded receive time (to rebuild a history)
+REPLAY_TIMESTAMPS = ('now', 'original')
+
+class MqttCapture:
+    """Appends raw (receive time, site, topic, payload) records to a capture file.
+
+    record() is thread-safe, so one capture can be shared by the clients of several brokers.
+    Records are buffered and flushed at most flush_interval seconds after they arrive; an
+    existing capture is appended to as a new session.
+    """
+
+    def __init__(self, path, flush_interval=1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._file = open(path, 'ab', buffering=1 << 16)
+        if self._file.tell():
+            # Appending: cut a record left incomplete by a crash, or the new session would be unreadable
+            with open(path, 'rb', buffering=1 << 16) as f:
+                end = 0
+                for end, _ in _scan_capture(f, path):
+                    pass
+            if end < self._file.tell():
+                print(f"MQTT capture {path}: dropping {self._file.tell() - end} bytes of an incomplete record")
+                self._file.truncate(end)
+                self._file.seek(end)
+        self._file.write(MAGIC)
+        self._topic_ids = {}  # (site_id, topic) -> topic id of this session
+        self._next_flush = time.monotonic() + flush_interval
+        self.records = 0
+
+    # Function to append one message; ts_ms defaults to the current time
+    def record(self, topic, payload, site_id=DEFAULT_SITE_ID, ts_ms=None):
+        if ts_ms is None:
+            ts_ms = epoch_clock.now_ms()
+        with self._lock:
+            if self._file is None:
+                return
+            topic_id = self._topic_ids.get((site_id, topic))
+            if topic_id is None:
+                if len(self._topic_ids) >= MAX_TOPICS:
+                    # Start a new session with an empty topic dictionary
+                    self._file.write(MAGIC)
+                    self._topic_ids.clear()
+                topic_id = self._topic_ids[(site_id, topic)] = len(self._topic_ids)
+                site_bytes, topic_bytes = site_id.encode('utf-8'), topic.encode('utf-8')
+                self._file.write(b'T' + _TOPIC.pack(topic_id, len(site_bytes), len(topic_bytes)) + site_bytes + topic_bytes)
+            self._file.write(b'M' + _MESSAGE.pack(ts_ms, topic_id, len(payload)))
+            self._file.write(payload)
+            self.records += 1
+            now = time.monotonic()
+            if now >= self._next_flush:
+                self._file.flush()
+                self._next_flush = now + self.flush_interval
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        print(f"MQTT capture closed: {self.records} records in {self.path}")
+
+# Function to scan an open capture: yields (end offset, record) for every complete entry, record being
+# (ts_ms, site_id, topic, payload) for messages and None for sessions and topic entries
+def _scan_capture(f, path):
+    topics = {}
+    offset = 0
+    while True:
+        kind = f.read(1)
+        if kind == b'M':
+            header = f.read(_MESSAGE.size)
+            if len(header) < _MESSAGE.size:
+                return
+            ts_ms, topic_id, payload_len = _MESSAGE.unpack(header)
+            payload = f.read(payload_len)
+            if len(payload) < payload_len or topic_id not in topics:
+                return
+            offset += 1 + _MESSAGE.size + payload_len
+            yield offset, (ts_ms,) + topics[topic_id] + (payload,)
+        elif kind == b'T':
+            header = f.read(_TOPIC.size)
+            if len(header) < _TOPIC.size:
+                return
+            topic_id, site_len, topic_len = _TOPIC.unpack(header)
+            names = f.read(site_len + topic_len)
+            if len(names) < site_len + topic_len:
+                return
+            topics[topic_id] = (names[:site_len].decode('utf-8'), names[site_len:].decode('utf-8'))
+            offset += 1 + _TOPIC.size + site_len + topic_len
+            yield offset, None
+        elif kind == MAGIC[:1] and f.read(len(MAGIC) - 1) == MAGIC[1:]:
+            topics = {}  # New session
+            offset += len(MAGIC)
+            yield offset, None
+        elif not kind:
+            return
+        else:
+            raise ValueError(f"{path} is not an MQTT capture (unexpected byte {kind!r} at {offset})")
+
+# Function to read a capture: yields (ts_ms, site_id, topic, payload) in file order
+def read_capture(path):
+    with open(path, 'rb', buffering=1 << 16) as f:
+        for _, record in _scan_capture(f, path):
+            if record is not None:
+                yield record
+
+# Function to summarize a capture: record count, sites, topics and time range
+def capture_info(path):
+    records, sites, topics, first, last = 0, set(), set(), None, None
+    for ts_ms, site_id, topic, payload in read_capture(path):
+        records += 1
+        sites.add(site_id)
+        topics.add((site_id, topic))
+        first = ts_ms if first is None else min(first, ts_ms)
+        last = ts_ms if last is None else max(last, ts_ms)
+    return {
+        "records": records,
+        "sites": sorted(sites),
+        "topics": len(topics),
+        "first_ms": first,
+        "last_ms": last,
+        "duration_s": (last - first) / 1000 if records else 0.0,
+        "bytes": os.path.getsize(path),
+    }
+
+class ReplayClock:
+    """Clock handed to on_message that returns the timestamp of the record being replayed."""
+
+    def __init__(self):
+        self.ts = 0
+
+    def now_ms(self):
+        return self.ts
+
+class MqttReplay:
+    """Feeds a capture back through mqtt_client.on_message, the ingest path of live messages.
+
+    make_save_callback(site_id) returns the save callback of a site, as for
+    mqtt_client.setup_mqtt_brokers; it is called once per site. speed is the replay rate
+    relative to the recording (0 or None: as fast as possible). With loop the capture restarts
+    at its end; 'original' timestamps are then shifted by the capture length on every pass.
+    """
+
+    def __init__(self, path, make_save_callback, speed=1.0, loop=False, timestamps='now', decoders=None):
+        if timestamps not in REPLAY_TIMESTAMPS:
+            raise ValueError(f"Unknown replay timestamps '{timestamps}', expected one of {REPLAY_TIMESTAMPS}")
+        self.path = path
+        self.make_save_callback = make_save_callback
+        self.speed = speed or 0
+        self.loop = loop
+        self.timestamps = timestamps
+        self.decoders = decoders
+        self._callbacks = {}
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.records = 0
+        self.passes = 0
+        self.elapsed = 0.0
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="mqtt-replay", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    # Function to replay the capture in the calling thread (until its end, or stop() when looping)
+    def run(self):
+        clock = ReplayClock() if self.timestamps == 'original' else None
+        offset = 0
+        start = time.perf_counter()
+        while not self._stop_event.is_set():
+            first = last = None
+            pass_start = time.perf_counter()
+            for ts_ms, site_id, topic, payload in read_capture(self.path):
+                if self._stop_event.is_set():
+                    break
+                if first is None:
+                    first = ts_ms
+                last = ts_ms
+                if self.speed:
+                    # Wait until the record is due, relative to the first record of the pass
+                    delay = pass_start + (ts_ms - first) / 1000 / self.speed - time.perf_counter()
+                    if delay > 0 and self._stop_event.wait(delay):
+                        break
+                save_callback = self._callbacks.get(site_id)
+                if save_callback is None:
+                    save_callback = self._callbacks[site_id] = self.make_save_callback(site_id)
+                if clock is not None:
+                    clock.ts = ts_ms + offset
+                on_message(None, None, InjectedMessage(topic, payload), save_callback, site_id,
+                           decoders=self.decoders, clock=clock)
+                self.records += 1
+            self.passes += 1
+            if first is None or not self.loop:
+                break
+            offset += last - first + 1
+        self.elapsed = time.perf_counter() - start
+        print(f"MQTT replay of {self.path} finished: {self.stats()}")
+
+    def stats(self):
+        return {
+            "records": self.records,
+            "passes": self.passes,
+            "elapsed_s": round(self.elapsed or 0.0, 3),
+            "records_per_sec": self.records / self.elapsed if self.elapsed else 0.0,
+        }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Record MQTT traffic or replay a capture into the databases.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    capture_parser = commands.add_parser('capture', help="Record the configured brokers to a capture file")
+    capture_parser.add_argument('path')
+    capture_parser.add_argument('--duration', type=float, default=None, help="Stop after this many seconds")
+    info_parser = commands.add_parser('info', help="Summarize a capture file")
+    info_parser.add_argument('path')
+    replay_parser = commands.add_parser('replay', help="Replay a capture through the ingest path into the databases")
+    replay_parser.add_argument('path')
+    replay_parser.add_argument('--speed', type=float, default=1.0, help="Replay rate, 0 for as fast as possible")
+    replay_parser.add_argument('--loop', action='store_true', help="Restart the capture at its end")
+    replay_parser.add_argument('--timestamps', choices=REPLAY_TIMESTAMPS, default='now')
+    replay_parser.add_argument('--db', required=True, help="Scratch database to write to (not a configured database)")
+    replay_parser.add_argument('--quiet', action='store_true', help="Print nothing while replaying")
+    args = parser.parse_args()
+
+    if args.command == 'info':
+        print(capture_info(args.path))
+    elif args.command == 'capture':
+        from dt_config import CONFIG
+        from mqtt_client import setup_mqtt_brokers
+
+        # Only record: the readings themselves are dropped
+        capture = MqttCapture(args.path)
+        clients = setup_mqtt_brokers(CONFIG['brokers'], lambda site_id: (lambda sensor_data: None),
+                                     CONFIG['mqtt_topics'], CONFIG['subscribe_collapse_threshold'], capture=capture)
+        deadline = time.monotonic() + args.duration if args.duration else None
+        try:
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                while deadline is None or time.monotonic() < deadline:
+                    time.sleep(0.5)
+        except KeyboardInterrupt:
+            pass
+        for client in clients:
+            client.loop_stop()
+            client.disconnect()
+        capture.close()
+    else:
+        from dt_config import CONFIG
+        from db_writer import SensorDataWriter
+        from ingest_queue import IngestQueue
+        from payload_decoders import PayloadDecoderRegistry
+
+        db_path = args.db
+        if os.path.abspath(db_path) in (os.path.abspath(CONFIG['history_db_path']), os.path.abspath(CONFIG['realtime_db_path'])):
+            parser.error(f"--db {db_path} is a configured database; replay into a scratch database")
+        writer = SensorDataWriter([db_path], batch_size=CONFIG['db_batch_size'], batch_age=CONFIG['db_batch_age'],
+                                  rollup_db_paths=[db_path]).start()
+        ingests = {}
+        def make_save_callback(site_id):
+            if site_id in ingests:
+                return ingests[site_id].put
+            ingests[site_id] = IngestQueue(writer.put,
+                                           maxsize=CONFIG['ingest_queue_size'],
+                                           overflow_policy=CONFIG['ingest_overflow_policy'],
+                                           num_workers=CONFIG['ingest_workers']).start()
+            return ingests[site_id].put
+        decoders = PayloadDecoderRegistry(CONFIG['payload_decoders'], CONFIG['payload_default_decoder'])
+        replay = MqttReplay(args.path, make_save_callback, args.speed, args.loop, args.timestamps, decoders)
+        quiet = open(os.devnull, 'w') if args.quiet else None
+        try:
+            with contextlib.redirect_stdout(quiet) if quiet else contextlib.nullcontext():
+                replay.start()
+                while replay.is_alive():
+                    replay.join(0.5)
+        except KeyboardInterrupt:
+            replay.stop()
+        print(f"MQTT replay: {replay.stats()}")
+        for site_id, ingest in ingests.items():
+            ingest.stop()
+            print(f"Ingest queue of site '{site_id}' stopped: {ingest.stats()}")
+        print(f"Payload decoders: {decoders.stats()}")
+        writer.stop()
+        print(f"Database writer stopped: {writer.stats()}")
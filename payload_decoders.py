@@ -0,0 +1,251 @@
+import fnmatch
+import json
+import re
+import threading
+import time
+import paho.mqtt.client as mqtt
+
+# Payload words understood as booleans (compared lower-case)
+BOOL_WORDS = {
+    b'on': 1.0, b'off': 0.0, b'true': 1.0, b'false': 0.0, b'open': 1.0, b'closed': 0.0,
+    b'yes': 1.0, b'no': 0.0, b'up': 1.0, b'down': 0.0, b'active': 1.0, b'inactive': 0.0,
+}
+
+# Leading number of payloads with a unit, e.g. b'21.5 \xc2\xb0C' or b'450ppm'
+_NUMBER_WITH_UNIT = re.compile(rb'\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)')
+
+# Decoders take the raw payload bytes and return a float, or a dict {field: float} for multi-value payloads.
+# They raise ValueError (or KeyError/TypeError/IndexError for JSON paths) for payloads they can't decode.
+
+def decode_float(payload):
+    try:
+        return float(payload)  # float() parses bytes directly, no str decode needed
+    except ValueError:
+        match = _NUMBER_WITH_UNIT.match(payload)
+        if match is None:
+            raise
+        return float(match.group(1))
+
+def decode_int(payload):
+    try:
+        return float(int(payload))
+    except ValueError:
+        return float(int(payload.strip(), 0))  # Hex/binary literals such as 0x1F
+
+def decode_bool(payload):
+    word = payload.strip().lower()
+    if word in BOOL_WORDS:
+        return BOOL_WORDS[word]
+    return 1.0 if decode_float(word) else 0.0
+
+# Function to make an enum decoder from {"payload word": number}
+def make_enum_decoder(mapping):
+    table = {str(word).lower().encode('utf-8'): float(value) for word, value in mapping.items()}
+    def decode_enum(payload):
+        word = payload.strip().lower()
+        if word not in table:
+            raise ValueError(f"unknown enum value {payload[:50]!r}")
+        return table[word]
+    return decode_enum
+
+# Function to split a JSON path such as "data.values[0].temp" into keys and list indexes
+def _parse_json_path(path):
+    steps = []
+    for part in path.split('.'):
+        name, *indexes = part.split('[')
+        if name:
+            steps.append(name)
+        steps.extend(int(index.rstrip(']')) for index in indexes)
+    return steps
+
+def _json_number(value):
+    if isinstance(value, bool):
+        return 1.0 if value else 0.0
+    if isinstance(value, str):
+        raw = value.encode('utf-8')
+        word = raw.strip().lower()
+        return BOOL_WORDS[word] if word in BOOL_WORDS else decode_float(raw)
+    if value is None:
+        raise ValueError("null value")
+    return float(value)
+
+# Function to make a decoder extracting one number from a JSON payload
+def make_json_decoder(path='value'):
+    steps = _parse_json_path(path)
+    def decode_json(payload):
+        value = json.loads(payload)
+        for step in steps:
+            value = value[step]
+        return _json_number(value)
+    return decode_json
+
+# Function to make a decoder for JSON payloads with several values; fields maps field name -> JSON path
+# (default: every numeric or boolean top-level field)
+def make_multi_decoder(fields=None):
+    paths = {name: _parse_json_path(path) for name, path in (fields or {}).items()}
+    def decode_multi(payload):
+        data = json.loads(payload)
+        if not paths:
+            return {name: _json_number(value) for name, value in data.items()
+                    if isinstance(value, (int, float, bool))}
+        values = {}
+        for name, steps in paths.items():
+            value = data
+            for step in steps:
+                value = value[step]
+            values[name] = _json_number(value)
+        return values
+    return decode_multi
+
+# Default: plain numbers first (the common KNX/M-bus case), then boolean words, units and JSON
+def decode_auto(payload):
+    try:
+        return float(payload)
+    except ValueError:
+        pass
+    word = payload.strip().lower()
+    if word in BOOL_WORDS:
+        return BOOL_WORDS[word]
+    if word[:1] in (b'{', b'['):
+        data = json.loads(payload)
+        if isinstance(data, dict):
+            for key in ('value', 'val', 'v'):
+                if key in data:
+                    return _json_number(data[key])
+        elif isinstance(data, list) and len(data) == 1:
+            return _json_number(data[0])
+        raise ValueError(f"no value in JSON payload {payload[:50]!r}")
+    return decode_float(payload)
+
+# Decoders by name; entries with options are built by make_decoder
+DECODERS = {
+    'auto': decode_auto,
+    'float': decode_float,
+    'int': decode_int,
+    'bool': decode_bool,
+}
+
+# Function to build a decoder from a rule: a decoder name or a dict such as
+# {"decoder": "json", "path": "data.temp"}, {"decoder": "enum", "map": {"heating": 1}} or {"decoder": "multi"}
+def make_decoder(rule):
+    if isinstance(rule, str):
+        rule = {"decoder": rule}
+    name = rule.get("decoder", "auto")
+    if name in DECODERS:
+        return name, DECODERS[name]
+    if name == 'enum':
+        return name, make_enum_decoder(rule["map"])
+    if name == 'json':
+        return f"json:{rule.get('path', 'value')}", make_json_decoder(rule.get("path", "value"))
+    if name == 'multi':
+        return name, make_multi_decoder(rule.get("fields"))
+    raise ValueError(f"Unknown payload decoder '{name}', expected one of "
+                     f"{sorted(DECODERS) + ['enum', 'json', 'multi']}")
+
+# Function to check a topic against a rule pattern: globs (*, ?, [) or MQTT filters (+, #, exact topics)
+def topic_matches(pattern, topic):
+    if any(c in pattern for c in '*?['):
+        return fnmatch.fnmatchcase(topic, pattern)
+    return mqtt.topic_matches_sub(pattern, topic)
+
+class PayloadDecoderRegistry:
+    """Decodes MQTT payloads with the first rule whose pattern matches the topic.
+
+    rules: list of {"pattern": ..., "decoder": ..., options} (CONFIG['payload_decoders']).
+    Patterns are MQTT filters ('KNX/#', 'M-bus/+/Volume') or globs ('KNX/*<*.Switches.*>').
+    The decoder of a topic is resolved once and cached; stats() reports calls, errors
+    and decode time per decoder.
+    """
+
+    def __init__(self, rules=(), default='auto'):
+        self.rules = [(rule["pattern"],) + make_decoder(rule) for rule in rules]
+        self.default = make_decoder(default)
+        self._cache = {}  # topic -> (decoder name, decode function)
+        self._stats = {}  # decoder name -> [calls, errors, total ns, max ns]
+        self._stats_lock = threading.Lock()
+
+    # Function to get the (name, decode function) of a topic
+    def resolve(self, topic):
+        decoder = self._cache.get(topic)
+        if decoder is None:
+            decoder = next(((name, fn) for pattern, name, fn in self.rules if topic_matches(pattern, topic)),
+                           self.default)
+            self._cache[topic] = decoder
+        return decoder
+
+    # Function to decode a payload: a float, or a dict {field: float} for multi-value decoders
+    def decode(self, topic, payload):
+        name, fn = self.resolve(topic)
+        start = time.perf_counter_ns()
+        try:
+            value = fn(payload)
+            error = None
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            error = e
+        elapsed = time.perf_counter_ns() - start
+        with self._stats_lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = [0, 0, 0, 0]
+            stats[0] += 1
+            stats[2] += elapsed
+            if elapsed > stats[3]:
+                stats[3] = elapsed
+            if error is not None:
+                stats[1] += 1
+        if error is not None:
+            raise ValueError(f"{name} decoder can't decode {payload[:50]!r} of {topic}: {error}")
+        return value
+
+    # Function to get a snapshot of the per-decoder counters
+    def stats(self):
+        with self._stats_lock:
+            return {
+                name: {
+                    "calls": calls,
+                    "errors": errors,
+                    "avg_us": total / calls / 1000 if calls else 0.0,
+                    "max_us": longest / 1000,
+                }
+                for name, (calls, errors, total, longest) in self._stats.items()
+            }
+
+class EpochClock:
+    """Epoch millisecond timestamps from the monotonic clock.
+
+    Timestamps never go backwards when the wall clock is stepped (e.g. by NTP). The
+    offset to the wall clock is re-checked every resync_interval seconds and adopted
+    when it drifted by more than max_drift_ms, without ever returning a smaller value.
+    """
+
+    def __init__(self, resync_interval=60, max_drift_ms=500):
+        self.resync_interval_ns = int(resync_interval * 1e9)
+        self.max_drift_ms = max_drift_ms
+        self._lock = threading.Lock()
+        self._anchor()
+        self._last = 0
+
+    def _anchor(self):
+        self._mono_anchor = time.monotonic_ns()
+        self._epoch_anchor_ms = time.time_ns() // 1_000_000
+
+    # Function to get the current time in epoch ms
+    def now_ms(self):
+        mono = time.monotonic_ns()
+        with self._lock:
+            if mono - self._mono_anchor > self.resync_interval_ns:
+                # Move the anchor forward by whole ms; adopt the wall clock only when it drifted noticeably
+                elapsed_ms = (mono - self._mono_anchor) // 1_000_000
+                expected = self._epoch_anchor_ms + elapsed_ms
+                wall = time.time_ns() // 1_000_000
+                self._mono_anchor += elapsed_ms * 1_000_000
+                self._epoch_anchor_ms = wall if abs(wall - expected) > self.max_drift_ms else expected
+            ts = self._epoch_anchor_ms + (mono - self._mono_anchor) // 1_000_000
+            if ts < self._last:
+                ts = self._last
+            self._last = ts
+            return ts
+
+# Shared defaults for clients that aren't given a registry or clock
+default_registry = PayloadDecoderRegistry()
+epoch_clock = EpochClock()
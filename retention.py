@@ -0,0 +1,145 @@
+import os
+import threading
+import time
+from database import connect_db, create_sensor_table
+from rollups import ROLLUP_RESOLUTIONS
+
+DAY_MS = 24 * 3600 * 1000
+
+# Function to resolve the retention policy of one topic
+def topic_policy(retention, topic):
+    """Merge the default policy with the first group in retention['groups'] whose key occurs in the topic.
+
+    A policy has 'raw_days' (days of raw readings to keep) and 'rollup_days'
+    ({resolution in seconds: days}); None or a missing entry keeps data forever.
+    Group keys match like dt_config group keys: case-insensitive substrings of the topic.
+    """
+    policy = {
+        "raw_days": retention.get("raw_days"),
+        "rollup_days": {int(r): d for r, d in retention.get("rollup_days", {}).items()},
+    }
+    for key, group_policy in retention.get("groups", {}).items():
+        if key.lower() in topic.lower():
+            if "raw_days" in group_policy:
+                policy["raw_days"] = group_policy["raw_days"]
+            policy["rollup_days"].update({int(r): d for r, d in group_policy.get("rollup_days", {}).items()})
+            break
+    return policy
+
+# Function to switch a database to incremental auto_vacuum (needs one full VACUUM, so run it before ingestion starts)
+def enable_incremental_vacuum(db_path):
+    conn = connect_db(db_path)
+    try:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            size_before = os.path.getsize(db_path)
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")  # Rebuilds the file; required for the new auto_vacuum mode to take effect
+            print(f"Enabled incremental vacuum on {db_path}, reclaimed {size_before - os.path.getsize(db_path)} bytes.")
+    finally:
+        conn.close()
+
+class RetentionManager:
+    """Background thread that applies retention policies to a history database.
+
+    Every `interval` seconds it deletes raw rows and rollup buckets older than their
+    policy in chunks of chunk_size rows, one short transaction per chunk with a pause
+    in between so the ingest writer is never locked out for long. It then returns the
+    freed pages to the file system with PRAGMA incremental_vacuum.
+    """
+
+    def __init__(self, db_path, retention, interval=3600, chunk_size=5000, chunk_pause=0.05):
+        self.db_path = db_path
+        self.retention = retention
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self.chunk_pause = chunk_pause
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.last_report = None
+
+    # Function to start the retention thread
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="RetentionManager", daemon=True)
+        self._thread.start()
+        return self
+
+    # Function to stop the retention thread (an ongoing run stops after its current chunk)
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Error applying retention to {self.db_path}: {e}")
+            self._stop_event.wait(self.interval)
+
+    # Function to apply the retention policies once and report what was removed
+    def run_once(self):
+        start = time.monotonic()
+        now_ms = int(time.time() * 1000)
+        conn = connect_db(self.db_path)
+        conn.execute("PRAGMA busy_timeout = 30000")  # Wait for the ingest writer instead of failing
+        report = {"raw_rows_deleted": 0, "rollup_rows_deleted": 0, "reclaimed_bytes": 0}
+        try:
+            create_sensor_table(conn)
+            sensors = conn.execute("SELECT sensor_key, sensor_id FROM sensors").fetchall()
+            for sensor_key, topic in sensors:
+                policy = topic_policy(self.retention, topic)
+                if policy["raw_days"] is not None:
+                    report["raw_rows_deleted"] += self._delete_chunked(
+                        conn,
+                        "DELETE FROM sensor_data WHERE id IN "
+                        "(SELECT id FROM sensor_data WHERE sensor_key = ? AND ts < ? LIMIT ?)",
+                        (sensor_key, now_ms - policy["raw_days"] * DAY_MS))
+                for resolution in ROLLUP_RESOLUTIONS:
+                    days = policy["rollup_days"].get(resolution)
+                    if days is None:
+                        continue
+                    report["rollup_rows_deleted"] += self._delete_chunked(
+                        conn,
+                        "DELETE FROM sensor_rollups WHERE resolution = ? AND sensor_key = ? AND bucket IN "
+                        "(SELECT bucket FROM sensor_rollups WHERE resolution = ? AND sensor_key = ? AND bucket < ? LIMIT ?)",
+                        (resolution, sensor_key, resolution, sensor_key, now_ms - days * DAY_MS))
+                if self._stop_event.is_set():
+                    break
+            report["reclaimed_bytes"] = self._incremental_vacuum(conn)
+        finally:
+            conn.close()
+
+        report["seconds"] = time.monotonic() - start
+        self.last_report = report
+        print(f"Retention applied to {self.db_path}: {report}")
+        return report
+
+    def _delete_chunked(self, conn, query, params):
+        deleted = 0
+        while not self._stop_event.is_set():
+            with conn:
+                count = conn.execute(query, params + (self.chunk_size,)).rowcount
+            deleted += count
+            if count < self.chunk_size:
+                break
+            time.sleep(self.chunk_pause)  # Let the writer take the lock between chunks
+        return deleted
+
+    def _incremental_vacuum(self, conn, pages_per_step=1000):
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        pages_before = conn.execute("PRAGMA page_count").fetchone()[0]
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return 0  # Free pages are reused by new rows but the file can't shrink
+        while not self._stop_event.is_set() and conn.execute("PRAGMA freelist_count").fetchone()[0] > 0:
+            conn.execute(f"PRAGMA incremental_vacuum({pages_per_step})").fetchall()
+            time.sleep(self.chunk_pause)
+        conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()  # Let the file shrink without waiting for readers
+        return (pages_before - conn.execute("PRAGMA page_count").fetchone()[0]) * page_size
+
+if __name__ == '__main__':
+    from dt_config import CONFIG
+    # Apply the retention policies to the history database once
+    enable_incremental_vacuum(CONFIG['history_db_path'])
+    RetentionManager(CONFIG['history_db_path'], CONFIG['retention'],
+                     chunk_size=CONFIG['retention_chunk_size']).run_once()
@@ -0,0 +1,81 @@
+import threading
+import time
+import numpy as np
+
+class TopicRingBuffer:
+    """Fixed-capacity (time, value) series of one topic, preallocated as NumPy arrays.
+
+    Every sample is written twice, at i and i + capacity, so the last `count` samples
+    are always one contiguous slice: view() copies them oldest first with two slice copies,
+    taken under the lock so append() can't overwrite them while they are read.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._times = np.zeros(2 * capacity, dtype=np.int64)   # Epoch ms
+        self._values = np.full(2 * capacity, np.nan)
+        self._next = 0   # Write index in [0, capacity)
+        self.count = 0   # Stored samples, at most capacity
+        self.seq = 0     # Samples appended since creation
+        self._lock = threading.Lock()
+
+    # Function to append one sample, overwriting the oldest one when full
+    def append(self, ts, value):
+        with self._lock:
+            i = self._next
+            self._times[i] = self._times[i + self.capacity] = ts
+            self._values[i] = self._values[i + self.capacity] = value
+            self._next = (i + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+            self.seq += 1
+
+    # Function to get copies of the stored samples, optionally only those with ts >= since
+    def view(self, since=None):
+        with self._lock:
+            end = self._next + self.capacity
+            start = end - self.count
+            if since is not None:
+                start += int(np.searchsorted(self._times[start:end], since))
+            return self._times[start:end].copy(), self._values[start:end].copy(), self.seq
+
+class RingBufferStore:
+    """In-process realtime tier: one TopicRingBuffer per topic, shared by the ingest path and the plots.
+
+    append() takes the sensor_data dicts of mqtt_client and can be used as a save callback.
+    read() only returns samples from the last window_seconds.
+    """
+
+    def __init__(self, capacity=3600, window_seconds=3600):
+        self.capacity = capacity
+        self.window_seconds = window_seconds
+        self._buffers = {}
+        self._lock = threading.Lock()
+
+    # Function to get the buffer of a topic, creating it on first use
+    def buffer(self, topic):
+        buffer = self._buffers.get(topic)
+        if buffer is None:
+            with self._lock:
+                buffer = self._buffers.setdefault(topic, TopicRingBuffer(self.capacity))
+        return buffer
+
+    # Function to store one reading
+    def append(self, sensor_data):
+        self.buffer(sensor_data['id']).append(sensor_data['timestamp'], sensor_data['value'])
+
+    # Function to read the samples of a topic within the window as (times, values) copies
+    def read(self, topic):
+        buffer = self._buffers.get(topic)
+        if buffer is None:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        since = int((time.time() - self.window_seconds) * 1000) if self.window_seconds else None
+        times, values, _ = buffer.view(since)
+        return times, values
+
+    # Function to get the topics that have received data
+    def topics(self):
+        return list(self._buffers)
+
+    # Kept for symmetry with the SQLite source of the plots; there is nothing to release
+    def close(self):
+        pass
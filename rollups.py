@@ -0,0 +1,172 @@
+import numpy as np
+from database import connect_db, create_sensor_table, get_sensor_key, DEFAULT_SITE_ID
+
+# Rollup resolutions in seconds: 1 min, 15 min, 1 hour, 1 day (UTC day boundaries)
+ROLLUP_RESOLUTIONS = (60, 900, 3600, 86400)
+
+# Aggregate raw rows into buckets of one resolution and merge them into sensor_rollups; {rows} selects the
+# raw rows. last_value() over the bucket picks the reading with the latest ts (then highest id) of the rows,
+# first_value() the earliest reading with the min and max value (NULL values sort last; min_ts/max_ts stay
+# NULL when the bucket has no value). count is the number of non-NULL values (the mean is sum / count);
+# a multi-argument min()/max() is NULL when one argument is, so the merge falls back to the non-NULL side.
+# On a tie the stored (earlier merged) time is kept.
+_UPSERT_TEMPLATE = '''
+INSERT INTO sensor_rollups (resolution, sensor_key, bucket, count, min, max, sum, last_ts, last_value, min_ts, max_ts)
+SELECT :resolution, sensor_key, bucket, count(value), min(value), max(value), total(value), max(ts), last_value,
+       CASE WHEN count(value) > 0 THEN min(min_ts) END, CASE WHEN count(value) > 0 THEN min(max_ts) END
+FROM (
+    SELECT d.sensor_key, d.ts, d.value, d.ts - d.ts % :width AS bucket,
+           last_value(d.value) OVER (
+               PARTITION BY d.sensor_key, d.ts - d.ts % :width ORDER BY d.ts, d.id
+               ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING
+           ) AS last_value,
+           first_value(d.ts) OVER (
+               PARTITION BY d.sensor_key, d.ts - d.ts % :width ORDER BY d.value IS NULL, d.value, d.ts
+           ) AS min_ts,
+           first_value(d.ts) OVER (
+               PARTITION BY d.sensor_key, d.ts - d.ts % :width ORDER BY d.value IS NULL, d.value DESC, d.ts
+           ) AS max_ts
+    {rows}
+)
+WHERE true
+GROUP BY sensor_key, bucket
+ON CONFLICT (resolution, sensor_key, bucket) DO UPDATE SET
+    count = count + excluded.count,
+    min_ts = CASE WHEN min IS NULL OR excluded.min < min THEN excluded.min_ts ELSE min_ts END,
+    max_ts = CASE WHEN max IS NULL OR excluded.max > max THEN excluded.max_ts ELSE max_ts END,
+    min = coalesce(min(min, excluded.min), min, excluded.min),
+    max = coalesce(max(max, excluded.max), max, excluded.max),
+    sum = sum + excluded.sum,
+    last_value = CASE WHEN excluded.last_ts >= last_ts THEN excluded.last_value ELSE last_value END,
+    last_ts = max(last_ts, excluded.last_ts)
+'''
+
+# Raw rows with ids in (first_id, last_id]
+_UPSERT_ROLLUP = _UPSERT_TEMPLATE.format(rows="FROM sensor_data d WHERE d.id > :first_id AND d.id <= :last_id")
+
+# Raw rows up to last_id at or after the per-topic cutoff of the resolution (backfill_rollups)
+_UPSERT_BACKFILL = _UPSERT_TEMPLATE.format(rows=
+    "FROM sensor_data d JOIN backfill_cutoff c ON c.sensor_key = d.sensor_key AND c.resolution = :resolution "
+    "WHERE d.ts >= c.cutoff AND d.id <= :last_id")
+
+# Function to get the highest sensor_data id already folded into the rollups
+def get_rollup_watermark(conn):
+    row = conn.execute("SELECT last_id FROM rollup_state WHERE name = 'sensor_data'").fetchone()
+    return row[0] if row else 0
+
+# Function to fold the raw rows stored since the last update into the rollup tables
+def update_rollups(conn, chunk_size=None, limit=None):
+    """Incrementally update sensor_rollups from sensor_data rows newer than the watermark.
+
+    Each call (or each chunk of chunk_size ids) runs in one transaction together with
+    the watermark update, so a row is never counted twice. limit caps the ids covered by
+    one call, so a long backlog is caught up over several calls. Returns the number of
+    raw ids covered.
+    """
+    watermark = get_rollup_watermark(conn)
+    max_id = conn.execute("SELECT max(id) FROM sensor_data").fetchone()[0] or 0
+    if limit is not None:
+        max_id = min(max_id, watermark + limit)
+    first_id = watermark
+    while first_id < max_id:
+        last_id = max_id if chunk_size is None else min(first_id + chunk_size, max_id)
+        with conn:
+            for resolution in ROLLUP_RESOLUTIONS:
+                conn.execute(_UPSERT_ROLLUP, {"resolution": resolution, "width": resolution * 1000,
+                                              "first_id": first_id, "last_id": last_id})
+            conn.execute("INSERT OR REPLACE INTO rollup_state (name, last_id) VALUES ('sensor_data', ?)", (last_id,))
+        first_id = last_id
+    return max(0, max_id - watermark)
+
+# Function to rebuild the rollups covered by the raw data, keeping the older ones
+def backfill_rollups(db_path, chunk_size=100000):
+    """Rebuild the rollup buckets of every topic from its raw rows still in sensor_data.
+
+    Retention keeps rollups longer than raw rows, so only the buckets that the remaining raw
+    rows cover entirely are deleted and rebuilt: per topic and resolution, from the bucket
+    starting at the topic's first raw ts (or the next bucket when an existing bucket also
+    holds older, deleted readings). Older buckets are left untouched. The rollups are first
+    brought up to date, so those partial buckets include every raw row; the rebuild then runs
+    in one transaction.
+    """
+    conn = connect_db(db_path)
+    try:
+        create_sensor_table(conn)
+        update_rollups(conn, chunk_size)
+        with conn:
+            max_id = conn.execute("SELECT max(id) FROM sensor_data").fetchone()[0] or 0
+            first_ts = conn.execute("SELECT sensor_key, min(ts) FROM sensor_data WHERE id <= ? GROUP BY sensor_key",
+                                    (max_id,)).fetchall()
+            cutoffs = []
+            for resolution in ROLLUP_RESOLUTIONS:
+                width = resolution * 1000
+                for sensor_key, min_ts in first_ts:
+                    bucket = min_ts - min_ts % width
+                    partial = bucket < min_ts and conn.execute(
+                        "SELECT 1 FROM sensor_rollups WHERE resolution = ? AND sensor_key = ? AND bucket = ?",
+                        (resolution, sensor_key, bucket)).fetchone() is not None
+                    cutoffs.append((resolution, sensor_key, bucket + width if partial else bucket))
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS backfill_cutoff "
+                         "(resolution INTEGER, sensor_key INTEGER, cutoff INTEGER, PRIMARY KEY (resolution, sensor_key))")
+            conn.execute("DELETE FROM backfill_cutoff")
+            conn.executemany("INSERT INTO backfill_cutoff (resolution, sensor_key, cutoff) VALUES (?, ?, ?)", cutoffs)
+            deleted = conn.execute(
+                "DELETE FROM sensor_rollups WHERE bucket >= (SELECT c.cutoff FROM backfill_cutoff c "
+                "WHERE c.resolution = sensor_rollups.resolution AND c.sensor_key = sensor_rollups.sensor_key)"
+            ).rowcount
+            for resolution in ROLLUP_RESOLUTIONS:
+                conn.execute(_UPSERT_BACKFILL, {"resolution": resolution, "width": resolution * 1000, "last_id": max_id})
+            conn.execute("INSERT OR REPLACE INTO rollup_state (name, last_id) VALUES ('sensor_data', ?)", (max_id,))
+        buckets = conn.execute("SELECT count(*) FROM sensor_rollups").fetchone()[0]
+        print(f"Rollups of {len(first_ts)} topics rebuilt from the raw rows up to id {max_id}: "
+              f"{deleted} buckets replaced, {buckets} buckets in total.")
+    finally:
+        conn.close()
+
+# Function to choose the coarsest rollup resolution not coarser than the requested one (None if too fine)
+def choose_rollup_resolution(resolution):
+    usable = [r for r in ROLLUP_RESOLUTIONS if r <= resolution]
+    return max(usable) if usable else None
+
+# Function to fetch the rollup buckets of a topic overlapping [start, end)
+def fetch_rollups(conn, topic, start=None, end=None, resolution=60, site_id=DEFAULT_SITE_ID):
+    """Return a dict of NumPy arrays for the rollup buckets of a topic overlapping [start, end).
+
+    resolution is the wanted bucket width in seconds; the coarsest stored rollup not
+    coarser than it is used, and its width is returned under 'resolution'. Returns None
+    when the resolution is finer than the finest rollup (read the raw rows instead).
+    Keys: 'time' (bucket start, epoch ms), 'count', 'min', 'max', 'mean', 'sum', 'last', and
+    'min_time'/'max_time' (epoch ms of the min and max reading, NaN for buckets aggregated before
+    schema version 6 and not rebuilt since).
+    """
+    resolution = choose_rollup_resolution(resolution)
+    if resolution is None:
+        return None
+    sensor_key = get_sensor_key(conn, topic, site_id)
+    rows = []
+    if sensor_key is not None:
+        rows = conn.execute(
+            "SELECT bucket, count, min, max, sum, last_value, min_ts, max_ts FROM sensor_rollups "
+            "WHERE resolution = ? AND sensor_key = ? AND bucket > ? AND bucket < ? ORDER BY bucket",
+            (resolution, sensor_key,
+             start - resolution * 1000 if start is not None else -2**63, end if end is not None else 2**63 - 1)
+        ).fetchall()
+    data = np.array(rows, dtype=np.float64).reshape(-1, 8)
+    counts = data[:, 1].astype(np.int64)
+    return {
+        "resolution": resolution,
+        "time": data[:, 0].astype(np.int64),
+        "count": counts,
+        "min": data[:, 2],
+        "max": data[:, 3],
+        "sum": data[:, 4],
+        "mean": np.where(counts > 0, data[:, 4] / np.maximum(counts, 1), np.nan),  # count excludes NULL values
+        "last": data[:, 5],
+        "min_time": data[:, 6],
+        "max_time": data[:, 7],
+    }
+
+if __name__ == '__main__':
+    from dt_config import CONFIG
+    # Rebuild the rollups of the history database from its raw rows
+    backfill_rollups(CONFIG['history_db_path'])
@@ -0,0 +1,35 @@
+from dt_config import THRESHOLDS, TOPIC_INDEX
+
+# Status scales per sensor kind (THRESHOLDS key): status names and plot colors from low to high
+STATUS_STYLES = {
+    'CO2': (['Unoccupied', 'Occupied', 'Crowded'], ['lightgreen', 'lightyellow', 'lightcoral']),
+    'TEMPERATURE': (['Cold', 'Normal', 'Hot'], ['lightblue', 'lightgreen', 'lightsalmon']),
+    'HUMIDITY': (['Dry', 'Normal', 'Moist'], ['lightblue', 'lightgreen', 'lightsalmon']),
+}
+
+# Status of topics without thresholds
+DEFAULT_STATUS = ('On', 'white')
+
+# Function to get the sensor kind of a topic (a THRESHOLDS key), None for topics without thresholds
+def sensor_kind(topic):
+    return TOPIC_INDEX.sensor_kind(topic)  # Classified once per topic (topic_index.classify_sensor)
+
+# Function to get the status level of a value: 0 below the first threshold, 1 between, 2 above; -1 without thresholds
+def status_level(topic, value):
+    kind = sensor_kind(topic)
+    if kind is None:
+        return -1
+    low, high = THRESHOLDS[kind][:2]
+    if value < low:
+        return 0
+    elif value < high:
+        return 1
+    return 2
+
+# Function to get the (status, color) names of a topic for a status level
+def status_style(topic, level):
+    kind = sensor_kind(topic)
+    if kind is None or level < 0:
+        return DEFAULT_STATUS
+    statuses, colors = STATUS_STYLES[kind]
+    return statuses[level], colors[level]
@@ -0,0 +1,39 @@
+import json
+import os
+import sys
+import pytest
+
+# The modules are flat files at the repository root
+sys.path.insert(0, os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+
+# Minimal smartlab_config.json for the tests (the real one is private)
+TEST_CONFIG = {
+    "mqtt_broker": "localhost",
+    "mqtt_port": 1883,
+    "thresholds": {"CO2": [800, 1200], "TEMPERATURE": [18, 26], "HUMIDITY": [30, 60]},
+    "group_keys": [],
+}
+
+# Fixture: a temporary local_files folder used by dt_config instead of the real one
+@pytest.fixture
+def local_files(tmp_path, monkeypatch):
+    import dt_config
+    directory = tmp_path / "local_files"
+    directory.mkdir()
+    (directory / "smartlab_config.json").write_text(json.dumps(TEST_CONFIG))
+    (directory / "topic_ifc_link.json").write_text(json.dumps({}))
+    monkeypatch.setattr(dt_config, "local_config", str(directory / "smartlab_config.json"))
+    monkeypatch.setattr(dt_config, "topic_ifc_link", str(directory / "topic_ifc_link.json"))
+    monkeypatch.setattr(dt_config, "cache_dir", str(directory / ".cache"))
+    for name in dt_config._LAZY_ATTRIBUTES:
+        if name in vars(dt_config):  # hasattr() would compute it
+            monkeypatch.delattr(dt_config, name)  # Computed again from the test files
+
+    config = dt_config.CONFIG
+    saved = (dict.copy(config), config._loader, set(config._set_before_load))
+    config.load_on_first_use(dt_config.load_local_config)
+    config["mqtt_csv"] = str(directory / "Topic_Ifc_Mapping.csv")
+    yield directory
+    dict.clear(config)
+    dict.update(config, saved[0])
+    config._loader, config._set_before_load = saved[1], saved[2]
@@ -0,0 +1,46 @@
+import sqlite3
+from database import connect_db, create_sensor_table, insert_sensor_rows, SCHEMA_VERSION, DEFAULT_SITE_ID
+
+# Function to describe the schema of a database: columns and indexes per table
+def schema(conn):
+    tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' "
+                                             "AND name != 'sqlite_sequence' ORDER BY name")]
+    return {table: (conn.execute(f"PRAGMA table_info({table})").fetchall(),
+                    sorted(row[1:3] for row in conn.execute(f"PRAGMA index_list({table})")))
+            for table in tables}
+
+def test_new_database_is_created_at_the_current_version(tmp_path, capsys):
+    conn = connect_db(str(tmp_path / "new.db"))
+    create_sensor_table(conn)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    assert "migrated" not in capsys.readouterr().out
+    create_sensor_table(conn)  # Nothing to do on the next start
+    assert capsys.readouterr().out == ""
+    conn.close()
+
+def test_new_schema_matches_the_migrated_one(tmp_path):
+    new = connect_db(str(tmp_path / "new.db"))
+    create_sensor_table(new)
+    old = connect_db(str(tmp_path / "old.db"))
+    with old:  # Version 1 database with a reading
+        old.execute("CREATE TABLE sensor_data (id INTEGER PRIMARY KEY, sensor_id TEXT, timestamp DATETIME, value REAL)")
+        old.execute("INSERT INTO sensor_data (sensor_id, timestamp, value) VALUES ('lab/co2', '2024-01-01 12:00:00', 400)")
+        old.execute("PRAGMA user_version = 1")
+    create_sensor_table(old)
+    assert old.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    assert schema(new) == schema(old)
+    assert old.execute("SELECT s.site_id, s.sensor_id, d.value FROM sensor_data d JOIN sensors s USING (sensor_key)"
+                       ).fetchall() == [(DEFAULT_SITE_ID, 'lab/co2', 400.0)]
+    old.close()
+    new.close()
+
+def test_unversioned_database_with_data_is_migrated(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    with conn:  # Created before the schema was versioned: user_version is still 0
+        conn.execute("CREATE TABLE sensor_data (id INTEGER PRIMARY KEY, sensor_id TEXT, timestamp DATETIME, value REAL)")
+        conn.execute("INSERT INTO sensor_data (sensor_id, timestamp, value) VALUES ('lab/co2', '2024-01-01 12:00:00', 400)")
+    create_sensor_table(conn)
+    insert_sensor_rows(conn, [(DEFAULT_SITE_ID, 'lab/co2', 1_704_110_400_000, 410.0)])
+    assert conn.execute("SELECT count(DISTINCT sensor_key), count(*) FROM sensor_data").fetchone() == (1, 2)
+    conn.close()
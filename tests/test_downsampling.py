@@ -0,0 +1,71 @@
+import numpy as np
+from database import connect_db, create_sensor_table, insert_sensor_rows, DEFAULT_SITE_ID
+from downsampling import lttb, minmax_buckets, fetch_downsampled
+from rollups import update_rollups
+
+def test_lttb_keeps_the_ends_and_the_spikes():
+    x = np.arange(1000, dtype=np.float64)
+    y = np.sin(x / 50)
+    y[500] = 10.0
+    y[700] = -10.0
+    out_x, out_y = lttb(x, y, 100)
+    assert len(out_x) == len(out_y) == 100
+    assert (out_x[0], out_x[-1]) == (0, 999)
+    assert np.all(np.diff(out_x) > 0)
+    assert {500.0, 700.0} <= set(out_x.tolist())
+    assert np.array_equal(out_y, y[out_x.astype(np.int64)])  # Only existing points
+
+def test_lttb_picks_the_largest_triangle():
+    x = np.arange(7, dtype=np.float64)
+    y = np.array([0.0, 1.0, 5.0, 2.0, 0.0, -4.0, 0.0])
+    # Buckets between the ends: [1, 2, 3] and [4, 5]
+    out_x, out_y = lttb(x, y, 4)
+    assert out_x.tolist() == [0, 2, 5, 6]
+    assert out_y.tolist() == [0.0, 5.0, -4.0, 0.0]
+
+def test_lttb_short_series_unchanged():
+    x, y = [0, 1, 2], [3.0, 1.0, 2.0]
+    assert [a.tolist() for a in lttb(x, y, 5)] == [x, y]
+    assert [a.tolist() for a in lttb(x, y, 2)] == [x, y]
+
+def test_minmax_buckets():
+    x = np.arange(100)
+    y = np.zeros(100)
+    y[[3, 14, 45, 77]] = [5.0, -5.0, 7.0, -2.0]
+    out_x, out_y = minmax_buckets(x, y, 4)  # Buckets of 25 points
+    assert len(out_x) <= 8
+    assert np.all(np.diff(out_x) > 0)
+    assert {3, 14, 45, 77} <= set(out_x.tolist())
+    for k in range(4):
+        in_bucket = (out_x >= 25 * k) & (out_x < 25 * (k + 1))
+        assert out_y[in_bucket].min() == y[25 * k:25 * (k + 1)].min()
+        assert out_y[in_bucket].max() == y[25 * k:25 * (k + 1)].max()
+
+def test_minmax_buckets_uneven_times():
+    x = np.array([0, 1, 2, 3, 100, 101, 102, 103, 104, 200])
+    y = np.array([1.0, 9.0, 2.0, 0.0, 4.0, 3.0, 8.0, 5.0, 6.0, 7.0])
+    out_x, out_y = minmax_buckets(x, y, 2)  # [0, 100) and [100, 200]
+    assert out_x.tolist() == [1, 3, 101, 102]
+    assert out_y.tolist() == [9.0, 0.0, 3.0, 8.0]
+
+def test_minmax_buckets_short_series_unchanged():
+    x, y = [0, 5, 9], [1.0, 2.0, 3.0]
+    assert [a.tolist() for a in minmax_buckets(x, y, 2)] == [x, y]
+
+def test_rollup_envelope_at_the_times_of_the_readings(tmp_path):
+    conn = connect_db(str(tmp_path / "history.db"))
+    create_sensor_table(conn)
+    t0 = 1_700_006_400_000  # A UTC day boundary
+    # One reading per second for 2 hours; per hour a spike up late and a spike down early
+    times = t0 + np.arange(7200) * 1000
+    values = np.full(7200, 20.0)
+    values[[3000, 3700]] = [30.0, 10.0]
+    values[[200, 5000]] = [15.0, 25.0]
+    insert_sensor_rows(conn, [(DEFAULT_SITE_ID, "lab/temperature", int(ts), float(value))
+                              for ts, value in zip(times, values)])
+    update_rollups(conn)
+    out_t, out_v, downsampled = fetch_downsampled(conn, "lab/temperature", max_points=4)  # Hourly buckets
+    conn.close()
+    assert downsampled
+    assert out_t.tolist() == [t0 + 200_000, t0 + 3_000_000, t0 + 3_700_000, t0 + 5_000_000]
+    assert out_v.tolist() == [15.0, 30.0, 10.0, 25.0]
@@ -0,0 +1,16 @@
+import pytest
+import dt_config
+from dt_config import CONFIG
+
+def test_local_config_is_read_on_first_use(local_files):
+    CONFIG["history_db_path"] = "./set_before_load.db"
+    assert CONFIG["mqtt_broker"] == "localhost"
+    assert CONFIG["history_db_path"] == "./set_before_load.db"  # Not replaced by the file
+    assert CONFIG["brokers"] == [{"host": "localhost", "port": 1883}]
+    assert dt_config.THRESHOLDS["CO2"] == [800, 1200]
+
+def test_missing_local_config_raises_on_use(local_files):
+    (local_files / "smartlab_config.json").unlink()
+    for _ in range(2):  # Raised again on the next read
+        with pytest.raises(FileNotFoundError):
+            CONFIG["mqtt_port"]
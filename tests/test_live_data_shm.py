@@ -0,0 +1,48 @@
+import os
+import subprocess
+import sys
+import uuid
+import pytest
+
+@pytest.fixture
+def shm(local_files):
+    import live_data_shm  # sensor_status reads the thresholds of the config on import
+    return live_data_shm
+
+@pytest.fixture
+def writer(shm):
+    topics = ["lab/" + "ä" * 100, "lab/co2"]  # The first name is cut inside the UTF-8 bytes
+    writer = shm.LiveDataWriter(topics, 8, "dt_test_" + uuid.uuid4().hex[:8])
+    yield writer
+    if writer.shm is not None and writer.header is not None:
+        writer.close()
+
+def test_long_topic_names_are_cut_on_a_character_boundary(shm, writer):
+    reader = shm.LiveDataReader(writer.shm.name)
+    try:
+        assert len(reader.topics[0].encode("utf-8")) <= shm.TOPIC_NAME_BYTES
+        assert writer.topics[0].startswith(reader.topics[0])
+        assert reader._slot_of(writer.topics[0]) == 0
+        assert reader._slot_of("lab/co2") == 1
+    finally:
+        reader.close()
+
+def test_segment_in_use_is_not_taken_over(shm, writer):
+    with pytest.raises(RuntimeError, match="in use"):
+        shm.LiveDataWriter(["lab/co2"], 8, writer.shm.name)
+    reader = shm.LiveDataReader(writer.shm.name)  # Still the first writer's segment
+    assert reader.topics == [shm.encode_topic_name(topic).decode("utf-8") for topic in writer.topics]
+    reader.close()
+
+@pytest.mark.skipif(os.name != "posix", reason="Windows removes a segment with its last handle")
+def test_segment_of_a_stopped_writer_is_replaced(shm, writer):
+    stopped = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"], capture_output=True, text=True)
+    writer.header["pid"] = int(stopped.stdout)
+    name = writer.shm.name
+    writer.header = writer.names = writer.slots = None
+    writer.shm.close()  # Crashed: closed without unlinking
+    replacement = shm.LiveDataWriter(["lab/temperature"], 8, name)
+    reader = shm.LiveDataReader(name)
+    assert reader.topics == ["lab/temperature"]
+    reader.close()
+    replacement.close()
@@ -0,0 +1,48 @@
+import os
+import pytest
+from dt_config import CONFIG
+from mqtt_actuators import link_data_from_csv, load_actuator_ifc_link
+
+pytestmark = pytest.mark.usefixtures("local_files")  # Never read the real local_files
+
+HEADER = "FullTopic;IFC Device GUID;Comment\r\n"
+
+# Function to write a topic CSV the way Excel saves it (';' separated, CRLF line ends)
+def write_csv(directory, text, encoding):
+    path = directory / "Topic_Ifc_Mapping.csv"
+    path.write_bytes(text.encode(encoding))
+    return path
+
+# The expected dicts are what the pandas loader returned for the same files:
+# read_csv(sep=';', on_bad_lines='skip'), dropna on 'IFC Device GUID', then set_index('FullTopic')
+
+def test_utf8_bom(tmp_path):
+    path = write_csv(tmp_path, HEADER + "lab/light/1;2O2Fr$t4X7Zf8NOew3FLOH;\r\n", "utf-8-sig")
+    assert link_data_from_csv(path) == {"lab/light/1": "2O2Fr$t4X7Zf8NOew3FLOH"}
+
+def test_bad_lines_and_missing_guids(tmp_path):
+    path = write_csv(tmp_path, HEADER +
+                     "lab/light/1;2O2Fr$t4X7Zf8NOew3FLOH;ok\r\n"
+                     "lab/light/2;1hOSvn6df7F8_7GcBWlR72;too;many;fields\r\n"   # Bad line: skipped
+                     "lab/light/3;;no device\r\n"                               # Empty GUID: dropped
+                     "lab/light/4\r\n"                                          # Short row: GUID is NaN
+                     "\r\n"                                                     # Blank line
+                     ";3cUkl32yn9qRSPvBJVyWYp;no topic\r\n",                    # No topic: None (pandas used a NaN key)
+                     "utf-8")
+    assert link_data_from_csv(path) == {"lab/light/1": "2O2Fr$t4X7Zf8NOew3FLOH", None: "3cUkl32yn9qRSPvBJVyWYp"}
+
+def test_latin1_fallback(tmp_path):
+    path = write_csv(tmp_path, HEADER + "lab/räume/lüfter;0Lx7bRz9P1yQe$Hw2DkC4m;Büro\r\n", "ISO-8859-1")
+    assert link_data_from_csv(path) == {"lab/räume/lüfter": "0Lx7bRz9P1yQe$Hw2DkC4m"}
+
+def test_later_row_wins(tmp_path):
+    path = write_csv(tmp_path, HEADER + "lab/fan;1111111111111111111111;\r\nlab/fan;2222222222222222222222;\r\n", "utf-8")
+    assert link_data_from_csv(path) == {"lab/fan": "2222222222222222222222"}
+
+def test_load_actuator_ifc_link_from_the_config(local_files):
+    assert CONFIG["mqtt_broker"] == "localhost"  # Read from the fixture smartlab_config.json
+    path = write_csv(local_files, HEADER + "lab/fan;2222222222222222222222;\r\n", "utf-8-sig")
+    assert CONFIG["mqtt_csv"] == str(path)
+    assert load_actuator_ifc_link() == {"lab/fan": "2222222222222222222222"}
+    assert os.path.exists(local_files / ".cache" / "actuator_ifc_link.pickle")
+    assert load_actuator_ifc_link() == {"lab/fan": "2222222222222222222222"}  # From the cache
@@ -0,0 +1,64 @@
+import pytest
+from payload_decoders import PayloadDecoderRegistry, make_decoder, topic_matches, decode_auto
+
+RULES = [
+    {"pattern": "KNX/+/Switches/#", "decoder": "bool"},
+    {"pattern": "KNX/*<*Mode*>", "decoder": "enum", "map": {"comfort": 1, "standby": 2}},
+    {"pattern": "M-bus/+/Volume", "decoder": "json", "path": "data.values[0].v"},
+    {"pattern": "KNX/#", "decoder": "int"},
+    {"pattern": "sensors/+/multi", "decoder": "multi"},
+]
+
+def test_first_matching_rule_wins():
+    registry = PayloadDecoderRegistry(RULES)
+    assert registry.resolve("KNX/room1/Switches/light")[0] == "bool"
+    assert registry.resolve("KNX/room1 <HeatingMode>")[0] == "enum"
+    assert registry.resolve("KNX/room1/Counter")[0] == "int"
+    assert registry.resolve("M-bus/meter1/Volume")[0] == "json:data.values[0].v"
+    assert registry.resolve("lab/room1/co2")[0] == "auto"
+
+def test_decode():
+    registry = PayloadDecoderRegistry(RULES)
+    assert registry.decode("KNX/room1/Switches/light", b" ON ") == 1.0
+    assert registry.decode("KNX/room1 <HeatingMode>", b"Standby") == 2.0
+    assert registry.decode("KNX/room1/Counter", b"0x1F") == 31.0
+    assert registry.decode("M-bus/meter1/Volume", b'{"data": {"values": [{"v": "12.5"}]}}') == 12.5
+    assert registry.decode("sensors/s1/multi", b'{"t": 21.5, "h": 40, "on": true, "id": "s1"}') == \
+        {"t": 21.5, "h": 40.0, "on": 1.0}
+    assert registry.decode("lab/room1/temperature", "21.5 °C".encode()) == 21.5
+
+def test_auto_decoder():
+    assert decode_auto(b"450") == 450.0
+    assert decode_auto(b"off") == 0.0
+    assert decode_auto(b"450ppm") == 450.0
+    assert decode_auto(b'{"value": 3}') == 3.0
+    assert decode_auto(b'[4]') == 4.0
+    with pytest.raises(ValueError):
+        decode_auto(b'{"other": 3}')
+
+def test_errors_are_counted():
+    registry = PayloadDecoderRegistry(RULES)
+    registry.decode("KNX/room1/Counter", b"7")
+    with pytest.raises(ValueError, match="int decoder"):
+        registry.decode("KNX/room1/Counter", b"seven")
+    with pytest.raises(ValueError, match="enum decoder"):
+        registry.decode("KNX/room1 <HeatingMode>", b"boost")
+    with pytest.raises(ValueError, match="json"):
+        registry.decode("M-bus/meter1/Volume", b'{"data": {"values": []}}')
+    stats = registry.stats()
+    assert (stats["int"]["calls"], stats["int"]["errors"]) == (2, 1)
+    assert (stats["enum"]["calls"], stats["enum"]["errors"]) == (1, 1)
+    assert stats["json:data.values[0].v"]["errors"] == 1
+
+def test_unknown_decoder():
+    with pytest.raises(ValueError, match="Unknown payload decoder"):
+        make_decoder({"decoder": "xml"})
+    with pytest.raises(ValueError):
+        PayloadDecoderRegistry([{"pattern": "#", "decoder": "xml"}])
+
+def test_topic_matches():
+    assert topic_matches("KNX/#", "KNX/a/b")
+    assert topic_matches("KNX/+/Volume", "KNX/a/Volume")
+    assert not topic_matches("KNX/+/Volume", "KNX/a/b/Volume")
+    assert topic_matches("KNX/*.Switches.*", "KNX/room.Switches.light")
+    assert not topic_matches("KNX/*.Switches.*", "M-bus/room.Switches.light")
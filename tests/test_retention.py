@@ -0,0 +1,74 @@
+import time
+import pytest
+from database import connect_db, create_sensor_table, insert_sensor_rows, DEFAULT_SITE_ID
+from retention import RetentionManager, topic_policy, DAY_MS
+from rollups import update_rollups
+
+RETENTION = {
+    "raw_days": 7,
+    "rollup_days": {"60": 30},
+    "groups": {"co2": {"raw_days": 1, "rollup_days": {"60": 2, "3600": 5}}},
+}
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "history.db")
+    conn = connect_db(path)
+    create_sensor_table(conn)
+    conn.close()
+    return path
+
+def test_topic_policy():
+    assert topic_policy(RETENTION, "lab/room1/Temperature") == {"raw_days": 7, "rollup_days": {60: 30}}
+    assert topic_policy(RETENTION, "lab/room1/CO2") == {"raw_days": 1, "rollup_days": {60: 2, 3600: 5}}
+    assert topic_policy({}, "lab/room1/CO2") == {"raw_days": None, "rollup_days": {}}
+
+def test_run_once_deletes_in_chunks(db_path):
+    now = int(time.time() * 1000)
+    minute = 60 * 1000
+    conn = connect_db(db_path)
+    # Per topic: 25 readings 3 to 4 days old and 3 recent ones
+    readings = [now - 4 * DAY_MS + i * minute for i in range(25)] + [now - i * minute for i in range(3)]
+    insert_sensor_rows(conn, [(DEFAULT_SITE_ID, topic, ts, 1.0) for topic in ("lab/co2", "lab/temperature")
+                              for ts in readings])
+    update_rollups(conn)
+    rollups_before = conn.execute("SELECT resolution, count(*) FROM sensor_rollups GROUP BY resolution").fetchall()
+    conn.close()
+
+    manager = RetentionManager(db_path, RETENTION, chunk_size=4, chunk_pause=0)
+    per_policy = []
+    original = manager._delete_chunked
+    def delete_chunked(conn, query, params):
+        deleted = original(conn, query, params)
+        per_policy.append(deleted)
+        return deleted
+    manager._delete_chunked = delete_chunked
+    report = manager.run_once()
+
+    # co2 keeps 1 day of raw rows and 2 days of minute buckets; temperature keeps 7 and 30 days
+    assert report["raw_rows_deleted"] == 25
+    assert report["rollup_rows_deleted"] == 25
+    assert sorted(per_policy) == [0, 0, 0, 25, 25]
+    conn = connect_db(db_path)
+    raw = dict(conn.execute("SELECT s.sensor_id, count(*) FROM sensor_data d JOIN sensors s USING (sensor_key) "
+                            "GROUP BY s.sensor_id").fetchall())
+    minute_buckets = dict(conn.execute("SELECT s.sensor_id, count(*) FROM sensor_rollups r JOIN sensors s "
+                                       "USING (sensor_key) WHERE resolution = 60 GROUP BY s.sensor_id").fetchall())
+    conn.close()
+    assert raw == {"lab/co2": 3, "lab/temperature": 28}
+    assert minute_buckets["lab/temperature"] == dict(rollups_before)[60] // 2
+    assert minute_buckets["lab/co2"] == dict(rollups_before)[60] // 2 - 25
+
+def test_delete_chunked_uses_one_statement_per_chunk(db_path):
+    conn = connect_db(db_path)
+    insert_sensor_rows(conn, [(DEFAULT_SITE_ID, "lab/co2", i, 1.0) for i in range(10)])
+    statements = []
+    conn.set_trace_callback(statements.append)
+    manager = RetentionManager(db_path, {"raw_days": 0}, chunk_size=4, chunk_pause=0)
+    deleted = manager._delete_chunked(conn, "DELETE FROM sensor_data WHERE id IN "
+                                            "(SELECT id FROM sensor_data WHERE ts < ? LIMIT ?)", (10,))
+    conn.set_trace_callback(None)
+    assert deleted == 10
+    assert sum(statement.startswith("DELETE") for statement in statements) == 3  # 4 + 4 + 2 rows
+    assert conn.execute("SELECT count(*) FROM sensor_data").fetchone()[0] == 0
+    conn.close()
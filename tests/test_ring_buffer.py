@@ -0,0 +1,43 @@
+import threading
+import numpy as np
+from ring_buffer import TopicRingBuffer
+
+def test_view_oldest_first_after_wrapping():
+    buffer = TopicRingBuffer(5)
+    for ts in range(1, 9):
+        buffer.append(ts, ts * 10.0)
+    times, values, seq = buffer.view()
+    assert times.tolist() == [4, 5, 6, 7, 8]
+    assert values.tolist() == [40.0, 50.0, 60.0, 70.0, 80.0]
+    assert seq == 8
+    assert buffer.view(since=6)[0].tolist() == [6, 7, 8]
+
+def test_view_is_not_overwritten_by_later_appends():
+    buffer = TopicRingBuffer(4)
+    for ts in range(4):
+        buffer.append(ts, float(ts))
+    times, values, _ = buffer.view()
+    for ts in range(4, 8):
+        buffer.append(ts, float(ts))
+    assert times.tolist() == [0, 1, 2, 3]
+    assert values.tolist() == [0.0, 1.0, 2.0, 3.0]
+
+def test_concurrent_views_stay_sorted():
+    buffer = TopicRingBuffer(64)
+    stop = threading.Event()
+    def write():
+        ts = 0
+        while not stop.is_set():
+            ts += 1
+            buffer.append(ts, float(ts))
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        unsorted = 0
+        for _ in range(5000):
+            times, values, _ = buffer.view()
+            unsorted += bool(np.any(np.diff(times) <= 0)) or not np.array_equal(times, values)
+    finally:
+        stop.set()
+        writer.join()
+    assert unsorted == 0
@@ -0,0 +1,118 @@
+import math
+import numpy as np
+import pytest
+from database import connect_db, create_sensor_table, insert_sensor_rows, DEFAULT_SITE_ID
+from rollups import update_rollups, backfill_rollups, fetch_rollups, get_rollup_watermark
+
+TOPIC = 'lab/room1/co2'
+MINUTE = 60 * 1000
+DAY = 24 * 3600 * 1000
+T0 = 1_700_006_400_000  # A UTC day boundary
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "history.db")
+    conn = connect_db(path)
+    create_sensor_table(conn)
+    conn.close()
+    return path
+
+@pytest.fixture
+def conn(db_path):
+    conn = connect_db(db_path)
+    yield conn
+    conn.close()
+
+# Function to store (ts, value) readings of TOPIC
+def insert(conn, readings):
+    insert_sensor_rows(conn, [(DEFAULT_SITE_ID, TOPIC, ts, value) for ts, value in readings])
+
+# Function to get the stored (count, min, max, sum, last_value) rollup rows of TOPIC by bucket
+def buckets(conn, resolution):
+    rows = conn.execute("SELECT bucket, count, min, max, sum, last_value FROM sensor_rollups "
+                        "WHERE resolution = ? ORDER BY bucket", (resolution,)).fetchall()
+    return {row[0]: row[1:] for row in rows}
+
+def test_update_merges_across_calls(conn):
+    insert(conn, [(T0 + 1000, 400.0), (T0 + 2000, 420.0)])
+    assert update_rollups(conn) == 2
+    insert(conn, [(T0 + 500, 380.0), (T0 + 3000, 410.0), (T0 + MINUTE, 500.0)])
+    assert update_rollups(conn) == 3
+    assert update_rollups(conn) == 0  # Nothing new
+    assert buckets(conn, 60) == {T0: (4, 380.0, 420.0, 1610.0, 410.0), T0 + MINUTE: (1, 500.0, 500.0, 500.0, 500.0)}
+    assert buckets(conn, 3600) == {T0: (5, 380.0, 500.0, 2110.0, 500.0)}
+
+def test_min_and_max_times(conn):
+    insert(conn, [(T0 + 1000, 400.0), (T0 + 2000, 420.0), (T0 + 3000, 380.0), (T0 + 4000, 420.0)])
+    update_rollups(conn)
+    insert(conn, [(T0 + 5000, 380.0), (T0 + 6000, 450.0), (T0 + MINUTE, None)])
+    update_rollups(conn)
+    # Earliest reading of the min and of the max: ties keep the stored time
+    for resolution in (60, 3600):
+        rollups = fetch_rollups(conn, TOPIC, resolution=resolution)
+        assert (rollups["min_time"][0], rollups["max_time"][0]) == (T0 + 3000, T0 + 6000)
+    rollups = fetch_rollups(conn, TOPIC, resolution=60)
+    assert np.isnan(rollups["min_time"][1]) and np.isnan(rollups["max_time"][1])  # No value in the bucket
+
+def test_late_reading_does_not_replace_last_value(conn):
+    insert(conn, [(T0 + 2000, 420.0)])
+    update_rollups(conn)
+    insert(conn, [(T0 + 1000, 400.0)])  # Older reading stored later
+    update_rollups(conn)
+    assert buckets(conn, 60)[T0] == (2, 400.0, 420.0, 820.0, 420.0)
+
+def test_null_values(conn):
+    insert(conn, [(T0 + 1000, None)])
+    update_rollups(conn)
+    assert buckets(conn, 60)[T0] == (0, None, None, 0.0, None)
+    rollups = fetch_rollups(conn, TOPIC, resolution=60)
+    assert math.isnan(rollups["mean"][0])
+
+    # The NULL side of the merge doesn't hide the new min/max, and NULLs don't count in the mean
+    insert(conn, [(T0 + 2000, 5.0), (T0 + 3000, None)])
+    update_rollups(conn)
+    insert(conn, [(T0 + 4000, 12.0), (T0 + 5000, 7.0)])
+    update_rollups(conn)
+    assert buckets(conn, 60)[T0][:4] == (3, 5.0, 12.0, 24.0)
+    assert fetch_rollups(conn, TOPIC, resolution=60)["mean"].tolist() == [8.0]
+
+def test_emptied_table_does_not_reuse_ids(conn):
+    insert(conn, [(T0 + i * 1000, 1.0) for i in range(4)])
+    update_rollups(conn)
+    with conn:
+        conn.execute("DELETE FROM sensor_data")
+    insert(conn, [(T0 + 10 * 1000, 2.0)])
+    assert conn.execute("SELECT max(id) FROM sensor_data").fetchone()[0] > get_rollup_watermark(conn)
+    assert update_rollups(conn) == 1
+    assert buckets(conn, 60)[T0][:4] == (5, 1.0, 2.0, 6.0)
+
+def test_chunked_update_with_limit(conn):
+    insert(conn, [(T0 + i * MINUTE, float(i)) for i in range(10)])
+    assert update_rollups(conn, chunk_size=3, limit=7) == 7
+    assert get_rollup_watermark(conn) == 7
+    assert update_rollups(conn, chunk_size=3, limit=7) == 3
+    assert len(buckets(conn, 60)) == 10
+    assert buckets(conn, 3600)[T0][:4] == (10, 0.0, 9.0, 45.0)
+
+def test_backfill_keeps_rollups_older_than_the_raw_data(db_path, conn):
+    insert(conn, [(T0 - 2 * DAY + i * MINUTE, 1.0) for i in range(3)])  # Old day, raw rows deleted below
+    insert(conn, [(T0 + i * MINUTE, float(i)) for i in range(5)])
+    update_rollups(conn)
+    before = {resolution: buckets(conn, resolution) for resolution in (60, 3600, 86400)}
+    with conn:
+        conn.execute("DELETE FROM sensor_data WHERE ts < ? OR ts = ?", (T0, T0))  # Retention, and the first minute
+    backfill_rollups(db_path)
+
+    # Buckets before the first raw reading, and the hour and day buckets that also hold deleted readings, are kept
+    for resolution, rows in before.items():
+        assert buckets(conn, resolution) == rows
+
+def test_backfill_rebuilds_covered_buckets(db_path, conn):
+    insert(conn, [(T0 + i * MINUTE, float(i)) for i in range(5)])
+    with conn:  # Corrupt rollups, as left by the lost watermark of an old version
+        for bucket in (T0, T0 + 10 * MINUTE):
+            conn.execute("INSERT INTO sensor_rollups (resolution, sensor_key, bucket, count, min, max, sum, last_ts, "
+                         "last_value) VALUES (60, 1, ?, 99, 0, 0, 0, 0, 0)", (bucket,))
+    backfill_rollups(db_path)
+    assert buckets(conn, 60) == {T0 + i * MINUTE: (1, float(i), float(i), float(i), float(i)) for i in range(5)}
+    assert get_rollup_watermark(conn) == 5
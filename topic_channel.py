@@ -0,0 +1,293 @@
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import socket
+import struct
+import tempfile
+import threading
+import time
+
+# Selection messages are the JSON document of the topic file, one per line:
+#   {"visual_topics": ["topic", ...]}
+# The file stays the source of truth (written atomically on every change); the loopback
+# channel pushes the same document to subscribers immediately. Subscribers that can't
+# connect fall back to watching the file with inotify (Linux) or mtime polling.
+
+# Function to write the selected topics atomically, so readers never see a partial file
+def write_selection(path, topics):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.shared_topic', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump({"visual_topics": topics}, f)
+        for attempt in range(10):
+            try:
+                os.replace(tmp_path, path)
+                return
+            except PermissionError:
+                # Windows refuses to replace a file another process has open; retry briefly
+                if attempt == 9:
+                    raise
+                time.sleep(0.01)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+# Function to read the selected topics from the file, None if it's missing or invalid
+def read_selection(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f).get('visual_topics')
+    except FileNotFoundError:
+        return None
+    except json.JSONDecodeError:
+        print(f"Error: JSON decoding issue in the topic file {path}.")
+        return None
+
+class TopicChannelServer:
+    """Hosts the topic selection channel on a loopback TCP port (run by the Blender add-on).
+
+    publish() writes the topic file atomically and pushes the selection to every connected
+    subscriber; new subscribers receive the current selection right after connecting.
+    If the port can't be bound, the selection is still written to the file. publish() runs in
+    Blender's UI thread, so a subscriber that doesn't read within SEND_TIMEOUT is dropped; it
+    reconnects and catches up from the file.
+    """
+
+    SEND_TIMEOUT = 0.05  # Seconds a send may block on a full subscriber socket
+
+    def __init__(self, path, host='127.0.0.1', port=47810):
+        self.path = path
+        self.host = host
+        self.port = port
+        self.topics = read_selection(path)
+        self._clients = []
+        self._lock = threading.Lock()
+        self._sock = None
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    # Function to start accepting subscribers
+    def start(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            if os.name == 'posix':
+                # Rebind while the port of a previous instance (add-on reloaded) is still in TIME_WAIT.
+                # Not on Windows, where SO_REUSEADDR lets another socket take over a port in use.
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((self.host, self.port))
+            sock.listen()
+        except OSError as e:
+            sock.close()
+            print(f"Topic channel not available on {self.host}:{self.port} ({e}), "
+                  f"the selection is only written to the topic file {self.path}.")
+            return self
+        sock.settimeout(0.5)  # Closing doesn't interrupt accept() everywhere; bounds how long close() waits
+        self._sock = sock
+        self._thread = threading.Thread(target=self._accept, name="TopicChannelServer", daemon=True)
+        self._thread.start()
+        return self
+
+    def _accept(self):
+        while not self._stop_event.is_set():
+            try:
+                client, _ = self._sock.accept()
+            except socket.timeout:
+                continue
+            except OSError as e:
+                if not self._stop_event.is_set():
+                    print(f"Topic channel on {self.host}:{self.port} stopped accepting subscribers ({e}), "
+                          f"they follow the topic file {self.path}.")
+                return  # Listening socket closed
+            client.settimeout(self.SEND_TIMEOUT)
+            with self._lock:
+                if self.topics is not None and not self._send(client, self.topics):
+                    continue
+                self._clients.append(client)
+
+    def _send(self, client, topics):
+        try:
+            client.sendall(json.dumps({"visual_topics": topics}).encode('utf-8') + b'\n')
+            return True
+        except (socket.timeout, BlockingIOError, OSError):
+            client.close()  # Stalled or gone; a partial message can't be resumed, so drop the subscriber
+            return False
+
+    # Function to publish a new selection to the file and all subscribers
+    def publish(self, topics):
+        write_selection(self.path, topics)
+        with self._lock:
+            self.topics = topics
+            self._clients = [client for client in self._clients if self._send(client, topics)]
+
+    # Function to stop the channel and disconnect all subscribers
+    def close(self):
+        if self._sock is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._sock.close()
+            self._sock = None
+        with self._lock:
+            for client in self._clients:
+                client.close()
+            self._clients = []
+
+class TopicSubscriber:
+    """Follows the topic selection in a background thread.
+
+    `topics` is always the latest selection and the `changed` event is set whenever it
+    changes (clear it after handling). The optional callback is called from the
+    subscriber thread with the new topics.
+    """
+
+    def __init__(self, path, host='127.0.0.1', port=47810, callback=None, retry_interval=5, poll_interval=1):
+        self.path = path
+        self.host = host
+        self.port = port
+        self.callback = callback
+        self.retry_interval = retry_interval  # Seconds between connection attempts while following the file
+        self.poll_interval = poll_interval    # mtime polling period when inotify isn't available
+        self.topics = None
+        self.changed = threading.Event()
+        self._stop_event = threading.Event()
+        self._watcher = None
+        self._thread = None
+
+    # Function to read the current selection and start following it
+    def start(self):
+        self._load_file()
+        self._thread = threading.Thread(target=self._run, name="TopicSubscriber", daemon=True)
+        self._thread.start()
+        return self
+
+    # Function to stop following the selection
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self._watcher is not None:
+            self._watcher.close()
+            self._watcher = None
+
+    def _set_topics(self, topics):
+        if topics is not None and topics != self.topics:
+            self.topics = topics
+            self.changed.set()
+            if self.callback is not None:
+                self.callback(topics)
+
+    def _load_file(self):
+        self._set_topics(read_selection(self.path))
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                sock = socket.create_connection((self.host, self.port), timeout=1)
+            except OSError:
+                self._follow_file(self.retry_interval)
+                continue
+            self._follow_channel(sock)
+            self._load_file()  # Catch up on changes made while the channel was down
+
+    def _follow_channel(self, sock):
+        sock.settimeout(0.5)  # Bounds how long stop() waits
+        buffer = b''
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    chunk = sock.recv(65536)
+                except socket.timeout:
+                    continue
+                if not chunk:
+                    return  # Server closed
+                buffer += chunk
+                *lines, buffer = buffer.split(b'\n')
+                for line in lines:
+                    try:
+                        self._set_topics(json.loads(line).get('visual_topics'))
+                    except json.JSONDecodeError:
+                        print(f"Error: invalid topic channel message: {line[:200]!r}")
+        except OSError:
+            return
+        finally:
+            sock.close()
+
+    def _follow_file(self, duration):
+        if self._watcher is None:
+            self._watcher = _InotifyWatcher.create(self.path)
+            if self._watcher is not None:
+                self._load_file()  # The file may have changed before the watch existed
+        deadline = time.monotonic() + duration
+        if self._watcher is not None:
+            while not self._stop_event.is_set() and time.monotonic() < deadline:
+                if self._watcher.wait(min(0.5, deadline - time.monotonic())):
+                    self._load_file()
+            return
+        last_mtime = None
+        while not self._stop_event.is_set() and time.monotonic() < deadline:
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+            if mtime != last_mtime:
+                last_mtime = mtime
+                self._load_file()
+            self._stop_event.wait(self.poll_interval)
+
+class _InotifyWatcher:
+    """Waits for the topic file to be (re)written using Linux inotify on its directory."""
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+
+    # Function to create a watcher, None where inotify isn't available
+    @classmethod
+    def create(cls, path):
+        if not hasattr(select, 'poll') or not os.path.exists('/proc/sys/fs/inotify'):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fd = libc.inotify_init1(cls.IN_NONBLOCK | cls.IN_CLOEXEC)
+            if fd < 0:
+                return None
+            directory = os.path.dirname(os.path.abspath(path)).encode()
+            if libc.inotify_add_watch(fd, directory, cls.IN_CLOSE_WRITE | cls.IN_MOVED_TO | cls.IN_CREATE) < 0:
+                os.close(fd)
+                return None
+        except (OSError, AttributeError):
+            return None
+        return cls(fd, os.path.basename(path).encode())
+
+    def __init__(self, fd, name):
+        self.fd = fd
+        self.name = name
+        self._poll = select.poll()
+        self._poll.register(fd, select.POLLIN)
+
+    # Function to wait up to timeout seconds; True if the watched file was written
+    def wait(self, timeout):
+        if not self._poll.poll(max(timeout, 0) * 1000):
+            return False
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return False
+        offset = 0
+        while offset < len(data):
+            _, _, _, length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if name == self.name:
+                return True
+        return False
+
+    def close(self):
+        os.close(self.fd)
@@ -0,0 +1,79 @@
+import re
+from collections import namedtuple
+
+# KNX topics end with <Room.Kind.Name>, e.g. 'KNX/13/0/2<Livingroom.Sensors.Air-temperature-C>'
+_KNX_TOPIC = re.compile(r'^(?P<address>[^<]*)<(?P<room>[^.<>]*)\.(?P<kind>[^.<>]*)\.(?P<name>[^<>]*)>$')
+
+# Parsed topic: protocol is the first topic level ('KNX', 'M-bus'); room and kind are None for topics
+# without the <Room.Kind.Name> part, whose name is the last topic level
+TopicInfo = namedtuple('TopicInfo', 'topic protocol address room kind name')
+
+# Function to parse a topic into its TopicInfo fields
+def parse_topic(topic):
+    match = _KNX_TOPIC.match(topic)
+    if match:
+        address, room, kind, name = match.group('address', 'room', 'kind', 'name')
+    else:
+        address, room, kind, name = topic, None, None, topic.rsplit('/', 1)[-1]
+    return TopicInfo(topic, address.split('/', 1)[0], address, room, kind, name)
+
+# Function to classify a topic as a THRESHOLDS sensor kind ('CO2', 'TEMPERATURE', 'HUMIDITY'), None without thresholds
+def classify_sensor(topic):
+    if 'CO2-ppm' in topic:
+        return 'CO2'
+    elif 'temp' in topic:
+        return 'TEMPERATURE'
+    elif '.rh' in topic.lower():
+        return 'HUMIDITY'
+    return None
+
+class TopicIndex:
+    """Topics parsed once, with lookups by group key, room, measurement and sensor kind.
+
+    groups keeps the dt_config semantics: a topic belongs to every group key that occurs in
+    it (case-insensitive). The Blender enum item lists are built once per group and cached,
+    which also keeps the item strings alive as Blender requires for dynamic enums.
+    """
+
+    def __init__(self, topics, group_keys=()):
+        self.topics = list(dict.fromkeys(topics))
+        self.info = {topic: parse_topic(topic) for topic in self.topics}
+        self.groups = {}
+        self.rooms = {}
+        self.measurements = {}
+        self.protocols = {}
+        self.topic_groups = {topic: [] for topic in self.topics}
+        lowered = [(topic, topic.lower()) for topic in self.topics]
+        for key in group_keys:
+            key_lower = key.lower()
+            members = self.groups[key] = [topic for topic, lower in lowered if key_lower in lower]
+            for topic in members:
+                self.topic_groups[topic].append(key)
+        for topic, info in self.info.items():
+            if info.room is not None:
+                self.rooms.setdefault(info.room, []).append(topic)
+            self.measurements.setdefault(info.name, []).append(topic)
+            self.protocols.setdefault(info.protocol, []).append(topic)
+        self._sensor_kinds = {topic: classify_sensor(topic) for topic in self.topics}
+        self._group_items = [(key, key, "") for key in self.groups]
+        self._enum_items = {}
+
+    # Function to get the THRESHOLDS sensor kind of a topic (topics outside the index are classified and cached)
+    def sensor_kind(self, topic):
+        try:
+            return self._sensor_kinds[topic]
+        except KeyError:
+            kind = self._sensor_kinds[topic] = classify_sensor(topic)
+            return kind
+
+    # Function to get the enum items of the groups
+    def group_items(self):
+        return self._group_items
+
+    # Function to get the enum items of the topics of a group, optionally headed by extra entries such as "all"
+    def enum_items(self, group, extra=()):
+        items = self._enum_items.get((group, extra))
+        if items is None:
+            items = self._enum_items[(group, extra)] = [(topic, topic, "") for topic in
+                                                        list(extra) + self.groups.get(group, [])]
+        return items
@@ -1,16 +1,23 @@
 import matplotlib.pyplot as plt
-from database import fetch_sensor_data
+import matplotlib.dates as mdates
+from database import connect_db, fetch_sensor_data_since
+from downsampling import lttb, fetch_downsampled
 import datetime, time
-import json
 import numpy as np
-from dt_config import CONFIG, THRESHOLDS
+from dt_config import CONFIG
+from sensor_status import STATUS_STYLES, DEFAULT_STATUS, sensor_kind, status_level, status_style
 from matplotlib.lines import Line2D
+from topic_channel import TopicSubscriber, read_selection
 
 # Function to fetch selected topic from JSON file
 def get_selected_topics(json_path):
-    with open(json_path, 'r') as file:
-        data = json.load(file)
-    return data.get('visual_topics')
+    return read_selection(json_path)
+
+# Function to convert epoch ms timestamps into local-time datetime64 values for plotting
+def epoch_ms_to_datetime64(times):
+    utc_offset = datetime.datetime.now().astimezone().utcoffset()
+    offset_ms = int(utc_offset.total_seconds() * 1000)
+    return (np.asarray(times, dtype=np.int64) + offset_ms).astype('datetime64[ms]')
 
 # Function to handle plot closure
 def on_close(event):
@@ -25,56 +32,230 @@ def on_key(event):
         running = False
         visualization_running = False
 
+# Legend entries per sensor kind, built on first use
+legend_patches = {}
+
 # Function to determine status for CO2, temperature and humidity
 def determine_status(topic, value):   
-    
-    # Function to calculate the status and color
-    def status_color(value, thresholds, statuses, colors):
-        patches = []
+    kind = sensor_kind(topic)
+    if kind is None:
+        return DEFAULT_STATUS[0], DEFAULT_STATUS[1], []
+
+    # Legend entries for every status of the sensor kind
+    patches = legend_patches.get(kind)
+    if patches is None:
+        statuses, colors = STATUS_STYLES[kind]
+        patches = legend_patches[kind] = []
         for i in range(len(statuses)):
             patches.append(Line2D([0], [0], marker='o', color='w', markerfacecolor= colors[i], markersize=8, label= statuses[i]))
-        if value < thresholds[0]:
-            status = statuses[0]
-            color = colors[0]           
-        elif thresholds[0] <= value < thresholds[1]:
-            status = statuses[1]
-            color = colors[1]             
-        else:
-            status = statuses[2]
-            color = colors[2]            
-        return status, color, patches
-    
-    if 'CO2-ppm' in topic:
-        thresholds = THRESHOLDS['CO2']
-        statuses = ['Unoccupied','Occupied','Crowded']
-        colors = ['lightgreen','lightyellow','lightcoral']
-        return status_color(value, thresholds, statuses, colors)        
-        
-    elif 'temp' in topic:
-        thresholds = THRESHOLDS['TEMPERATURE']
-        statuses = ['Cold','Normal','Hot']
-        colors = ['lightblue','lightgreen','lightsalmon']
-        return status_color(value, thresholds, statuses, colors)       
+    status, color = status_style(topic, status_level(topic, value))
+    return status, color, patches
+
+class SQLiteSeriesSource:
+    """Real-time plot data read from the realtime SQLite database.
+
+    Keeps one reader connection, and per topic the series read so far and the last row id,
+    so each read() only fetches the rows stored since the previous one. The in-memory
+    alternative is ring_buffer.RingBufferStore, which has the same read()/close() methods.
+    """
+
+    def __init__(self, db_path):
+        self.conn = connect_db(db_path)
+        self.series = {}
+
+    # Function to fetch the new rows of a topic and return its whole series
+    def read(self, topic):
+        times, values, last_id = self.series.get(topic, (np.empty(0, dtype=np.int64), np.empty(0), 0))
+        new_times, new_values, last_id = fetch_sensor_data_since(self.conn, topic, last_id)
+        if len(new_times):
+            times = np.concatenate((times, new_times))
+            values = np.concatenate((values, new_values))
+        self.series[topic] = (times, values, last_id)
+        return times, values
+
+    def close(self):
+        self.conn.close()
+
+# Function to reduce a cached series to the number of points worth drawing
+def plot_points(times, values):
+    if len(times) <= CONFIG['plot_max_points']:
+        return times, values
+    return lttb(times, values, CONFIG['plot_max_points'])
+
+# Function to redraw every subplot from scratch (the 'redraw' backend)
+def redraw_frame(axs, topics, source):
+    for i, topic in enumerate(topics):
+        ax = axs[i]  # Select the corresponding subplot for the sensor
+        # Clear the axis to refresh the plot
+        ax.clear()
+
+        # Get the latest series of the topic (only new rows are fetched)
+        times, values = source.read(topic)
+
+        # Process data for plotting (adjust this if you are visualizing multiple sensors)
+        if len(times):
+            plot_times, plot_values = plot_points(times, values)
+            timestamps = epoch_ms_to_datetime64(plot_times)
+            sensor_id = topic
+
+            # Plot data
+            ax.plot(timestamps, plot_values, marker='o', linestyle='-', color='b')
+
+            # Determine status based on sensor type
+            latest_value = values[-1]
+            status, color = determine_status(topic, latest_value)[:2]
+
+            ax.set_facecolor(color)  # Set background color based on status
+
+            ax.set_title(f"Sensor: {sensor_id}",fontsize=11, fontweight='bold')
+
+            # Add status annotation
+            ax.annotate(f"Status: {status}",
+                        xy=(0.02, 0.93), xycoords='axes fraction',
+                        ha='left', va='top', fontsize=9,
+                        color='black', bbox=dict(facecolor='white', alpha=0.7))
         
-    elif '.rh' in topic.lower():
-        thresholds = THRESHOLDS['HUMIDITY']
-        statuses = ['Dry','Normal','Moist']
-        colors = ['lightblue','lightgreen','lightsalmon']
-        return status_color(value, thresholds, statuses, colors)    
-            
-    else:
-        return 'On', 'white', []
-
-# Function to update the plot with real-time data from the database
-def visualize_real_time_data(db_path, json_path):
+            # Set x-axis label only for the bottom graph
+            if i == len(topics) - 1:
+                ax.set_xlabel('Timestamp',fontsize=10, fontweight='bold')
+            else:
+                ax.set_xlabel('')
+            ax.set_ylabel('Sensor Value',fontsize=10, fontweight='bold')
+            ax.tick_params(axis='x', labelsize=10)  # Font size for x-axis
+            ax.tick_params(axis='y', labelsize=10)  # Font size for y-axis
+
+            # Add legend                
+            ax.legend(handles=determine_status(topic, latest_value)[2], loc='upper right', fontsize=8)
+
+# Function to compute axis limits with headroom so growing data doesn't rescale on every refresh
+def padded_limits(low, high, headroom):
+    span = high - low
+    if span <= 0:
+        span = abs(high) * 0.1 or 1.0
+    return low - span * 0.05, high + span * headroom
+
+class BlitFrame:
+    """Real-time subplots with persistent artists, redrawn with blitting (the 'blit' backend).
+
+    Lines, status annotations, titles and legends are created once. Each refresh only
+    updates the line data and annotation text and blits them over a cached background.
+    The full figure is redrawn only when the data leaves the axis limits or the status
+    color of a subplot changes.
+    """
+
+    def __init__(self, fig, axs, topics):
+        self.fig = fig
+        self.axs = axs
+        self.topics = topics
+        self.lines = []
+        self.annotations = []
+        self.colors = [None] * len(topics)
+        self.background = None
+
+        for i, topic in enumerate(topics):
+            ax = axs[i]
+            line, = ax.plot([], [], marker='o', linestyle='-', color='b', animated=True)
+            annotation = ax.annotate("Status: -",
+                                     xy=(0.02, 0.93), xycoords='axes fraction',
+                                     ha='left', va='top', fontsize=9,
+                                     color='black', bbox=dict(facecolor='white', alpha=0.7),
+                                     animated=True)
+            self.lines.append(line)
+            self.annotations.append(annotation)
+
+            ax.xaxis_date()
+            ax.set_title(f"Sensor: {topic}", fontsize=11, fontweight='bold')
+            # Set x-axis label only for the bottom graph
+            if i == len(topics) - 1:
+                ax.set_xlabel('Timestamp', fontsize=10, fontweight='bold')
+            ax.set_ylabel('Sensor Value', fontsize=10, fontweight='bold')
+            ax.tick_params(axis='x', labelsize=10)  # Font size for x-axis
+            ax.tick_params(axis='y', labelsize=10)  # Font size for y-axis
+            # The legend entries only depend on the sensor type
+            patches = determine_status(topic, 0)[2]
+            if patches:
+                ax.legend(handles=patches, loc='upper right', fontsize=8)
+
+        # Re-capture the background whenever matplotlib does a full draw (first show, resize, rescale)
+        fig.canvas.mpl_connect('draw_event', self.on_draw)
+
+    def on_draw(self, event):
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self.draw_animated()
+
+    def draw_animated(self):
+        for ax, line, annotation in zip(self.axs, self.lines, self.annotations):
+            ax.draw_artist(line)
+            ax.draw_artist(annotation)
+
+    # Function to update the artists with the new rows and draw them
+    def update(self, source):
+        full_redraw = self.background is None
+        for i, topic in enumerate(self.topics):
+            times, values = source.read(topic)
+            if not len(times):
+                continue
+            ax = self.axs[i]
+            plot_times, plot_values = plot_points(times, values)
+            self.lines[i].set_data(mdates.date2num(epoch_ms_to_datetime64(plot_times)), plot_values)
+            x = mdates.date2num(epoch_ms_to_datetime64(times[[0, -1]]))
+
+            status, color = determine_status(topic, values[-1])[:2]
+            self.annotations[i].set_text(f"Status: {status}")
+            if color != self.colors[i]:
+                self.colors[i] = color
+                ax.set_facecolor(color)  # Set background color based on status
+                full_redraw = True
+
+            # Rescale only when the data has left the current limits
+            (x_low, x_high), (y_low, y_high) = ax.get_xlim(), ax.get_ylim()
+            v_low, v_high = np.nanmin(values), np.nanmax(values)
+            if x[0] < x_low or x[-1] > x_high:
+                ax.set_xlim(*padded_limits(x[0], x[-1], 0.2))
+                full_redraw = True
+            if v_low < y_low or v_high > y_high:
+                ax.set_ylim(*padded_limits(v_low, v_high, 0.05))
+                full_redraw = True
+
+        canvas = self.fig.canvas
+        if full_redraw:
+            canvas.draw()  # Triggers on_draw, which captures the background and draws the artists
+        else:
+            canvas.restore_region(self.background)
+            self.draw_animated()
+        canvas.blit(self.fig.bbox)
+        canvas.flush_events()
+
+# Function to process GUI events for up to `interval` seconds; True as soon as `event` is set
+def wait_for_refresh(fig, event, interval, step=0.1):
+    deadline = time.monotonic() + interval
+    while not event.is_set():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not visualization_running:
+            return False
+        # Runs the GUI event loop without redrawing the figure (unlike plt.pause)
+        fig.canvas.start_event_loop(min(step, remaining))
+    return True
+
+# Function to update the plot with real-time data
+# data_source: path of the realtime database, or a ring_buffer.RingBufferStore filled by the ingest path
+# backend: 'blit' (persistent artists, default) or 'redraw' (clear and redraw every subplot)
+def visualize_real_time_data(data_source, json_path, backend=None):
     global visualization_running, running
     visualization_running = True
     running = True
+    backend = backend or CONFIG['plot_backend']
+
+    # Selection changes are pushed by the topic channel (or picked up from the JSON file)
+    subscriber = TopicSubscriber(json_path, CONFIG['topic_channel_host'], CONFIG['topic_channel_port']).start()
 
     # Continuously check for updates to the topic or closed plot
     while running:
-        # Get the current topic from the JSON file
-        topics = get_selected_topics(json_path)
+        # Wait until a selection exists, then take the current one
+        while subscriber.topics is None:
+            subscriber.changed.wait(1)
+        subscriber.changed.clear()
+        topics = subscriber.topics
 
         # Initialize plot
         plt.ion()  # Enable interactive mode
@@ -96,91 +277,60 @@ def visualize_real_time_data(db_path, json_path):
 
         visualization_running = True  # Reset to True for the new loop
 
+        # One reader per figure: an SQLite connection with per-topic cursors, or the shared ring buffers
+        source = SQLiteSeriesSource(data_source) if isinstance(data_source, str) else data_source
+
+        frame = None
+        if backend == 'blit':
+            if fig.canvas.supports_blit:
+                # Add more space between subplots
+                plt.subplots_adjust(hspace=0.4)
+                frame = BlitFrame(fig, axs, topics)
+            else:
+                print("Blitting is not supported by this matplotlib backend, using 'redraw'.")
+
         while visualization_running: 
-            for i, topic in enumerate(topics):
-                ax = axs[i]  # Select the corresponding subplot for the sensor
-                # Clear the axis to refresh the plot
-                ax.clear()
-
-                # Fetch the latest data from the database
-                sensor_data = fetch_sensor_data(db_path, topic)
-
-                # Process data for plotting (adjust this if you are visualizing multiple sensors)
-                if sensor_data:
-                    timestamps = [datetime.datetime.strptime(row[1], '%Y-%m-%dT%H:%M:%S') for row in sensor_data]  # Adjusted format with 'T'
-                    values = [row[2] for row in sensor_data]
-                    sensor_id = [row[0] for row in sensor_data][0]
-
-                    # Plot data
-                    ax.plot(timestamps, values, marker='o', linestyle='-', color='b')
-
-                    # Determine status based on sensor type
-                    latest_value = values[-1] if values else None
-                    status, color = determine_status(topic, latest_value)[:2]
-
-                    ax.set_facecolor(color)  # Set background color based on status
-
-                    ax.set_title(f"Sensor: {sensor_id}",fontsize=11, fontweight='bold')
-
-                    # Add status annotation
-                    ax.annotate(f"Status: {status}",
-                                xy=(0.02, 0.93), xycoords='axes fraction',
-                                ha='left', va='top', fontsize=9,
-                                color='black', bbox=dict(facecolor='white', alpha=0.7))
-                
-                    # Set x-axis label only for the bottom graph
-                    if i == len(topics) - 1:
-                        ax.set_xlabel('Timestamp',fontsize=10, fontweight='bold')
-                    else:
-                        ax.set_xlabel('')
-                    ax.set_ylabel('Sensor Value',fontsize=10, fontweight='bold')
-                    ax.tick_params(axis='x', labelsize=10)  # Font size for x-axis
-                    ax.tick_params(axis='y', labelsize=10)  # Font size for y-axis
-
-                    # Add legend                
-                    ax.legend(handles=determine_status(topic, latest_value)[2], loc='upper right', fontsize=8)
-
-            # Add more space between subplots
-            plt.subplots_adjust(hspace=0.4)             
-            # Pause for a short period to allow for updates
-            plt.draw()
-            plt.pause(1)  # Pause to allow interactive updates
-
-            # Check if the topic has changed; if so, break to reinitialize
-            if topics != get_selected_topics(json_path):
+            if frame is not None:
+                frame.update(source)
+            else:
+                redraw_frame(axs, topics, source)
+                # Add more space between subplots
+                plt.subplots_adjust(hspace=0.4)             
+                plt.draw()
+
+            # Wait for the next refresh while processing GUI events, leaving early on a new selection
+            if wait_for_refresh(fig, subscriber.changed, 1):
                 visualization_running = False  # Stop the current plot to restart
                 break
 
         # Close the plot window when the loop ends
+        if source is not data_source:
+            source.close()
         plt.ioff()  
         plt.close(fig)
 
-        # Small delay to prevent excessive checking
-        time.sleep(1)        
+    subscriber.stop()
 
 # Function to visualize historical data from the database without real-time updates
-def visualize_history_data(db_path, topic):
+# start and end are optional epoch ms bounds of the time window [start, end)
+def visualize_history_data(db_path, topic, start=None, end=None):
     # Initialize plot
     fig, ax = plt.subplots(figsize=(5, 3))
     fig.canvas.manager.set_window_title("Historical Sensor Data")
 
-    # Fetch all historical data from the database
-    sensor_data = fetch_sensor_data(db_path, topic)
+    # Fetch the historical data of the topic in the requested window, reduced to what the plot can show
+    conn = connect_db(db_path)
+    times, values, downsampled = fetch_downsampled(conn, topic, start, end,
+                                                   CONFIG['plot_max_points'], CONFIG['downsampling_method'])
+    conn.close()
 
     # Process data for plotting
-    if sensor_data:
-        timestamps = [datetime.datetime.strptime(row[1], '%Y-%m-%dT%H:%M:%S') for row in sensor_data]  # Adjusted format with 'T'
-        values = [row[2] for row in sensor_data]
-        sensor_ids = [row[0] for row in sensor_data]
-
-        # For simplicity, plot data for the first sensor
-        sensor_id_to_plot = sensor_ids[0]
-        timestamps_filtered = [timestamps[i] for i in range(len(sensor_ids)) if sensor_ids[i] == sensor_id_to_plot]
-        values_filtered = [values[i] for i in range(len(sensor_ids)) if sensor_ids[i] == sensor_id_to_plot]
-
-        # Plot data
-        ax.plot(timestamps_filtered, values_filtered, marker='o', linestyle='-', color='b')
-        ax.set_title(f"Sensor ID: {sensor_id_to_plot}")
+    if len(times):
+        timestamps = epoch_ms_to_datetime64(times)
+
+        # Plot data (markers only when every stored point is shown)
+        ax.plot(timestamps, values, marker=None if downsampled else 'o', linestyle='-', color='b')
+        ax.set_title(f"Sensor ID: {topic}")
         ax.set_xlabel('Timestamp')
         ax.set_ylabel('Sensor Value')
         ax.tick_params(axis='x', rotation=45)